@@ -4,21 +4,50 @@ Protecciones contra: XSS, SQL Injection, CORS, CSRF
 """
 import os
 import json
-import sqlite3
-import hashlib
-import secrets
-import hmac
 import re
-from flask import Flask, request, jsonify
+from flask import Flask, g, request, jsonify
 from flask_cors import CORS
 from datetime import datetime
 from dotenv import load_dotenv
 
-# Cargar variables de entorno desde .env
+# Cargar variables de entorno desde .env (antes de los módulos locales,
+# que leen su configuración al importarse)
 load_dotenv()
 
+from db.connection import pool_stats
+from db.group_commit import group_commit_stats
+from db.migrations import migrate
+from db.profiler import top_queries
+from db.sharding import shard_stats
+from db.models import Transaction
+from db.storage import get_storage, sqlite_only_route
+from routes.budgets import budgets_bp
+from routes.imports import imports_bp
+from routes.metrics import metrics_bp
+from routes.recurring import recurring_bp
+from routes.rules import rules_bp
+from utils.categorizer import all_categories
+from utils.category_model import categorize_for_user, record_correction
+from utils.recategorizer import (
+    job_status as recategorize_status, recent_jobs as recent_recategorize_jobs,
+    resume_job as resume_recategorize_job, start_job as start_recategorize_job
+)
+from utils.security import HashingBusyError
+from utils.http_cache import versioned_json
+from utils.money import from_cents, to_cents
+from utils.export import export_response
+from utils.streaming import stream_transactions
+from utils.sessions import get_sessions, request_token, require_admin, require_session
+from utils.validators import (
+    ValidationError, validate_category, validate_export_params, validate_list_params,
+    validate_search_params, validate_stream_format, validate_timeseries_params
+)
+
 app = Flask(__name__)
 
+# Máximo de items por request en /api/transactions/batch
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', '5000'))
+
 # ============================================================================
 # CONFIGURACIÓN DE SEGURIDAD
 # ============================================================================
@@ -28,10 +57,25 @@ CORS(app, resources={
     r"/api/*": {
         "origins": ["http://localhost:3000", "http://localhost:5001"],
         "methods": ["GET", "POST", "PUT", "DELETE"],
-        "allow_headers": ["Content-Type"]
+        "allow_headers": ["Content-Type", "Authorization", "If-None-Match"],
+        "expose_headers": ["X-Next-Cursor", "ETag"]
     }
 })
 
+# Blueprints
+app.register_blueprint(imports_bp, url_prefix='/api/imports')
+app.register_blueprint(budgets_bp, url_prefix='/api/budgets')
+app.register_blueprint(recurring_bp, url_prefix='/api/recurring')
+app.register_blueprint(rules_bp, url_prefix='/api/rules')
+app.register_blueprint(metrics_bp)
+
+# Con STORAGE_BACKEND=memory las rutas que leen SQLite directo no tienen los datos
+@app.before_request
+def reject_sqlite_only_routes():
+    """501 en las rutas fuera de la interfaz de almacenamiento"""
+    if request.method != 'OPTIONS' and sqlite_only_route(request.path):
+        return jsonify({'error': 'No disponible con el almacenamiento en memoria'}), 501
+
 # Headers de seguridad
 @app.after_request
 def set_security_headers(response):
@@ -42,16 +86,10 @@ def set_security_headers(response):
     response.headers['Strict-Transport-Security'] = 'max-age=31536000; includeSubDomains'
     return response
 
-DATABASE = 'expenses.db'
-
 # ============================================================================
 # VALIDACIONES Y SANITIZACIÓN
 # ============================================================================
 
-class ValidationError(Exception):
-    """Excepción para errores de validación"""
-    pass
-
 def sanitize_string(value, max_length=255, field_name="field"):
     """Sanitiza strings: elimina caracteres peligrosos"""
     if not isinstance(value, str):
@@ -96,19 +134,19 @@ def validate_password(password):
     return password
 
 def validate_amount(amount):
-    """Valida monto: número válido, no cero"""
+    """Valida monto: número válido, no cero. Retorna centavos (int)"""
     try:
-        amount = float(amount)
+        cents = to_cents(amount)
     except (ValueError, TypeError):
         raise ValidationError("Monto debe ser número válido")
     
-    if amount == 0:
+    if cents == 0:
         raise ValidationError("Monto no puede ser cero")
     
-    if abs(amount) > 1000000:
+    if abs(cents) > 100_000_000:
         raise ValidationError("Monto excede límite permitido")
     
-    return round(amount, 2)
+    return cents
 
 def validate_description(description):
     """Valida descripción"""
@@ -124,91 +162,38 @@ def validate_user_id(user_id):
     except (ValueError, TypeError):
         raise ValidationError("user_id debe ser número entero")
 
+def validate_created_at(value):
+    """Valida fecha ISO 8601; retorna formato de created_at (hora local, sin zona)"""
+    if not isinstance(value, str):
+        raise ValidationError("Fecha debe ser texto ISO 8601")
+    try:
+        date = datetime.fromisoformat(value.strip())
+    except ValueError:
+        raise ValidationError("Fecha inválida (formato ISO 8601)")
+    if date.tzinfo is not None:
+        date = date.astimezone().replace(tzinfo=None)
+    return date.isoformat()
+
 # ============================================================================
 # SEGURIDAD - HASHING Y TOKENS
 # ============================================================================
 
-def hash_password(password, salt=None):
-    """Hash seguro con salt usando PBKDF2"""
-    if salt is None:
-        salt = secrets.token_hex(16)
-    
-    password_hash = hashlib.pbkdf2_hmac(
-        'sha256',
-        password.encode('utf-8'),
-        salt.encode('utf-8'),
-        100000  # iterations
-    )
-    
-    return password_hash.hex(), salt
+# El hashing de contraseñas corre en un pool de procesos acotado
+# (utils.security); si está saturado responde 503 al instante
 
-def verify_password(password, stored_hash, salt):
-    """Verifica password (constant-time comparison para evitar timing attacks)"""
-    password_hash, _ = hash_password(password, salt)
-    return hmac.compare_digest(password_hash, stored_hash)
-
-# ============================================================================
-# CATEGORIZACIÓN
-# ============================================================================
-
-def categorize_transaction(description):
-    """Categoriza transacción y detecta ingreso vs gasto"""
-    desc_lower = description.lower()
-    
-    income_keywords = [
-        'sueldo', 'salario', 'pago', 'ingreso', 'venta', 
-        'bonus', 'ganancia', 'reembolso', 'comisión', 'freelance'
-    ]
-    
-    is_income = any(kw in desc_lower for kw in income_keywords)
-    trans_type = 'income' if is_income else 'expense'
-    
-    categories = {
-        'Alimentacion': ['café', 'comida', 'desayuno', 'almuerzo', 'cena', 'restaurant'],
-        'Transporte': ['taxi', 'bus', 'uber', 'gasolina', 'metro', 'tren'],
-        'Entretenimiento': ['cine', 'película', 'juego', 'música', 'bar', 'pub'],
-        'Salud': ['farmacia', 'medicina', 'doctor', 'médico', 'hospital', 'gym'],
-        'Servicios': ['internet', 'teléfono', 'electricidad', 'agua', 'gas'],
-        'Compras': ['ropa', 'zapatos', 'tienda', 'regalo', 'amazon'],
-        'Ingresos': income_keywords,
-    }
-    
-    category = 'Otros'
-    for cat, keywords in categories.items():
-        if any(kw in desc_lower for kw in keywords):
-            category = cat
-            break
-    
-    return category, trans_type
+def busy_response():
+    """503 inmediato cuando el pool de hashing está saturado"""
+    response = jsonify({'error': 'Servidor ocupado, intente nuevamente en unos segundos'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
 
 # ============================================================================
 # BASE DE DATOS
 # ============================================================================
 
 def init_db():
-    """Inicializa base de datos"""
-    conn = sqlite3.connect(DATABASE)
-    c = conn.cursor()
-    
-    c.execute('''CREATE TABLE IF NOT EXISTS users
-                 (id INTEGER PRIMARY KEY,
-                  username TEXT UNIQUE NOT NULL,
-                  password_hash TEXT NOT NULL,
-                  password_salt TEXT NOT NULL,
-                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-    
-    c.execute('''CREATE TABLE IF NOT EXISTS transactions
-                 (id INTEGER PRIMARY KEY,
-                  user_id INTEGER NOT NULL,
-                  description TEXT NOT NULL,
-                  amount REAL NOT NULL,
-                  category TEXT,
-                  type TEXT DEFAULT 'expense',
-                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                  FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE)''')
-    
-    conn.commit()
-    conn.close()
+    """Inicializa base de datos (aplica las migraciones pendientes, ver db/migrations.py)"""
+    migrate()
 
 # ============================================================================
 # RUTAS - AUTENTICACIÓN
@@ -225,22 +210,16 @@ def register():
         username = validate_username(data.get('username', ''))
         password = validate_password(data.get('password', ''))
         
-        password_hash, salt = hash_password(password)
-        
-        conn = sqlite3.connect(DATABASE)
-        c = conn.cursor()
-        c.execute('INSERT INTO users (username, password_hash, password_salt) VALUES (?, ?, ?)',
-                  (username, password_hash, salt))
-        conn.commit()
-        user_id = c.lastrowid
-        conn.close()
+        user_id = get_storage().register(username, password)
+        if user_id is None:
+            return jsonify({'error': 'Usuario ya existe'}), 400
         
         return jsonify({'id': user_id, 'username': username, 'message': 'Usuario creado'}), 201
     
     except ValidationError as e:
         return jsonify({'error': str(e)}), 400
-    except sqlite3.IntegrityError:
-        return jsonify({'error': 'Usuario ya existe'}), 400
+    except HashingBusyError:
+        return busy_response()
     except Exception as e:
         return jsonify({'error': 'Error interno del servidor'}), 500
 
@@ -255,25 +234,31 @@ def login():
         username = validate_username(data.get('username', ''))
         password = data.get('password', '')
         
-        conn = sqlite3.connect(DATABASE)
-        c = conn.cursor()
-        c.execute('SELECT id, password_hash, password_salt FROM users WHERE username = ?', 
-                  (username,))
-        result = c.fetchone()
-        conn.close()
-        
-        if not result:
+        user = get_storage().authenticate(username, password)
+        if not user:
             return jsonify({'error': 'Credenciales incorrectas'}), 401
+        user_id = user['id']
         
-        user_id, stored_hash, salt = result
+        token, expires_at = get_sessions().create(user_id)
         
-        if not verify_password(password, stored_hash, salt):
-            return jsonify({'error': 'Credenciales incorrectas'}), 401
-        
-        return jsonify({'id': user_id, 'username': username}), 200
+        return jsonify({'id': user_id, 'username': username, 'token': token, 'expires_at': expires_at}), 200
     
     except ValidationError as e:
         return jsonify({'error': str(e)}), 400
+    except HashingBusyError:
+        return busy_response()
+    except Exception as e:
+        return jsonify({'error': 'Error interno del servidor'}), 500
+
+@app.route('/api/auth/logout', methods=['POST'])
+def logout():
+    """Revoca la sesión del header Authorization"""
+    try:
+        token = request_token()
+        if token:
+            get_sessions().revoke(token)
+        return jsonify({'message': 'Sesión cerrada'}), 200
+    
     except Exception as e:
         return jsonify({'error': 'Error interno del servidor'}), 500
 
@@ -282,6 +267,7 @@ def login():
 # ============================================================================
 
 @app.route('/api/transactions', methods=['POST'])
+@require_session
 def add_transaction():
     """Crea nueva transacción"""
     try:
@@ -289,27 +275,19 @@ def add_transaction():
         if not data:
             return jsonify({'error': 'Datos inválidos'}), 400
         
-        user_id = validate_user_id(data.get('user_id'))
+        user_id = g.user_id
         description = validate_description(data.get('description', ''))
-        amount = validate_amount(data.get('amount'))
+        amount_cents = validate_amount(data.get('amount'))
         
-        category, trans_type = categorize_transaction(description)
+        category, trans_type = categorize_for_user(user_id, description, amount_cents)
         
-        conn = sqlite3.connect(DATABASE)
-        c = conn.cursor()
         now = datetime.now().isoformat()
-        c.execute(
-            'INSERT INTO transactions (user_id, description, amount, category, type, created_at) VALUES (?, ?, ?, ?, ?, ?)',
-            (user_id, description, amount, category, trans_type, now)
-        )
-        conn.commit()
-        trans_id = c.lastrowid
-        conn.close()
+        trans_id = get_storage().create_transaction(user_id, description, amount_cents, category, trans_type, now)
         
         return jsonify({
             'id': trans_id,
             'description': description,
-            'amount': amount,
+            'amount': from_cents(amount_cents),
             'category': category,
             'type': trans_type,
             'created_at': now
@@ -320,7 +298,67 @@ def add_transaction():
     except Exception as e:
         return jsonify({'error': 'Error interno del servidor'}), 500
 
+@app.route('/api/transactions/batch', methods=['POST'])
+@require_session
+def add_transactions_batch():
+    """
+    Crea muchas transacciones en un único commit
+    Body: {items: [{description, amount, created_at?}], atomic?: bool}
+    atomic=true (default): si algún item es inválido no se inserta nada.
+    atomic=false: se insertan los válidos y se reportan los errores.
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'Datos inválidos'}), 400
+        
+        user_id = g.user_id
+        items = data.get('items')
+        atomic = data.get('atomic', True)
+        
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'items debe ser una lista no vacía'}), 400
+        if len(items) > BATCH_MAX_ITEMS:
+            return jsonify({'error': f'Máximo {BATCH_MAX_ITEMS} items por request'}), 400
+        if not isinstance(atomic, bool):
+            return jsonify({'error': 'atomic debe ser booleano'}), 400
+        
+        # Validar y categorizar todo en una pasada
+        rows, indexes, errors = [], [], []
+        for i, item in enumerate(items):
+            try:
+                if not isinstance(item, dict):
+                    raise ValidationError('Item inválido')
+                description = validate_description(item.get('description', ''))
+                amount_cents = validate_amount(item.get('amount'))
+                created_at = item.get('created_at')
+                if created_at is not None:
+                    created_at = validate_created_at(created_at)
+            except ValidationError as e:
+                errors.append({'index': i, 'error': str(e)})
+                continue
+            category, trans_type = categorize_for_user(user_id, description, amount_cents)
+            rows.append((description, amount_cents, category, trans_type, created_at))
+            indexes.append(i)
+        
+        if errors and (atomic or not rows):
+            return jsonify({'inserted': 0, 'errors': errors}), 400
+        
+        ids = get_storage().create_many(user_id, rows)
+        
+        return jsonify({
+            'inserted': len(ids),
+            'items': [{'index': i, 'id': trans_id} for i, trans_id in zip(indexes, ids)],
+            'errors': errors
+        }), 201
+    
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'Error interno del servidor'}), 500
+
 @app.route('/api/transactions/<int:trans_id>', methods=['PUT'])
+@require_session
 def update_transaction(trans_id):
     """Actualiza transacción"""
     try:
@@ -328,20 +366,13 @@ def update_transaction(trans_id):
         if not data:
             return jsonify({'error': 'Datos inválidos'}), 400
         
-        user_id = validate_user_id(data.get('user_id'))
+        user_id = g.user_id
         description = validate_description(data.get('description', ''))
-        amount = validate_amount(data.get('amount'))
+        amount_cents = validate_amount(data.get('amount'))
         
-        category, trans_type = categorize_transaction(description)
+        category, trans_type = categorize_for_user(user_id, description, amount_cents)
         
-        conn = sqlite3.connect(DATABASE)
-        c = conn.cursor()
-        c.execute(
-            'UPDATE transactions SET description=?, amount=?, category=?, type=? WHERE id=? AND user_id=?',
-            (description, amount, category, trans_type, trans_id, user_id)
-        )
-        conn.commit()
-        conn.close()
+        get_storage().update_transaction(trans_id, user_id, description, amount_cents, category, trans_type)
         
         return jsonify({'message': 'Actualizado'}), 200
     
@@ -350,21 +381,38 @@ def update_transaction(trans_id):
     except Exception as e:
         return jsonify({'error': 'Error interno del servidor'}), 500
 
-@app.route('/api/transactions/<int:trans_id>', methods=['DELETE'])
-def delete_transaction(trans_id):
-    """Elimina transacción"""
+@app.route('/api/transactions/<int:trans_id>/category', methods=['PUT'])
+@require_session
+def correct_category(trans_id):
+    """
+    Corrige la categoría de una transacción: {category}. La corrección
+    entrena el modelo del usuario, que se usa al categorizar las siguientes.
+    """
     try:
         data = request.get_json()
         if not data:
             return jsonify({'error': 'Datos inválidos'}), 400
         
-        user_id = validate_user_id(data.get('user_id'))
+        category = validate_category(data, all_categories())
+        corrected = record_correction(g.user_id, trans_id, category)
+        if corrected is None:
+            return jsonify({'error': 'Transacción no encontrada'}), 404
+        
+        return jsonify(corrected), 200
+    
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'Error interno del servidor'}), 500
+
+@app.route('/api/transactions/<int:trans_id>', methods=['DELETE'])
+@require_session
+def delete_transaction(trans_id):
+    """Elimina transacción"""
+    try:
+        user_id = g.user_id
         
-        conn = sqlite3.connect(DATABASE)
-        c = conn.cursor()
-        c.execute('DELETE FROM transactions WHERE id=? AND user_id=?', (trans_id, user_id))
-        conn.commit()
-        conn.close()
+        get_storage().delete_transaction(trans_id, user_id)
         
         return jsonify({'message': 'Eliminado'}), 200
     
@@ -374,30 +422,74 @@ def delete_transaction(trans_id):
         return jsonify({'error': 'Error interno del servidor'}), 500
 
 @app.route('/api/transactions', methods=['GET'])
+@require_session
 def get_transactions():
-    """Obtiene transacciones del usuario"""
+    """
+    Obtiene transacciones del usuario, paginadas (más recientes primero)
+    Query: limit?, cursor?, from?, to?, category?, type?, min_amount?, max_amount?
+    El cursor de la página siguiente viene en el header X-Next-Cursor.
+    """
     try:
-        user_id = validate_user_id(request.args.get('user_id'))
+        user_id = g.user_id
+        limit, cursor, filters = validate_list_params(request.args)
         
-        conn = sqlite3.connect(DATABASE)
-        c = conn.cursor()
-        c.execute(
-            'SELECT id, description, amount, category, type, created_at FROM transactions WHERE user_id=? ORDER BY created_at DESC',
-            (user_id,)
-        )
-        transactions = []
-        for row in c.fetchall():
-            transactions.append({
-                'id': row[0],
-                'description': row[1],
-                'amount': row[2],
-                'category': row[3],
-                'type': row[4],
-                'created_at': row[5]
-            })
-        conn.close()
-        
-        return jsonify(transactions), 200
+        # ?stream=json|ndjson: todo el historial en streaming, sin límite
+        stream = validate_stream_format(request.args)
+        if stream is not None:
+            return stream_transactions(user_id, stream, cursor, filters)
+        
+        def build():
+            try:
+                transactions, next_cursor = get_storage().list_page(user_id, limit, cursor, filters)
+            except ValueError as e:
+                raise ValidationError(str(e))
+            return transactions, {'X-Next-Cursor': next_cursor} if next_cursor else {}
+        
+        # ETag por versión de datos: 304 o respuesta cacheada sin consultar
+        params = (limit, cursor, tuple(sorted(filters.items())))
+        return versioned_json(user_id, 'transactions', params, build)
+    
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'Error interno del servidor'}), 500
+
+@app.route('/api/transactions/search', methods=['GET'])
+@require_session
+def search_transactions():
+    """
+    Búsqueda en las descripciones (prefijos, sin distinguir acentos ni
+    mayúsculas), de más a menos relevante. Query: q, limit?, cursor?
+    El cursor de la página siguiente viene en el header X-Next-Cursor.
+    """
+    try:
+        user_id = g.user_id
+        q, limit, cursor = validate_search_params(request.args)
+        
+        def build():
+            try:
+                transactions, next_cursor = Transaction.search(user_id, q, limit, cursor)
+            except ValueError as e:
+                raise ValidationError(str(e))
+            return transactions, {'X-Next-Cursor': next_cursor} if next_cursor else {}
+        
+        return versioned_json(user_id, 'transactions/search', (q, limit, cursor), build)
+    
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'Error interno del servidor'}), 500
+
+@app.route('/api/transactions/export', methods=['GET'])
+@require_session
+def export_transactions():
+    """
+    Descarga todas las transacciones del usuario (gzip si el cliente lo acepta)
+    Query: format=csv|ndjson, from?, to? (y los filtros del listado)
+    """
+    try:
+        fmt, filters = validate_export_params(request.args)
+        return export_response(g.user_id, fmt, filters, request.accept_encodings['gzip'] > 0)
     
     except ValidationError as e:
         return jsonify({'error': str(e)}), 400
@@ -405,42 +497,97 @@ def get_transactions():
         return jsonify({'error': 'Error interno del servidor'}), 500
 
 @app.route('/api/stats', methods=['GET'])
+@require_session
 def get_stats():
     """Obtiene estadísticas del usuario"""
     try:
-        user_id = validate_user_id(request.args.get('user_id'))
+        user_id = g.user_id
         
-        conn = sqlite3.connect(DATABASE)
-        c = conn.cursor()
-        
-        c.execute('SELECT SUM(amount) FROM transactions WHERE user_id=? AND type="expense"', (user_id,))
-        total_expenses = c.fetchone()[0] or 0
-        
-        c.execute('SELECT SUM(amount) FROM transactions WHERE user_id=? AND type="income"', (user_id,))
-        total_income = c.fetchone()[0] or 0
-        
-        balance = total_income - total_expenses
+        return versioned_json(user_id, 'stats', (), lambda: (get_storage().get_stats(user_id), {}))
+    
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'Error interno del servidor'}), 500
+
+@app.route('/api/stats/timeseries', methods=['GET'])
+@require_session
+def get_stats_timeseries():
+    """
+    Ingresos, gastos y gastos por categoría agrupados por período
+    Query: granularity? (day|week|month), from?, to?, compare?
+    """
+    try:
+        user_id = g.user_id
+        granularity, date_from, date_to, compare = validate_timeseries_params(request.args)
         
-        c.execute(
-            'SELECT category, COUNT(*), SUM(amount) FROM transactions WHERE user_id=? AND type="expense" GROUP BY category',
-            (user_id,)
+        return versioned_json(
+            user_id, 'stats/timeseries', (granularity, date_from, date_to, compare),
+            lambda: (Transaction.get_timeseries(user_id, granularity, date_from, date_to, compare), {})
         )
-        by_category = [{'category': row[0], 'count': row[1], 'total': row[2]} for row in c.fetchall()]
-        
-        conn.close()
-        
-        return jsonify({
-            'total_expenses': total_expenses,
-            'total_income': total_income,
-            'balance': balance,
-            'by_category': by_category
-        }), 200
     
     except ValidationError as e:
         return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': 'Error interno del servidor'}), 500
 
+# ============================================================================
+# RUTAS - ADMINISTRACIÓN
+# ============================================================================
+
+@app.route('/api/admin/db-pool', methods=['GET'])
+@require_admin
+def get_db_pool_stats():
+    """Métricas del pool de conexiones (y del group commit y las particiones) del worker actual"""
+    return jsonify(dict(pool_stats(), group_commit=group_commit_stats(), shards=shard_stats())), 200
+
+@app.route('/api/admin/queries', methods=['GET'])
+@require_admin
+def get_top_queries():
+    """Consultas SQL con más tiempo total en el worker actual (?limit=20)"""
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), 200)
+    except ValueError:
+        return jsonify({'error': 'limit debe ser un entero'}), 400
+    return jsonify(top_queries(limit)), 200
+
+@app.route('/api/admin/recategorize', methods=['POST'])
+@require_admin
+def start_recategorize():
+    """
+    Recategoriza las transacciones existentes con las reglas actuales en un
+    hilo de fondo. Body opcional: {user_id} para un solo usuario. 202 con el id.
+    """
+    data = request.get_json(silent=True) or {}
+    user_id = data.get('user_id')
+    if user_id is not None and (not isinstance(user_id, int) or isinstance(user_id, bool) or user_id < 1):
+        return jsonify({'error': 'user_id debe ser un entero positivo'}), 400
+    job_id = start_recategorize_job(user_id)
+    return jsonify({'id': job_id, 'status': 'pending'}), 202
+
+@app.route('/api/admin/recategorize', methods=['GET'])
+@require_admin
+def list_recategorize():
+    """Jobs de recategorización recientes con su avance"""
+    return jsonify(recent_recategorize_jobs()), 200
+
+@app.route('/api/admin/recategorize/<int:job_id>', methods=['GET'])
+@require_admin
+def get_recategorize(job_id):
+    """Avance de un job: filas revisadas/cambiadas, %, filas/s y ETA"""
+    job = recategorize_status(job_id)
+    if not job:
+        return jsonify({'error': 'Job no encontrado'}), 404
+    return jsonify(job), 200
+
+@app.route('/api/admin/recategorize/<int:job_id>/resume', methods=['POST'])
+@require_admin
+def resume_recategorize(job_id):
+    """Retoma un job interrumpido desde su último punto de control"""
+    if not resume_recategorize_job(job_id):
+        return jsonify({'error': 'El job no existe, terminó o sigue corriendo'}), 409
+    return jsonify({'id': job_id, 'status': 'running'}), 202
+
 # ============================================================================
 # INICIO
 # ============================================================================
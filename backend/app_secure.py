@@ -3,33 +3,65 @@ Expense Tracker - Backend Seguro
 Aplicación Flask con protecciones contra ataques comunes
 """
 import os
-from flask import Flask, request, jsonify
+from flask import Flask, g, request, jsonify
 from flask_cors import CORS
 from datetime import datetime
 
 # Imports locales
-from db.models import init_db, User, Transaction
+from db.models import init_db, Transaction
+from db.storage import get_storage, sqlite_only_route
 from utils.validators import (
     ValidationError, validate_username, validate_password,
-    validate_description, validate_amount, validate_user_id, validate_transaction_id
+    validate_description, validate_amount, validate_transaction_id, validate_category,
+    validate_created_at, validate_list_params, validate_export_params,
+    validate_search_params, validate_stream_format, validate_timeseries_params
 )
-from utils.categorizer import categorize_transaction
-from utils.security import generate_token
+from utils.categorizer import all_categories
+from utils.category_model import categorize_for_user, record_correction
+from utils.security import HashingBusyError
+from utils.http_cache import versioned_json
+from utils.money import from_cents
+from utils.export import export_response
+from utils.streaming import stream_transactions
+from utils.sessions import get_sessions, request_token, require_session
+from routes.budgets import budgets_bp
+from routes.imports import imports_bp
+from routes.metrics import metrics_bp
+from routes.recurring import recurring_bp
+from routes.rules import rules_bp
 
 # Inicializar Flask
 app = Flask(__name__)
 
+# Máximo de items por request en /api/transactions/batch
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', '5000'))
+
 # Configuración de CORS - SEGURO
 # Solo permitir requests desde localhost en desarrollo
 CORS(app, 
      resources={r"/api/*": {
          "origins": ["http://localhost:3000", "http://localhost:*"],
          "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-         "allow_headers": ["Content-Type", "Authorization"],
+         "allow_headers": ["Content-Type", "Authorization", "If-None-Match"],
+         "expose_headers": ["X-Next-Cursor", "ETag"],
          "max_age": 3600,
          "supports_credentials": False
      }})
 
+# Blueprints
+app.register_blueprint(imports_bp, url_prefix='/api/imports')
+app.register_blueprint(budgets_bp, url_prefix='/api/budgets')
+app.register_blueprint(recurring_bp, url_prefix='/api/recurring')
+app.register_blueprint(rules_bp, url_prefix='/api/rules')
+app.register_blueprint(metrics_bp)
+
+# Con STORAGE_BACKEND=memory las rutas que leen SQLite directo no tienen los datos
+@app.before_request
+def reject_sqlite_only_routes():
+    """501 en las rutas fuera de la interfaz de almacenamiento"""
+    if request.method != 'OPTIONS' and sqlite_only_route(request.path):
+        return jsonify({'error': 'No disponible con el almacenamiento en memoria'}), 501
+
 # Headers de seguridad
 @app.after_request
 def set_security_headers(response):
@@ -66,7 +98,7 @@ def register():
         password = validate_password(data.get('password', ''))
         
         # Crear usuario
-        user_id = User.create(username, password)
+        user_id = get_storage().register(username, password)
         
         if not user_id:
             return jsonify({'error': 'Usuario ya existe'}), 409
@@ -79,6 +111,8 @@ def register():
     
     except ValidationError as e:
         return jsonify({'error': str(e)}), 400
+    except HashingBusyError:
+        return jsonify({'error': 'Servidor ocupado, intente nuevamente'}), 503, {'Retry-After': '1'}
     except Exception as e:
         app.logger.error(f"Error en registro: {str(e)}")
         return jsonify({'error': 'Error interno del servidor'}), 500
@@ -105,32 +139,55 @@ def login():
             return jsonify({'error': 'Username y password requeridos'}), 400
         
         # Autenticar
-        user = User.authenticate(username, password)
+        user = get_storage().authenticate(username, password)
         
         if not user:
             return jsonify({'error': 'Credenciales inválidas'}), 401
         
-        # Generar token
-        token = generate_token()
+        # Crear sesión (el token se envía luego en Authorization: Bearer)
+        token, expires_at = get_sessions().create(user['id'])
         
         return jsonify({
             'id': user['id'],
             'username': user['username'],
-            'token': token
+            'token': token,
+            'expires_at': expires_at
         }), 200
     
+    except HashingBusyError:
+        return jsonify({'error': 'Servidor ocupado, intente nuevamente'}), 503, {'Retry-After': '1'}
     except Exception as e:
         app.logger.error(f"Error en login: {str(e)}")
         return jsonify({'error': 'Error interno del servidor'}), 500
 
+@app.route('/api/auth/logout', methods=['POST', 'OPTIONS'])
+def logout():
+    """
+    Cierra la sesión actual
+    POST /api/auth/logout (header Authorization: Bearer <token>)
+    """
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    try:
+        token = request_token()
+        if token:
+            get_sessions().revoke(token)
+        return jsonify({'message': 'Sesión cerrada'}), 200
+    
+    except Exception as e:
+        app.logger.error(f"Error en logout: {str(e)}")
+        return jsonify({'error': 'Error interno del servidor'}), 500
+
 # ============ RUTAS DE TRANSACCIONES ============
 
 @app.route('/api/transactions', methods=['POST', 'OPTIONS'])
+@require_session
 def add_transaction():
     """
     Crea nueva transacción
     POST /api/transactions
-    Body: {user_id, description, amount}
+    Body: {description, amount}
     """
     if request.method == 'OPTIONS':
         return '', 204
@@ -141,15 +198,15 @@ def add_transaction():
             return jsonify({'error': 'Body debe ser JSON'}), 400
         
         # Validar entrada
-        user_id = validate_user_id(data.get('user_id'))
+        user_id = g.user_id
         description = validate_description(data.get('description', ''))
-        amount = validate_amount(data.get('amount', 0))
+        amount_cents = validate_amount(data.get('amount', 0))
         
         # Categorizar
-        category, trans_type = categorize_transaction(description)
+        category, trans_type = categorize_for_user(user_id, description, amount_cents)
         
         # Crear transacción
-        trans_id = Transaction.create(user_id, description, amount, category, trans_type)
+        trans_id = get_storage().create_transaction(user_id, description, amount_cents, category, trans_type)
         
         if not trans_id:
             return jsonify({'error': 'Error al crear transacción'}), 500
@@ -157,7 +214,7 @@ def add_transaction():
         return jsonify({
             'id': trans_id,
             'description': description,
-            'amount': amount,
+            'amount': from_cents(amount_cents),
             'category': category,
             'type': trans_type,
             'created_at': datetime.now().isoformat()
@@ -169,12 +226,79 @@ def add_transaction():
         app.logger.error(f"Error al crear transacción: {str(e)}")
         return jsonify({'error': 'Error interno del servidor'}), 500
 
+@app.route('/api/transactions/batch', methods=['POST', 'OPTIONS'])
+@require_session
+def add_transactions_batch():
+    """
+    Crea muchas transacciones en un único commit
+    POST /api/transactions/batch
+    Body: {items: [{description, amount, created_at?}], atomic?: bool}
+    atomic=true (default): si algún item es inválido no se inserta nada.
+    atomic=false: se insertan los válidos y se reportan los errores.
+    """
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'Body debe ser JSON'}), 400
+        
+        # Validar entrada
+        user_id = g.user_id
+        items = data.get('items')
+        atomic = data.get('atomic', True)
+        
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'items debe ser una lista no vacía'}), 400
+        if len(items) > BATCH_MAX_ITEMS:
+            return jsonify({'error': f'Máximo {BATCH_MAX_ITEMS} items por request'}), 400
+        if not isinstance(atomic, bool):
+            return jsonify({'error': 'atomic debe ser booleano'}), 400
+        
+        # Validar y categorizar todo en una pasada
+        rows, indexes, errors = [], [], []
+        for i, item in enumerate(items):
+            try:
+                if not isinstance(item, dict):
+                    raise ValidationError('Item inválido')
+                description = validate_description(item.get('description', ''))
+                amount_cents = validate_amount(item.get('amount', 0))
+                created_at = item.get('created_at')
+                if created_at is not None:
+                    created_at = validate_created_at(created_at)
+            except ValidationError as e:
+                errors.append({'index': i, 'error': str(e)})
+                continue
+            category, trans_type = categorize_for_user(user_id, description, amount_cents)
+            rows.append((description, amount_cents, category, trans_type, created_at))
+            indexes.append(i)
+        
+        if errors and (atomic or not rows):
+            return jsonify({'inserted': 0, 'errors': errors}), 400
+        
+        # Insertar en una sola transacción
+        ids = get_storage().create_many(user_id, rows)
+        
+        return jsonify({
+            'inserted': len(ids),
+            'items': [{'index': i, 'id': trans_id} for i, trans_id in zip(indexes, ids)],
+            'errors': errors
+        }), 201
+    
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        app.logger.error(f"Error al crear transacciones en lote: {str(e)}")
+        return jsonify({'error': 'Error interno del servidor'}), 500
+
 @app.route('/api/transactions/<int:trans_id>', methods=['PUT', 'OPTIONS'])
+@require_session
 def update_transaction(trans_id):
     """
     Actualiza transacción
     PUT /api/transactions/<id>
-    Body: {user_id, description, amount}
+    Body: {description, amount}
     """
     if request.method == 'OPTIONS':
         return '', 204
@@ -186,15 +310,15 @@ def update_transaction(trans_id):
         
         # Validar entrada
         trans_id = validate_transaction_id(trans_id)
-        user_id = validate_user_id(data.get('user_id'))
+        user_id = g.user_id
         description = validate_description(data.get('description', ''))
-        amount = validate_amount(data.get('amount', 0))
+        amount_cents = validate_amount(data.get('amount', 0))
         
         # Categorizar
-        category, trans_type = categorize_transaction(description)
+        category, trans_type = categorize_for_user(user_id, description, amount_cents)
         
         # Actualizar
-        success = Transaction.update(trans_id, user_id, description, amount, category, trans_type)
+        success = get_storage().update_transaction(trans_id, user_id, description, amount_cents, category, trans_type)
         
         if not success:
             return jsonify({'error': 'Transacción no encontrada o acceso denegado'}), 404
@@ -207,27 +331,58 @@ def update_transaction(trans_id):
         app.logger.error(f"Error al actualizar transacción: {str(e)}")
         return jsonify({'error': 'Error interno del servidor'}), 500
 
+@app.route('/api/transactions/<int:trans_id>/category', methods=['PUT', 'OPTIONS'])
+@require_session
+def correct_category(trans_id):
+    """
+    Corrige la categoría de una transacción
+    PUT /api/transactions/<id>/category
+    Body: {category}
+    La corrección entrena el modelo del usuario (utils/category_model.py).
+    """
+    if request.method == 'OPTIONS':
+        return '', 204
+
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'Body debe ser JSON'}), 400
+
+        # Validar entrada
+        trans_id = validate_transaction_id(trans_id)
+        category = validate_category(data, all_categories())
+
+        # Corregir y entrenar
+        corrected = record_correction(g.user_id, trans_id, category)
+
+        if corrected is None:
+            return jsonify({'error': 'Transacción no encontrada o acceso denegado'}), 404
+
+        return jsonify(corrected), 200
+
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        app.logger.error(f"Error al corregir categoría: {str(e)}")
+        return jsonify({'error': 'Error interno del servidor'}), 500
+
 @app.route('/api/transactions/<int:trans_id>', methods=['DELETE', 'OPTIONS'])
+@require_session
 def delete_transaction(trans_id):
     """
     Elimina transacción
     DELETE /api/transactions/<id>
-    Body: {user_id}
     """
     if request.method == 'OPTIONS':
         return '', 204
     
     try:
-        data = request.get_json()
-        if not data:
-            return jsonify({'error': 'Body debe ser JSON'}), 400
-        
         # Validar entrada
         trans_id = validate_transaction_id(trans_id)
-        user_id = validate_user_id(data.get('user_id'))
+        user_id = g.user_id
         
         # Eliminar
-        success = Transaction.delete(trans_id, user_id)
+        success = get_storage().delete_transaction(trans_id, user_id)
         
         if not success:
             return jsonify({'error': 'Transacción no encontrada o acceso denegado'}), 404
@@ -241,21 +396,35 @@ def delete_transaction(trans_id):
         return jsonify({'error': 'Error interno del servidor'}), 500
 
 @app.route('/api/transactions', methods=['GET', 'OPTIONS'])
+@require_session
 def get_transactions():
     """
-    Obtiene transacciones del usuario
-    GET /api/transactions?user_id=<id>
+    Obtiene transacciones del usuario, paginadas (más recientes primero)
+    GET /api/transactions?limit=&cursor=&from=&to=&category=&type=&min_amount=&max_amount=
+    El cursor de la página siguiente viene en el header X-Next-Cursor.
     """
     if request.method == 'OPTIONS':
         return '', 204
     
     try:
-        user_id_str = request.args.get('user_id', '')
-        user_id = validate_user_id(user_id_str)
+        user_id = g.user_id
+        limit, cursor, filters = validate_list_params(request.args)
+        
+        # ?stream=json|ndjson: todo el historial en streaming, sin límite
+        stream = validate_stream_format(request.args)
+        if stream is not None:
+            return stream_transactions(user_id, stream, cursor, filters)
         
-        transactions = Transaction.get_all(user_id)
+        def build():
+            try:
+                transactions, next_cursor = get_storage().list_page(user_id, limit, cursor, filters)
+            except ValueError as e:
+                raise ValidationError(str(e))
+            return transactions, {'X-Next-Cursor': next_cursor} if next_cursor else {}
         
-        return jsonify(transactions), 200
+        # ETag por versión de datos: 304 o respuesta cacheada sin consultar
+        params = (limit, cursor, tuple(sorted(filters.items())))
+        return versioned_json(user_id, 'transactions', params, build)
     
     except ValidationError as e:
         return jsonify({'error': str(e)}), 400
@@ -263,24 +432,72 @@ def get_transactions():
         app.logger.error(f"Error al obtener transacciones: {str(e)}")
         return jsonify({'error': 'Error interno del servidor'}), 500
 
+@app.route('/api/transactions/search', methods=['GET', 'OPTIONS'])
+@require_session
+def search_transactions():
+    """
+    Búsqueda en las descripciones (prefijos, sin distinguir acentos ni
+    mayúsculas), de más a menos relevante. GET /api/transactions/search?q=&limit=&cursor=
+    El cursor de la página siguiente viene en el header X-Next-Cursor.
+    """
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    try:
+        user_id = g.user_id
+        q, limit, cursor = validate_search_params(request.args)
+        
+        def build():
+            try:
+                transactions, next_cursor = Transaction.search(user_id, q, limit, cursor)
+            except ValueError as e:
+                raise ValidationError(str(e))
+            return transactions, {'X-Next-Cursor': next_cursor} if next_cursor else {}
+        
+        return versioned_json(user_id, 'transactions/search', (q, limit, cursor), build)
+    
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        app.logger.error(f"Error en la búsqueda: {str(e)}")
+        return jsonify({'error': 'Error interno del servidor'}), 500
+
+@app.route('/api/transactions/export', methods=['GET', 'OPTIONS'])
+@require_session
+def export_transactions():
+    """
+    Descarga todas las transacciones del usuario (gzip si el cliente lo acepta)
+    Query: format=csv|ndjson, from?, to? (y los filtros del listado)
+    """
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    try:
+        fmt, filters = validate_export_params(request.args)
+        return export_response(g.user_id, fmt, filters, request.accept_encodings['gzip'] > 0)
+    
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        app.logger.error(f"Error al exportar transacciones: {str(e)}")
+        return jsonify({'error': 'Error interno del servidor'}), 500
+
 # ============ RUTAS DE ESTADÍSTICAS ============
 
 @app.route('/api/stats', methods=['GET', 'OPTIONS'])
+@require_session
 def get_stats():
     """
     Obtiene estadísticas del usuario
-    GET /api/stats?user_id=<id>
+    GET /api/stats
     """
     if request.method == 'OPTIONS':
         return '', 204
     
     try:
-        user_id_str = request.args.get('user_id', '')
-        user_id = validate_user_id(user_id_str)
-        
-        stats = Transaction.get_stats(user_id)
+        user_id = g.user_id
         
-        return jsonify(stats), 200
+        return versioned_json(user_id, 'stats', (), lambda: (get_storage().get_stats(user_id), {}))
     
     except ValidationError as e:
         return jsonify({'error': str(e)}), 400
@@ -288,6 +505,31 @@ def get_stats():
         app.logger.error(f"Error al obtener estadísticas: {str(e)}")
         return jsonify({'error': 'Error interno del servidor'}), 500
 
+@app.route('/api/stats/timeseries', methods=['GET', 'OPTIONS'])
+@require_session
+def get_stats_timeseries():
+    """
+    Serie temporal de ingresos y gastos
+    GET /api/stats/timeseries?granularity=day|week|month&from=&to=&compare=1
+    """
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    try:
+        user_id = g.user_id
+        granularity, date_from, date_to, compare = validate_timeseries_params(request.args)
+        
+        return versioned_json(
+            user_id, 'stats/timeseries', (granularity, date_from, date_to, compare),
+            lambda: (Transaction.get_timeseries(user_id, granularity, date_from, date_to, compare), {})
+        )
+    
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        app.logger.error(f"Error al obtener serie temporal: {str(e)}")
+        return jsonify({'error': 'Error interno del servidor'}), 500
+
 # ============ ERROR HANDLING ============
 
 @app.errorhandler(404)
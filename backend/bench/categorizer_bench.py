@@ -0,0 +1,79 @@
+"""
+Microbenchmark del categorizador
+
+Compara el costo por llamada del autómata Aho-Corasick contra el escaneo
+ingenuo (any(kw in desc) por categoría) con 10, 1.000 y 50.000 palabras
+clave sintéticas.
+
+    cd backend && python -m bench.categorizer_bench
+"""
+import random
+import string
+import time
+
+from utils.categorizer import RuleSet, normalize_text
+
+SIZES = [10, 1_000, 50_000]
+CATEGORIES = 8
+DESCRIPTIONS = [
+    'Café con medialunas en el centro',
+    'Uber al aeropuerto',
+    'Pago de sueldo mensual - empresa',
+    'Farmacia del barrio, ibuprofeno',
+    'Compra varia sin categoría conocida 1234',
+    'Transferencia recibida por servicios freelance de diseño web',
+]
+
+
+def synthetic_categories(n_keywords, seed=42):
+    rnd = random.Random(seed)
+    categories = [{'name': f'Cat{i}', 'keywords': []} for i in range(CATEGORIES)]
+    categories[-1]['type'] = 'income'
+    for i in range(n_keywords):
+        length = rnd.randint(4, 10)
+        word = ''.join(rnd.choice(string.ascii_lowercase) for _ in range(length))
+        categories[i % CATEGORIES]['keywords'].append(word)
+    return categories
+
+
+def naive_categorize(categories, description):
+    """Implementación anterior: escaneo por categoría y palabra"""
+    desc = normalize_text(description)
+    income = any(kw in desc for cat in categories if cat.get('type') == 'income'
+                 for kw in cat['keywords'])
+    for cat in categories:
+        if any(kw in desc for kw in cat['keywords']):
+            return cat['name'], 'income' if income else 'expense'
+    return 'Otros', 'income' if income else 'expense'
+
+
+def per_call_us(fn, min_time=0.3):
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        for desc in DESCRIPTIONS:
+            fn(desc)
+        calls += len(DESCRIPTIONS)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return elapsed / calls * 1e6
+
+
+def main():
+    print(f"{'keywords':>10} {'compilar (ms)':>14} {'automata (us)':>14} {'ingenuo (us)':>14}")
+    for n in SIZES:
+        categories = synthetic_categories(n)
+        start = time.perf_counter()
+        rules = RuleSet(categories)
+        compile_ms = (time.perf_counter() - start) * 1000
+
+        for desc in DESCRIPTIONS:
+            assert rules.match(desc) == naive_categorize(categories, desc)
+
+        automaton = per_call_us(rules.match)
+        naive = per_call_us(lambda d: naive_categorize(categories, d))
+        print(f"{n:>10} {compile_ms:>14.1f} {automaton:>14.2f} {naive:>14.2f}")
+
+
+if __name__ == '__main__':
+    main()
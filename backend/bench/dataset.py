@@ -0,0 +1,176 @@
+"""
+Generador de datos sintéticos para benchmarks
+
+Llena la base con N usuarios y M transacciones con distribuciones
+parecidas a las reales:
+
+- usuarios con actividad tipo Zipf (el usuario 1 es el más pesado);
+- categorías con pesos distintos y descripciones que el categorizador
+  reconoce (más un porcentaje sin categoría conocida);
+- montos log-normales por categoría, en centavos;
+- fechas en los últimos `days` días, más frecuentes de día que de noche;
+- un RECURRING_SHARE de las filas son cargos periódicos (sueldo,
+  alquiler, suscripciones) para el detector de db/recurring.py.
+
+    cd backend && python -m bench.dataset --users 100 --rows 100000 [--db expenses.db]
+
+Todos los usuarios ('bench1', 'bench2', ...) tienen la contraseña
+BENCH_PASSWORD.
+"""
+import argparse
+import math
+import random
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from db.connection import configure, transaction
+
+BENCH_PASSWORD = 'bench-password'
+INSERT_CHUNK = 20_000
+
+# Categoría -> (peso, mediana del monto, dispersión log-normal, tipo, descripciones)
+PROFILES = {
+    'Alimentacion': (35, 12.0, 0.8, 'expense', [
+        'Café en {place}', 'Almuerzo con {who}', 'Cena en {place}', 'Desayuno {place}',
+        'Comida para llevar', 'Restaurant {place}',
+    ]),
+    'Transporte': (20, 8.0, 0.7, 'expense', [
+        'Uber a {place}', 'Taxi al centro', 'Bus {n}', 'Gasolina estación {n}', 'Metro recarga',
+    ]),
+    'Servicios': (10, 60.0, 0.5, 'expense', [
+        'Internet hogar', 'Electricidad {month}', 'Agua {month}', 'Teléfono móvil', 'Gas {month}',
+    ]),
+    'Compras': (12, 45.0, 1.0, 'expense', [
+        'Ropa {place}', 'Zapatos nuevos', 'Amazon pedido {n}', 'Regalo para {who}', 'Tienda {place}',
+    ]),
+    'Entretenimiento': (8, 20.0, 0.7, 'expense', [
+        'Cine con {who}', 'Bar {place}', 'Música suscripción', 'Juego online', 'Pub del barrio',
+    ]),
+    'Salud': (5, 25.0, 0.9, 'expense', [
+        'Farmacia {place}', 'Doctor consulta', 'Gym cuota {month}', 'Medicina recetada',
+    ]),
+    'Otros': (5, 15.0, 1.2, 'expense', [
+        'Compra varia {n}', 'Transferencia {who}', 'Varios', 'Cuota club',
+    ]),
+    'Ingresos': (5, 1500.0, 0.6, 'income', [
+        'Sueldo {month}', 'Pago freelance {n}', 'Venta {place}', 'Reembolso {n}', 'Bonus anual',
+    ]),
+}
+
+PLACES = ['el centro', 'Pocitos', 'la rambla', 'el shopping', 'Cordón', 'el aeropuerto', 'la oficina']
+WHO = ['amigos', 'familia', 'Ana', 'el equipo', 'clientes']
+MONTHS = ['enero', 'febrero', 'marzo', 'abril', 'mayo', 'junio', 'julio', 'agosto',
+          'septiembre', 'octubre', 'noviembre', 'diciembre']
+# Cargos periódicos: (descripción, categoría, tipo, cada cuántos días, monto)
+RECURRING = [
+    ('Sueldo ACME {month}', 'Ingresos', 'income', 30, 2500.0),
+    ('Alquiler apartamento', 'Otros', 'expense', 30, 900.0),
+    ('Netflix suscripción', 'Entretenimiento', 'expense', 30, 12.99),
+    ('Cuota gimnasio {month}', 'Salud', 'expense', 30, 35.0),
+    ('Clase de tenis', 'Entretenimiento', 'expense', 7, 20.0),
+    ('Seguro del auto', 'Servicios', 'expense', 91, 180.0),
+]
+RECURRING_SHARE = 0.05
+
+# Peso relativo de cada hora del día
+HOUR_WEIGHTS = [1, 1, 1, 1, 1, 2, 4, 8, 12, 12, 10, 12, 16, 14, 10, 10, 10, 12, 14, 14, 10, 6, 4, 2]
+
+MAX_AMOUNT_CENTS = 100_000_000
+
+
+def create_users(count: int) -> List[int]:
+    """Crea (o reutiliza) los usuarios bench1..benchN; retorna sus ids"""
+    from utils.security import hash_password
+
+    # Un solo hash para todos: hashear N veces solo haría lenta la generación
+    password_hash, salt = hash_password(BENCH_PASSWORD)
+    with transaction() as conn:
+        conn.executemany('INSERT OR IGNORE INTO users (username, password_hash, password_salt) VALUES (?, ?, ?)',
+                         [(f'bench{i}', password_hash, salt) for i in range(1, count + 1)])
+        rows = conn.execute("SELECT username, id FROM users WHERE username LIKE 'bench%'").fetchall()
+    ids = dict((username, user_id) for username, user_id in rows)
+    return [ids[f'bench{i}'] for i in range(1, count + 1)]
+
+
+def generate_rows(user_ids: List[int], count: int, seed: int = 42, days: int = 730):
+    """Genera tuplas (user_id, description, amount_cents, category, type, created_at)"""
+    rnd = random.Random(seed)
+    user_weights = [1 / (rank + 1) ** 1.1 for rank in range(len(user_ids))]
+    categories = list(PROFILES)
+    category_weights = [PROFILES[name][0] for name in categories]
+    end = datetime.now().replace(microsecond=0)
+    start = end - timedelta(days=days)
+
+    # Series periódicas de los primeros usuarios hasta cubrir RECURRING_SHARE
+    recurring = 0
+    for user_id in user_ids:
+        if recurring >= count * RECURRING_SHARE:
+            break
+        for template, category, trans_type, every, amount in RECURRING:
+            day = start + timedelta(days=rnd.randrange(every))
+            while day < end and recurring < count * RECURRING_SHARE:
+                # Unos días de corrimiento y montos casi fijos, como en un extracto
+                when = day + timedelta(days=rnd.randint(-1, 1), hours=rnd.randint(8, 20))
+                amount_cents = int(round(amount * 100 * rnd.uniform(0.97, 1.03)))
+                yield (user_id, template.format(month=MONTHS[when.month - 1]), amount_cents,
+                       category, trans_type, when.isoformat())
+                recurring += 1
+                day += timedelta(days=every)
+
+    users = rnd.choices(user_ids, weights=user_weights, k=count - recurring)
+    for user_id in users:
+        category = rnd.choices(categories, weights=category_weights)[0]
+        _, median, sigma, trans_type, templates = PROFILES[category]
+        description = rnd.choice(templates).format(
+            place=rnd.choice(PLACES), who=rnd.choice(WHO), month=rnd.choice(MONTHS), n=rnd.randint(1, 999))
+        amount = rnd.lognormvariate(math.log(median), sigma)
+        amount_cents = max(1, min(MAX_AMOUNT_CENTS, int(round(amount * 100))))
+        day = start + timedelta(days=rnd.randrange(days))
+        created_at = day.replace(hour=rnd.choices(range(24), weights=HOUR_WEIGHTS)[0],
+                                 minute=rnd.randrange(60), second=rnd.randrange(60))
+        yield (user_id, description, amount_cents, category, trans_type, created_at.isoformat())
+
+
+def generate(users: int, rows: int, seed: int = 42, days: int = 730) -> List[int]:
+    """Crea usuarios y transacciones en la base configurada; retorna los ids de usuario"""
+    from db.models import init_db
+
+    init_db()
+    user_ids = create_users(users)
+    chunk = []
+    for row in generate_rows(user_ids, rows, seed, days):
+        chunk.append(row)
+        if len(chunk) >= INSERT_CHUNK:
+            _insert(chunk)
+            chunk = []
+    if chunk:
+        _insert(chunk)
+    return user_ids
+
+
+def _insert(rows) -> None:
+    with transaction() as conn:
+        conn.executemany('''INSERT INTO transactions
+                            (user_id, description, amount_cents, category, type, created_at)
+                            VALUES (?, ?, ?, ?, ?, ?)''', rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m bench.dataset')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--days', type=int, default=730)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--db', help='archivo SQLite (por defecto DATABASE_PATH o expenses.db)')
+    args = parser.parse_args()
+
+    if args.db:
+        configure(args.db)
+    start = time.perf_counter()
+    generate(args.users, args.rows, args.seed, args.days)
+    print(f"{args.users} usuarios y {args.rows:,} transacciones en {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
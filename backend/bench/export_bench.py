@@ -0,0 +1,127 @@
+"""
+Benchmark de la exportación (GET /api/transactions/export)
+
+Genera un usuario con N transacciones (1M por defecto) en una base
+temporal y descarga la exportación CSV y NDJSON con gzip a través de la
+app, consumiendo la respuesta por bloques como lo haría un cliente.
+Registra filas/s, MB comprimidos/s, tiempo al primer byte y el pico de
+RSS del proceso durante cada descarga.
+
+    cd backend && python -m bench.export_bench [--rows 1000000] [--db /tmp/export.db]
+"""
+import argparse
+import os
+import resource
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from db.connection import configure, transaction
+
+INSERT_CHUNK = 50_000
+CATEGORIES = ['Comida', 'Transporte', 'Servicios', 'Salud', 'Entretenimiento', 'Otros']
+
+
+def rss_mb():
+    """RSS actual (Linux); si no hay /proc, el máximo histórico del proceso"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1e6
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+
+class PeakRSS:
+    """Muestrea el RSS en un hilo mientras dura el bloque `with`"""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0.0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, rss_mb())
+
+    def __enter__(self):
+        self.peak = rss_mb()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_mb())
+
+
+def seed(rows):
+    """Usuario de prueba con `rows` transacciones; retorna su id"""
+    start = datetime(2015, 1, 1)
+    with transaction() as conn:
+        user_id = conn.execute(
+            "INSERT INTO users (username, password_hash, password_salt) VALUES ('bench', 'x', 'x')"
+        ).lastrowid
+    for offset in range(0, rows, INSERT_CHUNK):
+        count = min(INSERT_CHUNK, rows - offset)
+        with transaction() as conn:
+            conn.executemany(
+                '''INSERT INTO transactions (user_id, description, amount_cents, category, type, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?)''',
+                ((user_id, f'Compra #{i} en comercio {i % 997}', (i % 5000) * 137,
+                  CATEGORIES[i % len(CATEGORIES)], 'income' if i % 10 == 0 else 'expense',
+                  (start + timedelta(minutes=5 * i)).isoformat())
+                 for i in range(offset, offset + count))
+            )
+    return user_id
+
+
+def run_export(client, headers, fmt, rows):
+    with PeakRSS() as rss:
+        start = time.perf_counter()
+        response = client.get(f'/api/transactions/export?format={fmt}', headers=headers, buffered=False)
+        first_byte = None
+        size = 0
+        for chunk in response.response:
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+            size += len(chunk)
+        elapsed = time.perf_counter() - start
+        response.close()
+    assert response.status_code == 200 and response.headers.get('Content-Encoding') == 'gzip'
+    print(f"{fmt:>7} {elapsed:>9.2f} {rows / elapsed:>12,.0f} {size / 1e6:>10.1f} "
+          f"{size / 1e6 / elapsed:>8.1f} {first_byte * 1000:>9.1f} {rss.peak:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m bench.export_bench')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--db', help='base a usar (por defecto, un archivo temporal)')
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(prefix='export-bench-'), 'bench.db')
+    configure(path)
+
+    from app import app
+    from db.models import init_db
+    from utils.sessions import get_sessions
+
+    init_db()
+    start = time.perf_counter()
+    user_id = seed(args.rows)
+    print(f"{args.rows:,} filas generadas en {time.perf_counter() - start:.1f}s ({path})")
+
+    token, _ = get_sessions().create(user_id)
+    headers = {'Authorization': f'Bearer {token}', 'Accept-Encoding': 'gzip'}
+    client = app.test_client()
+
+    print(f"RSS antes de exportar: {rss_mb():.1f} MB")
+    print(f"{'formato':>7} {'tiempo(s)':>9} {'filas/s':>12} {'gzip (MB)':>10} {'MB/s':>8} "
+          f"{'1er (ms)':>9} {'RSS pico':>10}")
+    for fmt in ('csv', 'ndjson'):
+        run_export(client, headers, fmt, args.rows)
+
+
+if __name__ == '__main__':
+    main()
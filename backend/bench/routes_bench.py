@@ -0,0 +1,317 @@
+"""
+Benchmark de rutas de la API
+
+Para cada tamaño (1k, 100k y 1M transacciones por defecto) genera una
+base temporal con bench.dataset y mide cada ruta con el test client de
+Flask: register, login, create, update, delete, list (primera página,
+página siguiente y filtrada), stats, timeseries, search y recurring.
+Las lecturas se hacen como el usuario más activo y con la caché de
+respuestas vacía, para medir la consulta y no el 304/caché.
+
+Reporta p50/p95/p99 en ms y consultas SQL por request (contadas con el
+trace callback del pool, incluidas las de triggers), más las consultas
+con más tiempo total (db/profiler.py).
+
+Con --storage memory los datos se cargan en MemoryStorage (db/storage.py)
+y no se toca disco: mide las mismas rutas salvo timeseries, search y
+recurring, que ese motor no atiende (501). El resultado se guarda como JSON
+(por defecto bench/results/<commit>.json, ignorado por git) para poder
+comparar entre commits corridos con los mismos --sizes y --requests:
+
+    cd backend && python -m bench.routes_bench [--sizes 1000,100000,1000000] [--requests 200] [--storage memory]
+    cd backend && python -m bench.routes_bench compare antes.json despues.json [--threshold 10]
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from db.connection import configure, connection
+from db.profiler import reset_stats, top_queries
+from db.storage import configure_storage
+
+from bench.dataset import BENCH_PASSWORD, INSERT_CHUNK, PROFILES, generate, generate_rows
+
+DEFAULT_SIZES = [1_000, 100_000, 1_000_000]
+TRANSACTION_CONTROL = ('BEGIN', 'COMMIT', 'ROLLBACK', 'END', 'SAVEPOINT', 'RELEASE')
+# Lecturas que van directo a SQLite (fuera de la interfaz de almacenamiento)
+SQLITE_ONLY_READS = ('timeseries', 'search', 'recurring')
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+class QueryCounter:
+    """
+    Trace callback del pool: cuenta las sentencias ejecutadas, incluidas
+    las de triggers (SQLite las reporta una por una), sin contar el control
+    de transacciones (BEGIN/COMMIT/ROLLBACK).
+    """
+
+    def __init__(self):
+        self.statements = 0
+
+    def __call__(self, sql: str) -> None:
+        if not sql.lstrip()[:8].upper().startswith(TRANSACTION_CONTROL):
+            self.statements += 1
+
+    def reset(self) -> None:
+        self.statements = 0
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Percentil por rango más cercano"""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class RouteTimer:
+    """Acumula latencias, consultas y status por ruta"""
+
+    def __init__(self, counter: QueryCounter):
+        self.counter = counter
+        self.samples: Dict[str, Dict[str, list]] = {}
+
+    def call(self, route: str, send, before=None):
+        if before is not None:
+            before()
+        self.counter.reset()
+        start = time.perf_counter()
+        response = send()
+        elapsed = time.perf_counter() - start
+        sample = self.samples.setdefault(route, {'ms': [], 'queries': [], 'status': []})
+        sample['ms'].append(elapsed * 1000)
+        sample['queries'].append(self.counter.statements)
+        sample['status'].append(response.status_code)
+        return response
+
+    def summary(self) -> Dict[str, dict]:
+        result = {}
+        for route, sample in self.samples.items():
+            ms, count = sample['ms'], len(sample['ms'])
+            statuses = {}
+            for status in sample['status']:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+            result[route] = {
+                'count': count,
+                'p50_ms': round(percentile(ms, 50), 3),
+                'p95_ms': round(percentile(ms, 95), 3),
+                'p99_ms': round(percentile(ms, 99), 3),
+                'mean_ms': round(sum(ms) / count, 3),
+                'queries_per_request': round(sum(sample['queries']) / count, 2),
+                'status': statuses,
+            }
+        return result
+
+
+def _description(rnd: random.Random) -> str:
+    templates = PROFILES[rnd.choice(list(PROFILES))][4]
+    return rnd.choice(templates).format(place='el centro', who='amigos', month='marzo', n=rnd.randint(1, 999))
+
+
+def generate_memory(storage, users: int, rows: int) -> List[int]:
+    """Como bench.dataset.generate, pero en el motor en memoria"""
+    from utils.security import hash_password
+
+    password_hash, salt = hash_password(BENCH_PASSWORD)
+    user_ids = [storage.create_user(f'bench{i}', password_hash, salt) for i in range(1, users + 1)]
+    chunks: Dict[int, list] = {}
+    for user_id, description, amount_cents, category, trans_type, created_at in generate_rows(user_ids, rows):
+        chunk = chunks.setdefault(user_id, [])
+        chunk.append((description, amount_cents, category, trans_type, created_at))
+        if len(chunk) >= INSERT_CHUNK:
+            storage.create_many(user_id, chunk)
+            chunks[user_id] = []
+    for user_id, chunk in chunks.items():
+        if chunk:
+            storage.create_many(user_id, chunk)
+    return user_ids
+
+
+def bench_size(rows: int, users: int, requests: int, auth_requests: int, workdir: Optional[str],
+               storage_backend: str = 'sqlite') -> dict:
+    """Genera la base de `rows` transacciones y mide todas las rutas"""
+    counter = QueryCounter()
+    memory = storage_backend == 'memory'
+    storage = configure_storage(storage_backend)
+    path = None
+    if not memory:
+        path = os.path.join(workdir, f'bench-{rows}.db')
+        configure(path)
+
+    start = time.perf_counter()
+    user_ids = generate_memory(storage, users, rows) if memory else generate(users, rows)
+    generate_s = time.perf_counter() - start
+
+    # El pool se recrea con el contador para no medir la generación
+    if not memory:
+        configure(path, trace=counter)
+    reset_stats()
+
+    from app import app
+    from utils.http_cache import get_response_cache
+    from utils.sessions import get_sessions
+
+    heavy_user = user_ids[0]
+    token, _ = get_sessions().create(heavy_user)
+    headers = {'Authorization': f'Bearer {token}'}
+    client = app.test_client()
+    cache = get_response_cache()
+    timer = RouteTimer(counter)
+    rnd = random.Random(7)
+
+    for i in range(auth_requests):
+        timer.call('register', lambda: client.post('/api/auth/register', json={
+            'username': f'nuevo{rows}x{i}', 'password': BENCH_PASSWORD}))
+        timer.call('login', lambda: client.post('/api/auth/login', json={
+            'username': 'bench1', 'password': BENCH_PASSWORD}))
+
+    created = []
+    for _ in range(requests):
+        response = timer.call('create', lambda: client.post('/api/transactions', headers=headers, json={
+            'description': _description(rnd), 'amount': round(rnd.lognormvariate(3, 1), 2)}))
+        if response.status_code == 201:
+            created.append(response.get_json()['id'])
+    for trans_id in created:
+        timer.call('update', lambda: client.put(f'/api/transactions/{trans_id}', headers=headers, json={
+            'description': _description(rnd), 'amount': round(rnd.lognormvariate(3, 1), 2)}))
+    for trans_id in created:
+        timer.call('delete', lambda: client.delete(f'/api/transactions/{trans_id}', headers=headers))
+
+    next_cursor = client.get('/api/transactions', headers=headers).headers.get('X-Next-Cursor')
+    reads = {
+        'list': '/api/transactions',
+        'list_next_page': f'/api/transactions?cursor={next_cursor}' if next_cursor else '/api/transactions',
+        'list_filtered': '/api/transactions?category=Transporte&type=expense',
+        'stats': '/api/stats',
+        'timeseries': '/api/stats/timeseries?granularity=month',
+        'search': '/api/transactions/search?q=uber',
+        'recurring': '/api/recurring',
+    }
+    for route, url in reads.items():
+        if memory and route in SQLITE_ONLY_READS:
+            continue
+        for _ in range(requests):
+            timer.call(route, lambda: client.get(url, headers=headers), before=cache.clear)
+
+    if memory:
+        heavy_rows = sum(len(batch) for batch in storage.iter_batches(heavy_user))
+    else:
+        with connection() as conn:
+            heavy_rows = conn.execute('SELECT COUNT(*) FROM transactions WHERE user_id = ?',
+                                      (heavy_user,)).fetchone()[0]
+        configure(path)
+
+    return {
+        'rows': rows,
+        'users': users,
+        'heavy_user_rows': heavy_rows,
+        'generate_s': round(generate_s, 2),
+        'routes': timer.summary(),
+        'top_queries': top_queries(10),
+    }
+
+
+def _git(*args) -> Optional[str]:
+    try:
+        return subprocess.run(['git', *args], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args) -> None:
+    sizes = [int(size) for size in args.sizes.split(',')]
+    commit = _git('rev-parse', '--short', 'HEAD')
+    results = {
+        'commit': commit,
+        'dirty': bool(_git('status', '--porcelain', '--untracked-files=no')),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'storage': args.storage,
+        'requests': args.requests,
+        'sizes': {},
+    }
+
+    workdir = tempfile.mkdtemp(prefix='routes-bench-') if args.storage == 'sqlite' else None
+    for rows in sizes:
+        print(f"\n== {rows:,} transacciones ==")
+        result = bench_size(rows, args.users, args.requests, args.auth_requests, workdir, args.storage)
+        results['sizes'][str(rows)] = result
+        print(f"generación {result['generate_s']}s, usuario medido con {result['heavy_user_rows']:,} filas")
+        print(f"{'ruta':<16} {'p50':>8} {'p95':>8} {'p99':>8} {'consultas':>10}")
+        for route, stats in result['routes'].items():
+            print(f"{route:<16} {stats['p50_ms']:>8.2f} {stats['p95_ms']:>8.2f} {stats['p99_ms']:>8.2f} "
+                  f"{stats['queries_per_request']:>10.1f}")
+
+    suffix = '' if args.storage == 'sqlite' else f'-{args.storage}'
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit or 'local'}{suffix}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"\nResultados en {output}")
+
+
+def compare(args) -> int:
+    """Compara dos resultados; retorna 1 si algún p95 empeoró más del umbral"""
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    print(f"{before.get('commit')} -> {after.get('commit')}")
+    regressions = 0
+    for size, result in after['sizes'].items():
+        previous = before['sizes'].get(size)
+        if previous is None:
+            continue
+        print(f"\n== {int(size):,} transacciones ==")
+        print(f"{'ruta':<16} {'p50':>18} {'p95':>18} {'p99':>18} {'consultas':>12}")
+        for route, stats in result['routes'].items():
+            old = previous['routes'].get(route)
+            if old is None:
+                continue
+            cells = []
+            for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+                change = (stats[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+                cells.append(f"{stats[key]:>8.2f} ({change:+5.0f}%)")
+            flag = ''
+            if old['p95_ms'] and (stats['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100 > args.threshold:
+                regressions += 1
+                flag = '  <- regresión'
+            print(f"{route:<16} {' '.join(cells)} {old['queries_per_request']:>5.1f}->"
+                  f"{stats['queries_per_request']:<5.1f}{flag}")
+    return 1 if regressions else 0
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'compare':
+        parser = argparse.ArgumentParser(prog='python -m bench.routes_bench compare')
+        parser.add_argument('before')
+        parser.add_argument('after')
+        parser.add_argument('--threshold', type=float, default=10.0,
+                            help='porcentaje de empeoramiento del p95 que se considera regresión')
+        sys.exit(compare(parser.parse_args(sys.argv[2:])))
+
+    parser = argparse.ArgumentParser(prog='python -m bench.routes_bench')
+    parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES))
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--requests', type=int, default=200, help='requests por ruta')
+    parser.add_argument('--auth-requests', type=int, default=20,
+                        help='requests de register/login (cada una deriva la contraseña)')
+    parser.add_argument('--storage', choices=('sqlite', 'memory'), default='sqlite',
+                        help='motor de almacenamiento (memory: sin disco, sin las rutas solo-SQLite)')
+    parser.add_argument('--output', help='archivo JSON (por defecto bench/results/<commit>[-memory].json)')
+    run(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark de los motores de almacenamiento (db/storage.py)
+
+Corre las mismas operaciones contra SQLite (archivo temporal, migrado) y
+contra el motor en memoria: altas de a una, altas en lote, páginas del
+listado, estadísticas y un recorrido completo con iter_batches. Imprime
+operaciones por segundo de cada motor y cuántas veces más lento es
+SQLite: la diferencia es lo que cuesta la base (SQL, disco, triggers),
+sin Flask ni validaciones de por medio.
+
+    cd backend && python -m bench.storage_bench [--users 20] [--rows 5000]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from typing import Callable, Dict
+
+from db.connection import configure
+from db.memory_storage import MemoryStorage
+from db.migrations import migrate
+from db.storage import SQLiteStorage, Storage
+
+CATEGORIES = ['Alimentacion', 'Transporte', 'Servicios', 'Salud', 'Otros']
+
+
+def rows_for(rng: random.Random, n: int):
+    return [(f'Compra {i} comercio {rng.randrange(500)}', -rng.randrange(100, 50000),
+             rng.choice(CATEGORIES), 'expense',
+             f'2026-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}T{rng.randrange(24):02d}:00:00')
+            for i in range(n)]
+
+
+def timed(fn: Callable[[], int]) -> float:
+    """Operaciones por segundo de fn (que retorna cuántas hizo)"""
+    start = time.perf_counter()
+    ops = fn()
+    return ops / (time.perf_counter() - start)
+
+
+def run(storage: Storage, users: int, rows: int, seed: int) -> Dict[str, float]:
+    rng = random.Random(seed)
+    user_ids = [storage.create_user(f'bench{i}', 'x', 'x') for i in range(users)]
+    data = {user_id: rows_for(rng, rows) for user_id in user_ids}
+
+    def bulk():
+        for user_id in user_ids:
+            storage.create_many(user_id, data[user_id])
+        return users * rows
+
+    def single():
+        for i in range(2000):
+            description, amount_cents, category, trans_type, created_at = data[user_ids[i % users]][i % rows]
+            storage.create_transaction(user_ids[i % users], description, amount_cents, category, trans_type,
+                                       created_at)
+        return 2000
+
+    def pages():
+        count = 0
+        for user_id in user_ids:
+            cursor = None
+            for _ in range(20):
+                _, cursor = storage.list_page(user_id, 50, cursor, {'category': 'Alimentacion'})
+                count += 1
+                if cursor is None:
+                    break
+        return count
+
+    def stats():
+        for i in range(2000):
+            storage.get_stats(user_ids[i % users])
+        return 2000
+
+    def scan():
+        return sum(len(batch) for user_id in user_ids for batch in storage.iter_batches(user_id))
+
+    return {
+        'create_many (filas/s)': timed(bulk),
+        'create (ops/s)': timed(single),
+        'list_page (páginas/s)': timed(pages),
+        'get_stats (ops/s)': timed(stats),
+        'iter_batches (filas/s)': timed(scan),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m bench.storage_bench')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--rows', type=int, default=5000, help='transacciones por usuario')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--db', help='archivo SQLite (por defecto uno temporal)')
+    args = parser.parse_args()
+
+    db = args.db or os.path.join(tempfile.mkdtemp(), 'storage_bench.db')
+    configure(db)
+    migrate()
+
+    print(f"{args.users} usuarios x {args.rows} transacciones ({db})")
+    sqlite = run(SQLiteStorage(), args.users, args.rows, args.seed)
+    memory = run(MemoryStorage(), args.users, args.rows, args.seed)
+    print(f"{'operación':<26}{'sqlite':>14}{'memoria':>14}{'x':>8}")
+    for name in sqlite:
+        print(f"{name:<26}{sqlite[name]:>14,.0f}{memory[name]:>14,.0f}{memory[name] / sqlite[name]:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
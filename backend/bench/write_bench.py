@@ -0,0 +1,118 @@
+"""
+Benchmark de escrituras con y sin group commit (db/group_commit.py)
+
+Simula W workers de gunicorn (procesos) con T hilos cada uno creando
+transacciones con Transaction.create durante S segundos, primero con
+commits individuales y después con group commit. Registra escrituras/s,
+latencias p50/p99 por escritura y, con group commit, el tamaño medio de
+cada grupo. Al final verifica que todos los ids devueltos existen.
+
+    cd backend && python -m bench.write_bench [--workers 4] [--threads 16] [--seconds 5]
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from db.connection import configure, connection, transaction
+from db.group_commit import configure_group_commit, group_commit_stats
+from db.migrations import migrate
+
+USERS = 50
+
+
+def seed():
+    with transaction() as conn:
+        conn.executemany('INSERT INTO users (username, password_hash, password_salt) VALUES (?, ?, ?)',
+                         [(f'bench{i}', 'x', 'x') for i in range(USERS)])
+
+
+def worker(db, enabled, window_ms, threads, seconds, results):
+    """Un "worker": T hilos escribiendo hasta el deadline"""
+    from db.models import Transaction
+
+    configure(db)
+    configure_group_commit(enabled, window_ms)
+    deadline = time.monotonic() + seconds
+    latencies, ids = [], []
+    lock = threading.Lock()
+
+    def loop(n):
+        mine_lat, mine_ids = [], []
+        i = 0
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            trans_id = Transaction.create(1 + (n + i) % USERS, f'Compra {i} supermercado', -1500 - i,
+                                          'Alimentacion', 'expense')
+            mine_lat.append(time.perf_counter() - start)
+            mine_ids.append(trans_id)
+            i += 1
+        with lock:
+            latencies.extend(mine_lat)
+            ids.extend(mine_ids)
+
+    pool = [threading.Thread(target=loop, args=(n,)) for n in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    results.put((latencies, ids, group_commit_stats()))
+
+
+def run(db, enabled, workers, threads, seconds, window_ms):
+    ctx = multiprocessing.get_context('fork')
+    results = ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(db, enabled, window_ms, threads, seconds, results))
+             for _ in range(workers)]
+    start = time.perf_counter()
+    for proc in procs:
+        proc.start()
+    collected = [results.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(lat for lats, _, _ in collected for lat in lats)
+    ids = [trans_id for _, trans_ids, _ in collected for trans_id in trans_ids]
+    batches = [stats for _, _, stats in collected if stats]
+    with connection() as conn:
+        found = conn.execute('SELECT COUNT(*) FROM transactions WHERE id IN (SELECT value FROM json_each(?))',
+                             (str(ids),)).fetchone()[0]
+    return {
+        'writes': len(ids),
+        'writes_per_sec': len(ids) / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p99_ms': latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        'avg_batch': (sum(s['writes'] for s in batches) / max(sum(s['batches'] for s in batches), 1))
+                     if batches else 1.0,
+        'ids_ok': found == len(ids) == len(set(ids)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m bench.write_bench')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--window-ms', type=float, default=2)
+    parser.add_argument('--db', help='archivo SQLite (por defecto uno temporal)')
+    args = parser.parse_args()
+
+    db = args.db or os.path.join(tempfile.mkdtemp(), 'write_bench.db')
+    configure(db)
+    migrate()
+    seed()
+
+    print(f"{args.workers} workers x {args.threads} hilos, {args.seconds:g}s por modo ({db})")
+    print(f"{'modo':<14}{'escrituras/s':>14}{'p50 ms':>10}{'p99 ms':>10}{'grupo medio':>13}{'ids':>6}")
+    for label, enabled in (('individual', False), ('group commit', True)):
+        r = run(db, enabled, args.workers, args.threads, args.seconds, args.window_ms)
+        print(f"{label:<14}{r['writes_per_sec']:>14,.0f}{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}"
+              f"{r['avg_batch']:>13.1f}{'ok' if r['ids_ok'] else 'MAL':>6}")
+
+
+if __name__ == '__main__':
+    main()
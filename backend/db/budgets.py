@@ -0,0 +1,108 @@
+"""
+Presupuestos mensuales por categoría y sus alertas
+
+Un presupuesto es (usuario, categoría, mes 'YYYY-MM', límite en
+centavos). Lo gastado sale de user_monthly_totals (db/rollups.py), que los
+triggers de transactions mantienen al día; triggers sobre esa tabla
+comparan el total nuevo con los presupuestos del mismo (usuario, mes,
+categoría) y registran en budget_alerts cada umbral cruzado (80% y 100%).
+Así una escritura en transactions hace una búsqueda por clave primaria y
+no vuelve a sumar el mes.
+
+Cada umbral genera una sola alerta por presupuesto (UNIQUE). Si el gasto
+baja, la alerta queda; si se sube el límite, Budget.upsert borra las que
+ya no corresponden para que puedan volver a dispararse.
+
+La categoría es la que asigna categorize_for_user; solo se evalúan
+los gastos (type = 'expense').
+"""
+from typing import Dict, List
+
+# Porcentajes del límite que generan alerta
+ALERT_THRESHOLDS = (80, 100)
+
+_THRESHOLDS = ' UNION ALL '.join(f'SELECT {pct} AS pct' for pct in ALERT_THRESHOLDS)
+
+BUDGET_TABLES = [
+    '''CREATE TABLE IF NOT EXISTS budgets
+       (id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        category TEXT NOT NULL,
+        month TEXT NOT NULL,
+        limit_cents INTEGER NOT NULL,
+        created_at TIMESTAMP,
+        updated_at TIMESTAMP,
+        UNIQUE (user_id, category, month),
+        FOREIGN KEY (user_id) REFERENCES users (id))''',
+    # AUTOINCREMENT: los ids nunca se reusan (los clientes sondean por id)
+    '''CREATE TABLE IF NOT EXISTS budget_alerts
+       (id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        budget_id INTEGER NOT NULL,
+        category TEXT NOT NULL,
+        month TEXT NOT NULL,
+        threshold INTEGER NOT NULL,
+        spent_cents INTEGER NOT NULL,
+        limit_cents INTEGER NOT NULL,
+        created_at TIMESTAMP,
+        UNIQUE (budget_id, threshold))''',
+    # Sondeo de alertas nuevas: WHERE user_id = ? AND id > ?
+    'CREATE INDEX IF NOT EXISTS idx_budget_alerts_user ON budget_alerts(user_id, id)',
+]
+
+# Alertas de los umbrales que el total {row} alcanza y todavía no tienen una.
+# NOT EXISTS y no OR IGNORE: dentro de un trigger manda la política de
+# conflicto de la sentencia externa (el upsert de los totales)
+_RAISE_ALERTS = f'''
+    INSERT INTO budget_alerts
+        (user_id, budget_id, category, month, threshold, spent_cents, limit_cents, created_at)
+    SELECT b.user_id, b.id, b.category, b.month, t.pct, {{row}}.total, b.limit_cents,
+           strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime')
+    FROM budgets b, ({_THRESHOLDS}) t
+    WHERE b.user_id = {{row}}.user_id AND b.category = {{row}}.category AND b.month = {{row}}.month
+      AND {{row}}.total * 100 >= b.limit_cents * t.pct
+      AND NOT EXISTS (SELECT 1 FROM budget_alerts a WHERE a.budget_id = b.id AND a.threshold = t.pct);'''
+
+BUDGET_TRIGGERS = [
+    f'''CREATE TRIGGER IF NOT EXISTS trg_budget_alerts_insert AFTER INSERT ON user_monthly_totals
+        WHEN NEW.type = 'expense'
+        BEGIN {_RAISE_ALERTS.format(row='NEW')} END''',
+    # Solo cuando el gasto sube: una baja nunca cruza un umbral
+    f'''CREATE TRIGGER IF NOT EXISTS trg_budget_alerts_update AFTER UPDATE OF total ON user_monthly_totals
+        WHEN NEW.type = 'expense' AND NEW.total > OLD.total
+        BEGIN {_RAISE_ALERTS.format(row='NEW')} END''',
+]
+
+
+def create_budgets(conn) -> None:
+    """Tablas, índices y triggers de presupuestos (idempotente)"""
+    for statement in BUDGET_TABLES + BUDGET_TRIGGERS:
+        conn.execute(statement)
+
+
+def spent_cents(conn, user_id: int, category: str, month: str) -> int:
+    """Gasto del mes en la categoría, según user_monthly_totals"""
+    row = conn.execute('''SELECT total FROM user_monthly_totals
+                          WHERE user_id = ? AND month = ? AND type = 'expense' AND category = ?''',
+                       (user_id, month, category)).fetchone()
+    return row[0] if row else 0
+
+
+def evaluate_budget(conn, budget: Dict) -> List[int]:
+    """
+    Reevalúa los umbrales de un presupuesto (al crearlo o cambiar su
+    límite): borra las alertas que ya no corresponden y registra las que
+    faltan. Retorna los umbrales alcanzados.
+    """
+    spent = spent_cents(conn, budget['user_id'], budget['category'], budget['month'])
+    reached = [pct for pct in ALERT_THRESHOLDS if spent * 100 >= budget['limit_cents'] * pct]
+    placeholders = ','.join('?' * len(reached))
+    conn.execute(f'''DELETE FROM budget_alerts
+                     WHERE budget_id = ? AND threshold NOT IN ({placeholders})''',
+                 [budget['id']] + reached)
+    conn.executemany('''INSERT OR IGNORE INTO budget_alerts
+                        (user_id, budget_id, category, month, threshold, spent_cents, limit_cents, created_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime'))''',
+                     [(budget['user_id'], budget['id'], budget['category'], budget['month'],
+                       pct, spent, budget['limit_cents']) for pct in reached])
+    return reached
@@ -0,0 +1,334 @@
+"""
+Gestor de conexiones SQLite compartido por todo el backend
+
+Mantiene un pool acotado de conexiones por proceso (cada worker de gunicorn
+tiene el suyo), configuradas una sola vez con WAL, busy_timeout y
+synchronous=NORMAL. Es seguro ante fork: el proceso hijo descarta las
+conexiones heredadas y abre las suyas.
+
+connection() y transaction() usan el pool activo: el de la BD principal o,
+con particiones (db/sharding.py), el del archivo del usuario del request,
+elegido con use_pool().
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from db.profiler import connection_factory
+
+DATABASE = os.environ.get('DATABASE_PATH', 'expenses.db')
+
+# Parámetros del pool (configurables por variables de entorno)
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '8'))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+BUSY_TIMEOUT_MS = int(os.environ.get('DB_BUSY_TIMEOUT_MS', '5000'))
+BUSY_RETRIES = int(os.environ.get('DB_BUSY_RETRIES', '3'))
+STATEMENT_CACHE = int(os.environ.get('DB_STATEMENT_CACHE', '256'))
+
+
+class PoolTimeoutError(Exception):
+    """No hay conexiones libres en el pool dentro del tiempo de espera"""
+    pass
+
+
+class ConnectionPool:
+    """Pool LIFO de conexiones SQLite, uno por proceso"""
+
+    def __init__(self, database: str = DATABASE, size: int = POOL_SIZE,
+                 timeout: float = POOL_TIMEOUT, busy_timeout_ms: int = BUSY_TIMEOUT_MS,
+                 busy_retries: int = BUSY_RETRIES, statement_cache: int = STATEMENT_CACHE,
+                 trace: Optional[Callable[[str], None]] = None):
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self.busy_timeout_ms = busy_timeout_ms
+        self.busy_retries = busy_retries
+        self.statement_cache = statement_cache
+        # Callback por sentencia ejecutada (sqlite3 set_trace_callback), p. ej. para contar consultas
+        self.trace = trace
+        self._lock = threading.Lock()
+        # Conexiones heredadas de un fork: se retienen para que el GC no las cierre
+        self._orphans = []
+        self._reset()
+
+    def _reset(self):
+        """Deja el pool vacío para el proceso actual"""
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue(maxsize=self.size)
+        self._created = 0
+        self._metrics = {
+            'checkouts': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'timeouts': 0,
+            'busy_retries': 0,
+        }
+
+    def _after_fork(self):
+        """
+        En el hijo, las conexiones heredadas no se deben usar ni cerrar
+        (SQLite no soporta conexiones que cruzan un fork): se abandonan.
+        """
+        self._lock = threading.Lock()
+        self._orphans.append(self._idle)
+        self._reset()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Abre y configura una conexión nueva"""
+        options = {}
+        factory = connection_factory()
+        if factory is not None:
+            options['factory'] = factory
+        conn = sqlite3.connect(
+            self.database,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False,
+            cached_statements=self.statement_cache,
+            **options,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        trace = _combine(self.trace, _statement_hook)
+        if trace is not None:
+            conn.set_trace_callback(trace)
+        return conn
+
+    def _checkout(self) -> sqlite3.Connection:
+        if self._pid != os.getpid():
+            self._after_fork()
+
+        start = time.perf_counter()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                if self._created < self.size:
+                    self._created += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._metrics['timeouts'] += 1
+                    raise PoolTimeoutError('Pool de conexiones agotado')
+
+        waited = time.perf_counter() - start
+        with self._lock:
+            self._metrics['checkouts'] += 1
+            self._metrics['wait_time_total'] += waited
+            if waited > self._metrics['wait_time_max']:
+                self._metrics['wait_time_max'] = waited
+        return conn
+
+    def _checkin(self, conn: sqlite3.Connection, pid: int):
+        if pid != os.getpid():
+            # Conexión de otro proceso: no vuelve al pool
+            return
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put_nowait(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        Presta una conexión del pool. Al salir, cualquier transacción
+        que haya quedado abierta se revierte.
+        """
+        conn = self._checkout()
+        pid = self._pid
+        held_since = time.perf_counter()
+        try:
+            yield conn
+        except (sqlite3.IntegrityError, sqlite3.OperationalError, sqlite3.ProgrammingError):
+            self._checkin(conn, pid)
+            raise
+        except sqlite3.DatabaseError:
+            # Conexión posiblemente inutilizable: se descarta del pool
+            self._discard(conn, pid)
+            raise
+        except BaseException:
+            self._checkin(conn, pid)
+            raise
+        else:
+            self._checkin(conn, pid)
+        finally:
+            if _hold_hook is not None:
+                _hold_hook(time.perf_counter() - held_since)
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Transacción de escritura: toma el lock con BEGIN IMMEDIATE
+        (reintentando si la BD sigue ocupada tras busy_timeout) y hace
+        commit al salir o rollback si hubo error.
+        """
+        with self.connection() as conn:
+            attempt = 0
+            while True:
+                try:
+                    conn.execute('BEGIN IMMEDIATE')
+                    break
+                except sqlite3.OperationalError as e:
+                    if 'locked' not in str(e) or attempt >= self.busy_retries:
+                        raise
+                    attempt += 1
+                    with self._lock:
+                        self._metrics['busy_retries'] += 1
+                    time.sleep(0.01 * (2 ** attempt))
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def _discard(self, conn: sqlite3.Connection, pid: int):
+        if pid != os.getpid():
+            return
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Métricas del pool del proceso actual"""
+        with self._lock:
+            metrics = dict(self._metrics)
+            created = self._created
+        idle = self._idle.qsize()
+        checkouts = metrics['checkouts']
+        metrics['wait_time_avg'] = metrics['wait_time_total'] / checkouts if checkouts else 0.0
+        metrics.update({
+            'pid': self._pid,
+            'size': self.size,
+            'open': created,
+            'idle': idle,
+            'in_use': created - idle,
+        })
+        return metrics
+
+    def close_all(self):
+        """Cierra las conexiones libres (p. ej. al apagar el worker)"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn, self._pid)
+
+
+# Instrumentación común a todos los pools (ver utils/metrics.py): un
+# callback por sentencia ejecutada y otro con los segundos que se retuvo
+# cada conexión prestada
+_statement_hook: Optional[Callable[[str], None]] = None
+_hold_hook: Optional[Callable[[float], None]] = None
+
+
+def _combine(*callbacks):
+    callbacks = [callback for callback in callbacks if callback is not None]
+    if len(callbacks) <= 1:
+        return callbacks[0] if callbacks else None
+
+    def trace(sql):
+        for callback in callbacks:
+            callback(sql)
+    return trace
+
+
+def instrument(statement: Optional[Callable[[str], None]] = None,
+               hold: Optional[Callable[[float], None]] = None):
+    """
+    Instala los callbacks de instrumentación. Se cierran las conexiones
+    libres para que las nuevas se abran con el trace callback.
+    """
+    global _statement_hook, _hold_hook
+    _statement_hook = statement
+    _hold_hook = hold
+    _pool.close_all()
+
+
+_pool = ConnectionPool()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=lambda: _pool._after_fork())
+
+
+def configure(database: Optional[str] = None, **options):
+    """
+    Reconfigura el pool global (ruta de la BD, tamaño, timeouts...).
+    Cierra las conexiones libres del pool anterior.
+    """
+    global _pool
+    _pool.close_all()
+    _pool = ConnectionPool(database or _pool.database, **options)
+    return _pool
+
+
+# Pool del archivo con el que trabaja el contexto actual (request, hilo).
+# None = la BD principal
+_active: ContextVar[Optional[ConnectionPool]] = ContextVar('db_active_pool', default=None)
+
+
+@contextmanager
+def use_pool(pool: Optional[ConnectionPool]) -> Iterator[Optional[ConnectionPool]]:
+    """Dentro del bloque, connection() y transaction() usan `pool`"""
+    token = _active.set(pool)
+    try:
+        yield pool
+    finally:
+        _active.reset(token)
+
+
+def get_pool() -> ConnectionPool:
+    """Pool activo (el de la BD principal si no se eligió otro)"""
+    return _active.get() or _pool
+
+
+def directory_pool() -> ConnectionPool:
+    """Pool de la BD principal (usuarios, sesiones, jobs), sin importar el activo"""
+    return _pool
+
+
+def connection():
+    """Conexión prestada del pool activo (usar con `with`)"""
+    return get_pool().connection()
+
+
+def transaction():
+    """Transacción de escritura sobre el pool activo (usar con `with`)"""
+    return get_pool().transaction()
+
+
+def directory_connection():
+    """Conexión de la BD principal (usar con `with`)"""
+    return _pool.connection()
+
+
+def directory_transaction():
+    """Transacción de escritura sobre la BD principal (usar con `with`)"""
+    return _pool.transaction()
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Métricas del pool global"""
+    return _pool.stats()
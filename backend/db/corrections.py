@@ -0,0 +1,116 @@
+"""
+Correcciones de categoría y conteos del modelo por usuario
+
+Cada corrección (el usuario cambia la categoría de una transacción) se
+guarda con las palabras de la descripción y suma a los conteos del
+modelo naive Bayes del usuario (utils/category_model.py):
+
+- category_model_docs: descripciones y palabras por categoría;
+- category_model_tokens: apariciones de cada palabra por categoría;
+- category_models: versión del modelo (sube con cada corrección; las
+  cachés de los workers la comparan para saber si recargar).
+
+El entrenamiento es incremental: corregir otra vez la misma transacción
+resta la corrección anterior y suma la nueva, sin recorrer el resto.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+CORRECTION_TABLES = [
+    '''CREATE TABLE IF NOT EXISTS category_corrections
+       (user_id INTEGER NOT NULL,
+        transaction_id INTEGER NOT NULL,
+        tokens TEXT NOT NULL,
+        category TEXT NOT NULL,
+        created_at TIMESTAMP,
+        PRIMARY KEY (user_id, transaction_id)) WITHOUT ROWID''',
+    '''CREATE TABLE IF NOT EXISTS category_model_docs
+       (user_id INTEGER NOT NULL,
+        category TEXT NOT NULL,
+        docs INTEGER NOT NULL DEFAULT 0,
+        tokens INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, category)) WITHOUT ROWID''',
+    '''CREATE TABLE IF NOT EXISTS category_model_tokens
+       (user_id INTEGER NOT NULL,
+        token TEXT NOT NULL,
+        category TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, token, category)) WITHOUT ROWID''',
+    '''CREATE TABLE IF NOT EXISTS category_models
+       (user_id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP)''',
+]
+
+
+def create_corrections(conn) -> None:
+    """Tablas de correcciones y del modelo (idempotente)"""
+    for statement in CORRECTION_TABLES:
+        conn.execute(statement)
+
+
+def _add_counts(conn, user_id: int, tokens: List[str], category: str, sign: int) -> None:
+    conn.execute('''INSERT INTO category_model_docs (user_id, category, docs, tokens) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (user_id, category)
+                    DO UPDATE SET docs = docs + excluded.docs, tokens = tokens + excluded.tokens''',
+                 (user_id, category, sign, sign * len(tokens)))
+    counts: Dict[str, int] = {}
+    for token in tokens:
+        counts[token] = counts.get(token, 0) + 1
+    conn.executemany('''INSERT INTO category_model_tokens (user_id, token, category, count) VALUES (?, ?, ?, ?)
+                        ON CONFLICT (user_id, token, category) DO UPDATE SET count = count + excluded.count''',
+                     [(user_id, token, category, sign * count) for token, count in counts.items()])
+    if sign < 0:
+        conn.execute('DELETE FROM category_model_docs WHERE user_id = ? AND category = ? AND docs <= 0',
+                     (user_id, category))
+        conn.executemany('''DELETE FROM category_model_tokens
+                            WHERE user_id = ? AND token = ? AND category = ? AND count <= 0''',
+                         [(user_id, token, category) for token in counts])
+
+
+def apply_correction(conn, user_id: int, transaction_id: int, tokens: List[str],
+                     category: str, now: str) -> int:
+    """
+    Registra la corrección y actualiza los conteos en la transacción
+    abierta. Retorna la versión nueva del modelo.
+    """
+    previous = conn.execute('''SELECT tokens, category FROM category_corrections
+                               WHERE user_id = ? AND transaction_id = ?''',
+                            (user_id, transaction_id)).fetchone()
+    if previous is not None:
+        _add_counts(conn, user_id, previous[0].split(), previous[1], -1)
+    conn.execute('''INSERT INTO category_corrections (user_id, transaction_id, tokens, category, created_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (user_id, transaction_id)
+                    DO UPDATE SET tokens = excluded.tokens, category = excluded.category,
+                                  created_at = excluded.created_at''',
+                 (user_id, transaction_id, ' '.join(tokens), category, now))
+    _add_counts(conn, user_id, tokens, category, 1)
+    conn.execute('''INSERT INTO category_models (user_id, version, updated_at) VALUES (?, 1, ?)
+                    ON CONFLICT (user_id) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at''',
+                 (user_id, now))
+    return model_version(conn, user_id)
+
+
+def model_version(conn, user_id: int) -> int:
+    row = conn.execute('SELECT version FROM category_models WHERE user_id = ?', (user_id,)).fetchone()
+    return row[0] if row else 0
+
+
+def load_counts(conn, user_id: int, max_tokens: int) -> Optional[Dict[str, Any]]:
+    """
+    Conteos del modelo del usuario (None si no tiene correcciones). Se
+    cargan como mucho `max_tokens` palabras, las más frecuentes.
+    """
+    docs: List[Tuple[str, int, int]] = [tuple(row) for row in conn.execute(
+        'SELECT category, docs, tokens FROM category_model_docs WHERE user_id = ? ORDER BY category', (user_id,))]
+    if not docs:
+        return None
+    version = model_version(conn, user_id)
+    counts: Dict[str, Dict[str, int]] = {}
+    for token, category, count in conn.execute('''
+            SELECT token, category, count FROM category_model_tokens
+            WHERE user_id = ? AND token IN (
+                SELECT token FROM category_model_tokens WHERE user_id = ?
+                GROUP BY token ORDER BY SUM(count) DESC LIMIT ?)''', (user_id, user_id, max_tokens)):
+        counts.setdefault(token, {})[category] = count
+    return {'version': version, 'docs': docs, 'counts': counts}
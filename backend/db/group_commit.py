@@ -0,0 +1,220 @@
+"""
+Group commit: escrituras de varios requests en una sola transacción
+
+Con DB_GROUP_COMMIT=1, cada proceso tiene un hilo escritor. Los requests le
+pasan su escritura (una función que recibe la conexión) y esperan. El hilo
+junta las que llegan durante DB_GROUP_COMMIT_WINDOW_MS (o hasta
+DB_GROUP_COMMIT_MAX_ITEMS), las ejecuta dentro de un único BEGIN
+IMMEDIATE ... COMMIT y recién entonces despierta a cada request con su
+resultado (p. ej. el id real de la fila). Así una ráfaga hace un commit y
+toma el lock de escritura una vez, en lugar de una vez por request.
+
+Cada escritura corre en su propio SAVEPOINT: si falla, solo esa se revierte
+y su request recibe la excepción; las demás del grupo se confirman. Si
+falla el COMMIT, todas reciben el error. La garantía de durabilidad es la
+misma que sin group commit: el request responde después del COMMIT.
+
+Si un request se cansa de esperar (DB_GROUP_COMMIT_TIMEOUT) y su escritura
+todavía no empezó, se cancela: el escritor la saltea y el request recibe
+GroupCommitTimeout sabiendo que no se escribió nada. Si ya empezó, el
+request espera a que su grupo termine y recibe el resultado real, así un
+reintento del cliente nunca duplica una fila ya confirmada.
+
+Con particiones (db/sharding.py) cada escritura va al archivo activo del
+request que la pidió: el escritor hace un commit por archivo del grupo.
+
+Sin DB_GROUP_COMMIT, write() es una transacción común.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from db.connection import ConnectionPool, get_pool, transaction
+
+logger = logging.getLogger(__name__)
+
+GROUP_COMMIT = os.environ.get('DB_GROUP_COMMIT', '0') == '1'
+# Cuánto espera el escritor a que lleguen más escrituras tras la primera
+GROUP_COMMIT_WINDOW_MS = float(os.environ.get('DB_GROUP_COMMIT_WINDOW_MS', '2'))
+GROUP_COMMIT_MAX_ITEMS = int(os.environ.get('DB_GROUP_COMMIT_MAX_ITEMS', '256'))
+# Espera máxima de un request por su commit
+GROUP_COMMIT_TIMEOUT = float(os.environ.get('DB_GROUP_COMMIT_TIMEOUT', '30'))
+
+
+class GroupCommitTimeout(Exception):
+    """El escritor no confirmó la escritura dentro del tiempo de espera"""
+    pass
+
+
+class _Write:
+    __slots__ = ('fn', 'pool', 'done', 'result', 'error', 'state', 'lock')
+
+    def __init__(self, fn: Callable[[Any], Any], pool: ConnectionPool):
+        self.fn = fn
+        self.pool = pool
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+        # 'queued' -> 'running' (la toma el escritor) o 'cancelled' (venció la espera)
+        self.state = 'queued'
+        self.lock = threading.Lock()
+
+    def cancel(self) -> bool:
+        """Cancela la escritura si el escritor todavía no la tomó"""
+        with self.lock:
+            if self.state == 'queued':
+                self.state = 'cancelled'
+                return True
+            return False
+
+    def start(self) -> bool:
+        """La marca como en curso; False si ya estaba cancelada"""
+        with self.lock:
+            if self.state == 'cancelled':
+                return False
+            self.state = 'running'
+            return True
+
+
+class GroupCommitWriter:
+    """Hilo escritor del proceso y su cola"""
+
+    def __init__(self, window_ms: float = GROUP_COMMIT_WINDOW_MS, max_items: int = GROUP_COMMIT_MAX_ITEMS,
+                 timeout: float = GROUP_COMMIT_TIMEOUT):
+        self.window = window_ms / 1000
+        self.max_items = max_items
+        self.timeout = timeout
+        self._queue: 'queue.Queue[_Write]' = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._metrics = {'batches': 0, 'writes': 0, 'failed_writes': 0, 'failed_batches': 0, 'max_batch': 0,
+                         'cancelled_writes': 0}
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+                self._thread.start()
+
+    def submit(self, fn: Callable[[Any], Any]) -> Any:
+        """Encola la escritura y espera a que su grupo se confirme"""
+        self._ensure_thread()
+        item = _Write(fn, get_pool())
+        self._queue.put(item)
+        if not item.done.wait(self.timeout):
+            if item.cancel():
+                with self._lock:
+                    self._metrics['cancelled_writes'] += 1
+                raise GroupCommitTimeout('La escritura no se confirmó a tiempo')
+            # Ya está en un grupo: su resultado llega con el COMMIT
+            item.done.wait()
+        if item.error is not None:
+            raise item.error
+        return item.result
+
+    def _collect(self) -> List[_Write]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_items:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            groups: Dict[ConnectionPool, List[_Write]] = {}
+            for item in batch:
+                groups.setdefault(item.pool, []).append(item)
+            for pool, items in groups.items():
+                try:
+                    self._commit(pool, items)
+                except BaseException as e:
+                    logger.exception("Error en group commit (%d escrituras)", len(items))
+                    with self._lock:
+                        self._metrics['failed_batches'] += 1
+                    for item in items:
+                        item.result, item.error = None, e
+            for item in batch:
+                item.done.set()
+
+    def _commit(self, pool: ConnectionPool, batch: List[_Write]) -> None:
+        failed = 0
+        batch = [item for item in batch if item.start()]
+        if not batch:
+            return
+        with pool.transaction() as conn:
+            for item in batch:
+                conn.execute('SAVEPOINT group_write')
+                try:
+                    item.result = item.fn(conn)
+                except Exception as e:
+                    conn.execute('ROLLBACK TO group_write')
+                    item.error = e
+                    failed += 1
+                conn.execute('RELEASE group_write')
+        with self._lock:
+            self._metrics['batches'] += 1
+            self._metrics['writes'] += len(batch)
+            self._metrics['failed_writes'] += failed
+            self._metrics['max_batch'] = max(self._metrics['max_batch'], len(batch))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self._metrics)
+        metrics['avg_batch'] = round(metrics['writes'] / metrics['batches'], 1) if metrics['batches'] else 0.0
+        metrics['queued'] = self._queue.qsize()
+        return metrics
+
+
+_writer: Optional[GroupCommitWriter] = GroupCommitWriter() if GROUP_COMMIT else None
+
+
+def _after_fork():
+    # El hilo escritor no sobrevive al fork: cada worker arranca el suyo
+    global _writer
+    if _writer is not None:
+        _writer = GroupCommitWriter(_writer.window * 1000, _writer.max_items, _writer.timeout)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def configure_group_commit(enabled: bool, window_ms: float = GROUP_COMMIT_WINDOW_MS,
+                           max_items: int = GROUP_COMMIT_MAX_ITEMS) -> None:
+    """Activa o desactiva el group commit del proceso (benchmarks, tests)"""
+    global _writer
+    _writer = GroupCommitWriter(window_ms, max_items) if enabled else None
+
+
+def write(fn: Callable[[Any], Any]) -> Any:
+    """
+    Ejecuta fn(conn) en una transacción de escritura y retorna su
+    resultado una vez confirmada (agrupada con otras si hay group commit)
+    """
+    writer = _writer
+    if writer is None:
+        with transaction() as conn:
+            return fn(conn)
+    return writer.submit(fn)
+
+
+def group_commit_stats() -> Optional[Dict[str, Any]]:
+    """Métricas del escritor del proceso (None si está desactivado)"""
+    return _writer.stats() if _writer is not None else None
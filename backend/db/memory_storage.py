@@ -0,0 +1,285 @@
+"""
+Motor de almacenamiento en memoria (ver db/storage.py)
+
+Todo vive en diccionarios del proceso, detrás de un lock:
+
+- las filas por id, como [id, user_id, description, amount_cents,
+  category, type, created_at];
+- por usuario, la lista ordenada de claves (created_at, id): el listado y
+  el streaming la recorren de atrás hacia adelante con bisect, igual que
+  el keyset de SQLite sobre idx_transactions_user_created;
+- por usuario, los totales por (tipo, categoría), mantenidos en cada
+  escritura como hacen los triggers de db/rollups.py;
+- la versión de datos y las huellas de importación de cada usuario;
+- las sesiones por hash de token: [user_id, expires_at, last_seen].
+
+Reglas y correcciones de categoría solo se escriben por rutas que este
+motor no atiende (responden 501), así que cada usuario tiene reglas y
+modelo vacíos, versión 0: el categorizador usa solo las reglas globales.
+
+No hay persistencia ni se comparte entre procesos: sirve para tests y
+benchmarks, no para producción.
+"""
+import itertools
+import threading
+from bisect import bisect_left, insort
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from db.models import (
+    LIST_COLUMNS, PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX, STREAM_BATCH_SIZE, STREAM_FIRST_BATCH, Transaction
+)
+from db.rollups import summarize_stats
+from db.storage import ImportRow, NewRow, Storage
+from utils.money import to_cents
+
+# Posiciones dentro de cada fila
+_ID, _USER, _DESC, _AMOUNT, _CATEGORY, _TYPE, _CREATED = range(7)
+
+
+class MemoryStorage(Storage):
+    """Usuarios y transacciones en diccionarios e índices ordenados"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._user_ids = itertools.count(1)
+        self._trans_ids = itertools.count(1)
+        self._users: Dict[int, Dict[str, Any]] = {}
+        self._by_username: Dict[str, int] = {}
+        self._rows: Dict[int, List[Any]] = {}
+        self._keys: Dict[int, List[Tuple[str, int]]] = {}
+        self._totals: Dict[int, Dict[Tuple[str, str], List[int]]] = {}
+        self._versions: Dict[int, int] = {}
+        self._fingerprints: Dict[int, Set[str]] = {}
+        self._sessions: Dict[str, List[Any]] = {}
+
+    # ==================== USERS ====================
+
+    def create_user(self, username, password_hash, password_salt):
+        with self._lock:
+            if username in self._by_username:
+                return None
+            user_id = next(self._user_ids)
+            self._users[user_id] = {'id': user_id, 'username': username,
+                                    'password_hash': password_hash, 'password_salt': password_salt}
+            self._by_username[username] = user_id
+            return user_id
+
+    def get_user(self, username):
+        with self._lock:
+            user_id = self._by_username.get(username)
+            return dict(self._users[user_id]) if user_id is not None else None
+
+    def set_password(self, user_id, password_hash, password_salt):
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is not None:
+                user['password_hash'], user['password_salt'] = password_hash, password_salt
+
+    # ==================== SESSIONS ====================
+
+    def create_session(self, token_hash, user_id, expires_at):
+        with self._lock:
+            self._sessions[token_hash] = [user_id, expires_at, datetime.now().isoformat()]
+
+    def get_session(self, token_hash):
+        with self._lock:
+            session = self._sessions.get(token_hash)
+            return {'user_id': session[0], 'expires_at': session[1]} if session else None
+
+    def delete_session(self, token_hash):
+        with self._lock:
+            return self._sessions.pop(token_hash, None) is not None
+
+    def touch_sessions(self, items):
+        with self._lock:
+            for last_seen, token_hash in items:
+                session = self._sessions.get(token_hash)
+                if session is not None:
+                    session[2] = last_seen
+
+    def purge_sessions(self):
+        now = datetime.now().isoformat()
+        with self._lock:
+            expired = [key for key, session in self._sessions.items() if session[1] < now]
+            for key in expired:
+                del self._sessions[key]
+            return len(expired)
+
+    # ==================== CATEGORIZATION ====================
+
+    def rules_version(self, user_id):
+        return 0
+
+    def load_rules(self, user_id):
+        return 0, []
+
+    def model_version(self, user_id):
+        return 0
+
+    def load_model(self, user_id, max_tokens):
+        return None
+
+    # ==================== TRANSACTIONS ====================
+
+    def _add(self, trans_id: int, user_id: int, description: str, amount_cents: int, category: str,
+             trans_type: str, created_at: str) -> None:
+        # Con el lock tomado
+        row = [trans_id, user_id, description, amount_cents, category, trans_type, created_at]
+        self._rows[trans_id] = row
+        insort(self._keys.setdefault(user_id, []), (created_at, trans_id))
+        self._count(row, 1)
+
+    def _count(self, row: List[Any], sign: int) -> None:
+        # Suma (o resta) la fila de sus totales y cambia la versión del usuario
+        totals = self._totals.setdefault(row[_USER], {})
+        key = (row[_TYPE] or '', row[_CATEGORY] or '')
+        entry = totals.setdefault(key, [0, 0])
+        entry[0] += sign
+        entry[1] += sign * row[_AMOUNT]
+        if entry[0] <= 0:
+            del totals[key]
+        self._versions[row[_USER]] = self._versions.get(row[_USER], 0) + 1
+
+    def _owned(self, trans_id: int, user_id: int) -> Optional[List[Any]]:
+        row = self._rows.get(trans_id)
+        return row if row is not None and row[_USER] == user_id else None
+
+    def create_transaction(self, user_id, description, amount_cents, category, trans_type, created_at=None):
+        created_at = created_at or datetime.now().isoformat()
+        with self._lock:
+            trans_id = next(self._trans_ids)
+            self._add(trans_id, user_id, description, amount_cents, category, trans_type, created_at)
+            return trans_id
+
+    def get_transaction(self, trans_id, user_id):
+        with self._lock:
+            row = self._owned(trans_id, user_id)
+            return dict(zip(LIST_COLUMNS, _list_row(row))) if row else None
+
+    def update_transaction(self, trans_id, user_id, description, amount_cents, category, trans_type):
+        with self._lock:
+            row = self._owned(trans_id, user_id)
+            if row is None:
+                return False
+            self._count(row, -1)
+            row[_DESC], row[_AMOUNT], row[_CATEGORY], row[_TYPE] = description, amount_cents, category, trans_type
+            self._count(row, 1)
+            return True
+
+    def delete_transaction(self, trans_id, user_id):
+        with self._lock:
+            row = self._owned(trans_id, user_id)
+            if row is None:
+                return False
+            del self._rows[trans_id]
+            keys = self._keys[user_id]
+            del keys[bisect_left(keys, (row[_CREATED], trans_id))]
+            self._count(row, -1)
+            return True
+
+    def _select(self, user_id: int, limit: int, cursor: Optional[str],
+                filters: Optional[Dict[str, Any]]) -> List[Tuple]:
+        """Hasta `limit` filas del listado, (created_at, id) descendente"""
+        filters = filters or {}
+        start = Transaction.decode_cursor(cursor) if cursor is not None else None
+        category, trans_type = filters.get('category'), filters.get('type')
+        min_cents = to_cents(filters['min_amount']) if filters.get('min_amount') is not None else None
+        max_cents = to_cents(filters['max_amount']) if filters.get('max_amount') is not None else None
+
+        with self._lock:
+            keys = self._keys.get(user_id, [])
+            # Rango de claves: [date_from, min(date_to, cursor))
+            hi = len(keys)
+            if filters.get('date_to') is not None:
+                hi = bisect_left(keys, (filters['date_to'],))
+            if start is not None:
+                hi = min(hi, bisect_left(keys, start))
+            lo = bisect_left(keys, (filters['date_from'],)) if filters.get('date_from') is not None else 0
+
+            result = []
+            for index in range(hi - 1, lo - 1, -1):
+                row = self._rows[keys[index][1]]
+                if category is not None and row[_CATEGORY] != category:
+                    continue
+                if trans_type is not None and row[_TYPE] != trans_type:
+                    continue
+                if min_cents is not None and row[_AMOUNT] < min_cents:
+                    continue
+                if max_cents is not None and row[_AMOUNT] > max_cents:
+                    continue
+                result.append(_list_row(row))
+                if len(result) == limit:
+                    break
+        return result
+
+    def list_page(self, user_id, limit=PAGE_SIZE_DEFAULT, cursor=None, filters=None):
+        limit = max(1, min(limit, PAGE_SIZE_MAX))
+        rows = self._select(user_id, limit + 1, cursor, filters)
+        transactions = [dict(zip(LIST_COLUMNS, row)) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = transactions[-1]
+            next_cursor = Transaction.encode_cursor(last['created_at'], last['id'])
+        return transactions, next_cursor
+
+    def iter_batches(self, user_id, cursor=None, filters=None, batch_size=STREAM_BATCH_SIZE):
+        if cursor is not None:
+            # Como en SQLite, un cursor inválido falla al pedir el listado
+            Transaction.decode_cursor(cursor)
+        return self._iter_batches(user_id, cursor, filters, batch_size)
+
+    def _iter_batches(self, user_id: int, cursor: Optional[str], filters: Optional[Dict[str, Any]],
+                      batch_size: int) -> Iterator[List[Tuple]]:
+        size = min(STREAM_FIRST_BATCH, batch_size)
+        while True:
+            rows = self._select(user_id, size, cursor, filters)
+            if rows:
+                yield rows
+            if len(rows) < size:
+                return
+            last = rows[-1]
+            cursor = Transaction.encode_cursor(last[5], last[0])
+            size = batch_size
+
+    def data_version(self, user_id):
+        with self._lock:
+            return self._versions.get(user_id, 0)
+
+    # ==================== STATS ====================
+
+    def get_stats(self, user_id):
+        with self._lock:
+            rows = sorted((trans_type, category, count, total)
+                          for (trans_type, category), (count, total) in self._totals.get(user_id, {}).items())
+        return summarize_stats(rows)
+
+    # ==================== BULK ====================
+
+    def create_many(self, user_id, rows: List[NewRow]):
+        now = datetime.now().isoformat()
+        ids = []
+        with self._lock:
+            for description, amount_cents, category, trans_type, created_at in rows:
+                trans_id = next(self._trans_ids)
+                self._add(trans_id, user_id, description, amount_cents, category, trans_type, created_at or now)
+                ids.append(trans_id)
+        return ids
+
+    def import_chunk(self, user_id, rows: List[ImportRow]):
+        inserted = 0
+        with self._lock:
+            seen = self._fingerprints.setdefault(user_id, set())
+            for fingerprint, description, amount_cents, category, trans_type, created_at in rows:
+                if fingerprint in seen:
+                    continue
+                seen.add(fingerprint)
+                self._add(next(self._trans_ids), user_id, description, amount_cents, category, trans_type,
+                          created_at)
+                inserted += 1
+        return inserted, len(rows) - inserted
+
+
+def _list_row(row: List[Any]) -> Tuple:
+    """Fila interna -> tupla con las columnas de LIST_COLUMNS"""
+    return (row[_ID], row[_DESC], row[_AMOUNT] / 100.0, row[_CATEGORY], row[_TYPE], row[_CREATED])
@@ -0,0 +1,488 @@
+"""
+Migraciones versionadas del esquema
+
+Cada migración tiene un número de versión; las aplicadas quedan
+registradas en schema_migrations. migrate() (lo llaman los init_db al
+arrancar) aplica las pendientes en orden y, si no hay ninguna, solo hace
+una lectura.
+
+- Migration: se aplica entera en una transacción.
+- BatchedMigration: para tablas grandes. Se divide en prepare / step /
+  finish y cada paso es una transacción corta con su checkpoint guardado
+  en schema_migrations.state, así otros escritores siguen trabajando entre
+  lotes y, si el proceso se corta, se retoma desde el último lote. Varios
+  procesos pueden correr migrate() a la vez: cada paso relee el estado con
+  el lock de escritura tomado.
+
+Con particiones (db/sharding.py) se migra cada archivo por separado: el
+esquema es el mismo en todos.
+
+    cd backend && python -m db.migrations status
+    cd backend && python -m db.migrations migrate [--batch-size 5000]
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from db.budgets import create_budgets
+from db.connection import connection, transaction, use_pool
+from db.corrections import create_corrections
+from db.recurring import create_recurring
+from db.rollups import create_rollups, rewrite_totals
+from db.search import backfill_step, create_search_index
+from db.sharding import create_sharding, pools, prepare_directory, shard_count
+from db.user_rules import create_user_rules
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_BATCH_SIZE = int(os.environ.get('MIGRATION_BATCH_SIZE', '5000'))
+# Pausa entre lotes para dejar pasar a otros escritores
+MIGRATION_BATCH_PAUSE = float(os.environ.get('MIGRATION_BATCH_PAUSE', '0.01'))
+
+_MIGRATIONS_TABLE = '''CREATE TABLE IF NOT EXISTS schema_migrations
+                       (version INTEGER PRIMARY KEY,
+                        name TEXT NOT NULL,
+                        state TEXT,
+                        started_at TIMESTAMP,
+                        applied_at TIMESTAMP)'''
+
+
+# ==================== EJECUCIÓN ====================
+
+def _load(conn, version: int):
+    return conn.execute('SELECT state, applied_at FROM schema_migrations WHERE version = ?',
+                        (version,)).fetchone()
+
+
+def _save_state(conn, migration: 'Migration', state: Dict[str, Any]) -> None:
+    conn.execute('''INSERT INTO schema_migrations (version, name, state, started_at)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (version) DO UPDATE SET state = excluded.state''',
+                 (migration.version, migration.name, json.dumps(state), datetime.now().isoformat()))
+
+
+def _mark_applied(conn, migration: 'Migration') -> None:
+    now = datetime.now().isoformat()
+    conn.execute('''INSERT INTO schema_migrations (version, name, started_at, applied_at)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (version) DO UPDATE SET state = NULL, applied_at = excluded.applied_at''',
+                 (migration.version, migration.name, now, now))
+
+
+class Migration:
+    """Migración que se aplica en una sola transacción"""
+
+    def __init__(self, version: int, name: str, apply: Optional[Callable] = None):
+        self.version = version
+        self.name = name
+        self._apply = apply
+
+    def apply(self, conn) -> None:
+        self._apply(conn)
+
+    def run(self, batch_size: int, pause: float) -> bool:
+        """Aplica la migración si falta; True si la aplicó este proceso"""
+        with transaction() as conn:
+            row = _load(conn, self.version)
+            if row is not None and row['applied_at']:
+                return False
+            self.apply(conn)
+            _mark_applied(conn, self)
+        return True
+
+
+class BatchedMigration(Migration):
+    """
+    Migración por lotes. Las subclases implementan:
+    prepare(conn) -> estado inicial, step(conn, estado, batch_size) -> True
+    al terminar (modifica el estado) y finish(conn, estado).
+    """
+
+    def prepare(self, conn) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def step(self, conn, state: Dict[str, Any], batch_size: int) -> bool:
+        raise NotImplementedError
+
+    def finish(self, conn, state: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def run(self, batch_size: int, pause: float) -> bool:
+        batches = 0
+        while True:
+            with transaction() as conn:
+                row = _load(conn, self.version)
+                if row is not None and row['applied_at']:
+                    return False
+                if row is None or row['state'] is None:
+                    state = self.prepare(conn)
+                    state['copied'] = False
+                    _save_state(conn, self, state)
+                    continue
+                state = json.loads(row['state'])
+                if state['copied']:
+                    self.finish(conn, state)
+                    _mark_applied(conn, self)
+                    return True
+                state['copied'] = self.step(conn, state, batch_size)
+                _save_state(conn, self, state)
+            batches += 1
+            if batches % 100 == 0:
+                logger.info("Migración %s: %d lotes, estado %s", self.name, batches, state)
+            if pause > 0:
+                time.sleep(pause)
+
+
+# ==================== 1: ESQUEMA INICIAL ====================
+
+# Versión de datos por usuario: sube con cada escritura en transactions
+# (la usan los ETag y la caché de respuestas, ver utils.http_cache)
+_BUMP_VERSION = '''INSERT INTO user_data_versions (user_id, version) VALUES ({row}.user_id, 1)
+                   ON CONFLICT (user_id) DO UPDATE SET version = version + 1;'''
+DATA_VERSION_TRIGGERS = [
+    f'''CREATE TRIGGER IF NOT EXISTS trg_data_version_insert AFTER INSERT ON transactions
+        BEGIN {_BUMP_VERSION.format(row='NEW')} END''',
+    f'''CREATE TRIGGER IF NOT EXISTS trg_data_version_delete AFTER DELETE ON transactions
+        BEGIN {_BUMP_VERSION.format(row='OLD')} END''',
+    f'''CREATE TRIGGER IF NOT EXISTS trg_data_version_update AFTER UPDATE ON transactions
+        BEGIN {_BUMP_VERSION.format(row='OLD')} {_BUMP_VERSION.format(row='NEW')} END''',
+]
+
+
+def _initial_schema(conn) -> None:
+    """
+    Esquema previo a las migraciones (lo que creaban los init_db). Todo es
+    IF NOT EXISTS: en una base existente no cambia nada.
+    """
+    conn.execute('''CREATE TABLE IF NOT EXISTS users
+                    (id INTEGER PRIMARY KEY,
+                     username TEXT UNIQUE NOT NULL,
+                     password_hash TEXT NOT NULL,
+                     password_salt TEXT NOT NULL,
+                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS transactions
+                    (id INTEGER PRIMARY KEY,
+                     user_id INTEGER NOT NULL,
+                     description TEXT NOT NULL,
+                     amount REAL NOT NULL,
+                     category TEXT,
+                     type TEXT DEFAULT 'expense',
+                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                     FOREIGN KEY (user_id) REFERENCES users (id))''')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_transactions_user_created
+                    ON transactions(user_id, created_at, id, type, category, amount)''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_user_category ON transactions(user_id, category, created_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_user_type ON transactions(user_id, type, created_at)')
+    conn.execute('DROP INDEX IF EXISTS idx_transactions_user')
+    conn.execute('DROP INDEX IF EXISTS idx_transactions_type')
+
+    # Huellas de movimientos importados (deduplicación de extractos)
+    conn.execute('''CREATE TABLE IF NOT EXISTS transaction_fingerprints
+                    (user_id INTEGER NOT NULL,
+                     fingerprint TEXT NOT NULL,
+                     transaction_id INTEGER,
+                     PRIMARY KEY (user_id, fingerprint)) WITHOUT ROWID''')
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS import_jobs
+                    (id INTEGER PRIMARY KEY,
+                     user_id INTEGER NOT NULL,
+                     filename TEXT,
+                     format TEXT,
+                     status TEXT NOT NULL DEFAULT 'pending',
+                     bytes_total INTEGER DEFAULT 0,
+                     bytes_read INTEGER DEFAULT 0,
+                     rows_read INTEGER DEFAULT 0,
+                     rows_imported INTEGER DEFAULT 0,
+                     rows_duplicate INTEGER DEFAULT 0,
+                     rows_invalid INTEGER DEFAULT 0,
+                     errors TEXT,
+                     created_at TIMESTAMP,
+                     updated_at TIMESTAMP,
+                     finished_at TIMESTAMP)''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_import_jobs_user ON import_jobs(user_id)')
+
+    # Sesiones (se guarda el SHA-256 del token, nunca el token)
+    conn.execute('''CREATE TABLE IF NOT EXISTS sessions
+                    (token_hash TEXT PRIMARY KEY,
+                     user_id INTEGER NOT NULL,
+                     created_at TIMESTAMP,
+                     expires_at TIMESTAMP NOT NULL,
+                     last_seen TIMESTAMP) WITHOUT ROWID''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions(user_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_at)')
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS user_data_versions
+                    (user_id INTEGER PRIMARY KEY,
+                     version INTEGER NOT NULL DEFAULT 0)''')
+    for trigger in DATA_VERSION_TRIGGERS:
+        conn.execute(trigger)
+
+
+# ==================== 2: MONTOS EN CENTAVOS ====================
+
+# Índices de transactions desde la migración 2. Orden del listado paginado
+# (created_at, id) por usuario, con type/category/monto incluidos para
+# filtrar sin leer la tabla.
+TRANSACTION_INDEXES = [
+    ('idx_tx_user_created', 'user_id, created_at, id, type, category, amount_cents'),
+    ('idx_tx_user_category', 'user_id, category, created_at'),
+    ('idx_tx_user_type', 'user_id, type, created_at'),
+]
+
+
+class AmountsToCents(BatchedMigration):
+    """
+    transactions.amount (REAL) -> amount_cents (INTEGER).
+
+    SQLite no cambia el tipo de una columna sin reescribir la tabla, así
+    que se copia a transactions_new por lotes de id. Mientras dura la
+    copia, triggers sobre la tabla vieja replican en la nueva cualquier
+    escritura (incluso de procesos con la versión anterior del código).
+    Al final, en una transacción corta, se reemplaza la tabla, se pasan
+    los totales precalculados a centavos y se recrean los triggers.
+    """
+
+    MIRROR_TRIGGERS = ('trg_migrate_cents_insert', 'trg_migrate_cents_update', 'trg_migrate_cents_delete')
+
+    def prepare(self, conn) -> Dict[str, Any]:
+        # Las bases creadas por el backend original tienen updated_at; las de db/models.py no
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(transactions)')}
+        has_updated_at = 'updated_at' in columns
+
+        conn.execute('''CREATE TABLE IF NOT EXISTS transactions_new
+                        (id INTEGER PRIMARY KEY,
+                         user_id INTEGER NOT NULL,
+                         description TEXT NOT NULL,
+                         amount_cents INTEGER NOT NULL,
+                         category TEXT,
+                         type TEXT DEFAULT 'expense',
+                         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                         updated_at TIMESTAMP,
+                         FOREIGN KEY (user_id) REFERENCES users (id))''')
+        # Los índices se mantienen durante la copia: el cambio final no los construye
+        for name, index_columns in TRANSACTION_INDEXES:
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON transactions_new({index_columns})')
+
+        copy = f'''INSERT OR REPLACE INTO transactions_new
+                   (id, user_id, description, amount_cents, category, type, created_at, updated_at)
+                   VALUES (NEW.id, NEW.user_id, NEW.description, CAST(round(NEW.amount * 100) AS INTEGER),
+                           NEW.category, NEW.type, NEW.created_at, {'NEW.updated_at' if has_updated_at else 'NULL'});'''
+        insert, update, delete = self.MIRROR_TRIGGERS
+        conn.execute(f'''CREATE TRIGGER IF NOT EXISTS {insert} AFTER INSERT ON transactions
+                         BEGIN {copy} END''')
+        conn.execute(f'''CREATE TRIGGER IF NOT EXISTS {update} AFTER UPDATE ON transactions
+                         BEGIN DELETE FROM transactions_new WHERE id = OLD.id; {copy} END''')
+        conn.execute(f'''CREATE TRIGGER IF NOT EXISTS {delete} AFTER DELETE ON transactions
+                         BEGIN DELETE FROM transactions_new WHERE id = OLD.id; END''')
+
+        max_id = conn.execute('SELECT MAX(id) FROM transactions').fetchone()[0] or 0
+        return {'last_id': 0, 'max_id': max_id, 'updated_at': 'updated_at' if has_updated_at else 'NULL'}
+
+    def step(self, conn, state: Dict[str, Any], batch_size: int) -> bool:
+        # Las filas con id > max_id llegaron después de prepare: ya las copió el trigger
+        bounds = (state['last_id'], state['max_id'], batch_size)
+        last = conn.execute('''SELECT MAX(id) FROM
+                               (SELECT id FROM transactions WHERE id > ? AND id <= ? ORDER BY id LIMIT ?)''',
+                            bounds).fetchone()[0]
+        if last is None:
+            return True
+        conn.execute(f'''INSERT OR REPLACE INTO transactions_new
+                         (id, user_id, description, amount_cents, category, type, created_at, updated_at)
+                         SELECT id, user_id, description, CAST(round(amount * 100) AS INTEGER),
+                                category, type, created_at, {state['updated_at']}
+                         FROM transactions WHERE id > ? AND id <= ?''',
+                     (state['last_id'], last))
+        state['last_id'] = last
+        return last >= state['max_id']
+
+    def finish(self, conn, state: Dict[str, Any]) -> None:
+        for trigger in self.MIRROR_TRIGGERS:
+            conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        # Borra también sus índices y los triggers de totales y de versión
+        conn.execute('DROP TABLE transactions')
+        conn.execute('ALTER TABLE transactions_new RENAME TO transactions')
+
+        for trigger in DATA_VERSION_TRIGGERS:
+            conn.execute(trigger)
+        # Totales existentes: REAL -> centavos; las tablas que falten se crean y llenan
+        rewrite_totals(conn, 'CAST(round(total * 100) AS INTEGER)')
+        create_rollups(conn)
+
+
+# ==================== 3: BÚSQUEDA DE TEXTO ====================
+
+class SearchIndex(BatchedMigration):
+    """
+    Índice FTS5 de descripciones (ver db/search.py). Los triggers se crean
+    primero, así las escrituras durante el llenado quedan indexadas; las
+    filas existentes se indexan por lotes de id.
+    """
+
+    def prepare(self, conn) -> Dict[str, Any]:
+        create_search_index(conn)
+        max_id = conn.execute('SELECT MAX(id) FROM transactions').fetchone()[0] or 0
+        return {'last_id': 0, 'max_id': max_id}
+
+    def step(self, conn, state: Dict[str, Any], batch_size: int) -> bool:
+        return backfill_step(conn, state, batch_size)
+
+    def finish(self, conn, state: Dict[str, Any]) -> None:
+        pass
+
+
+# ==================== 4: PRESUPUESTOS ====================
+
+# Los presupuestos son parte de los datos versionados del usuario (ETag, caché)
+BUDGET_VERSION_TRIGGERS = [
+    f'''CREATE TRIGGER IF NOT EXISTS trg_data_version_budget_insert AFTER INSERT ON budgets
+        BEGIN {_BUMP_VERSION.format(row='NEW')} END''',
+    f'''CREATE TRIGGER IF NOT EXISTS trg_data_version_budget_update AFTER UPDATE ON budgets
+        BEGIN {_BUMP_VERSION.format(row='NEW')} END''',
+    f'''CREATE TRIGGER IF NOT EXISTS trg_data_version_budget_delete AFTER DELETE ON budgets
+        BEGIN {_BUMP_VERSION.format(row='OLD')} END''',
+]
+
+
+def _budgets(conn) -> None:
+    """
+    Totales mensuales (se crean y llenan con un GROUP BY), presupuestos y
+    alertas (ver db/budgets.py)
+    """
+    create_rollups(conn)
+    create_budgets(conn)
+    for trigger in BUDGET_VERSION_TRIGGERS:
+        conn.execute(trigger)
+
+
+
+# ==================== 8: RECATEGORIZACIÓN ====================
+
+def _recategorize_jobs(conn) -> None:
+    """
+    Jobs de recategorización (utils/recategorizer.py). last_id es el punto
+    de control: se confirma junto con cada bloque, así un job interrumpido
+    sigue desde ahí.
+    """
+    conn.execute('''CREATE TABLE IF NOT EXISTS recategorize_jobs
+                    (id INTEGER PRIMARY KEY,
+                     user_id INTEGER,
+                     status TEXT NOT NULL DEFAULT 'pending',
+                     chunk_size INTEGER NOT NULL,
+                     last_id INTEGER NOT NULL DEFAULT 0,
+                     max_id INTEGER NOT NULL,
+                     rows_total INTEGER NOT NULL DEFAULT 0,
+                     rows_scanned INTEGER NOT NULL DEFAULT 0,
+                     rows_changed INTEGER NOT NULL DEFAULT 0,
+                     elapsed REAL NOT NULL DEFAULT 0,
+                     error TEXT,
+                     created_at TIMESTAMP,
+                     started_at TIMESTAMP,
+                     heartbeat_at TIMESTAMP,
+                     finished_at TIMESTAMP)''')
+    # El job conserva el tipo de los movimientos importados (sale del signo)
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_transaction_fingerprints_transaction
+                    ON transaction_fingerprints(transaction_id)''')
+
+
+# ==================== 9: PARTICIONES ====================
+
+def _sharding(conn) -> None:
+    """
+    Mapa de particiones, reparto de ids y marcas de usuarios movidos (ver
+    db/sharding.py). Un job de recategorización recorre los archivos en
+    orden: `pool` es el archivo de su punto de control.
+    """
+    create_sharding(conn)
+    conn.execute('ALTER TABLE recategorize_jobs ADD COLUMN pool INTEGER NOT NULL DEFAULT 0')
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, 'esquema_inicial', _initial_schema),
+    AmountsToCents(2, 'montos_en_centavos'),
+    SearchIndex(3, 'busqueda_texto'),
+    Migration(4, 'presupuestos', _budgets),
+    Migration(5, 'cargos_recurrentes', create_recurring),
+    Migration(6, 'categorizador_por_usuario', create_corrections),
+    Migration(7, 'reglas_por_usuario', create_user_rules),
+    Migration(8, 'recategorizacion', _recategorize_jobs),
+    Migration(9, 'particiones', _sharding),
+]
+
+
+def applied_versions() -> List[int]:
+    with connection() as conn:
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='schema_migrations'"
+        ).fetchone()
+        if not exists:
+            return []
+        return [row[0] for row in conn.execute(
+            'SELECT version FROM schema_migrations WHERE applied_at IS NOT NULL ORDER BY version')]
+
+
+def migrate(batch_size: int = MIGRATION_BATCH_SIZE, pause: float = MIGRATION_BATCH_PAUSE) -> List[int]:
+    """
+    Aplica las migraciones pendientes en cada archivo; retorna las
+    versiones aplicadas (en alguno de ellos)
+    """
+    applied = set()
+    for _, pool in pools():
+        with use_pool(pool):
+            applied.update(_migrate(batch_size, pause))
+    if shard_count():
+        prepare_directory()
+    return sorted(applied)
+
+
+def _migrate(batch_size: int, pause: float) -> List[int]:
+    """Migraciones pendientes del archivo activo"""
+    done = set(applied_versions())
+    pending = [m for m in MIGRATIONS if m.version not in done]
+    if not pending:
+        return []
+
+    with transaction() as conn:
+        conn.execute(_MIGRATIONS_TABLE)
+    applied = []
+    for migration in pending:
+        start = time.perf_counter()
+        if migration.run(batch_size, pause):
+            applied.append(migration.version)
+            logger.info("Migración %d (%s) aplicada en %.1fs",
+                        migration.version, migration.name, time.perf_counter() - start)
+    return applied
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='python -m db.migrations')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('status', help='versiones aplicadas y pendientes')
+    run = sub.add_parser('migrate', help='aplica las migraciones pendientes')
+    run.add_argument('--batch-size', type=int, default=MIGRATION_BATCH_SIZE)
+    run.add_argument('--pause', type=float, default=MIGRATION_BATCH_PAUSE)
+    args = parser.parse_args(argv[1:])
+
+    if args.command == 'migrate':
+        logging.basicConfig(level=logging.INFO, format='%(message)s')
+        applied = migrate(args.batch_size, args.pause)
+        print(f"{len(applied)} migración(es) aplicada(s)")
+
+    for label, pool in pools():
+        with use_pool(pool):
+            done = set(applied_versions())
+        if shard_count():
+            print(f"{label} ({pool.database})")
+        for migration in MIGRATIONS:
+            mark = 'aplicada ' if migration.version in done else 'pendiente'
+            print(f"{migration.version:>4}  {mark}  {migration.name}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
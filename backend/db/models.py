@@ -1,177 +1,841 @@
 """
 Módulo de modelos de base de datos
 """
+import base64
+import json
 import sqlite3
-from datetime import datetime
-from typing import List, Optional, Dict, Any
-from utils.security import hash_password, verify_password
+from datetime import date, datetime
+from typing import Callable, Iterator, List, Optional, Dict, Any, Tuple
+from db.budgets import evaluate_budget, spent_cents
+from db.connection import (
+    connection, directory_connection, directory_pool, directory_transaction, get_pool, transaction
+)
+from db.corrections import apply_correction, load_counts, model_version
+from db.group_commit import write
+from db.migrations import migrate
+from db.recurring import read_recurring, run as run_recurring
+from db.rollups import read_timeseries, read_user_stats
+from db.search import match_expression
+from db.sharding import allocate_ids, new_id, pools_for
+from db.user_rules import (
+    MAX_USER_RULES, RULE_FIELDS, bump_rules_version, load_rules as load_user_rules, rules_version
+)
+from utils.money import from_cents, to_cents
 
-DATABASE = 'expenses.db'
+PAGE_SIZE_DEFAULT = 50
+PAGE_SIZE_MAX = 500
+
+# Columnas del listado, en el orden en que las devuelve list_query
+LIST_COLUMNS = ('id', 'description', 'amount', 'category', 'type', 'created_at')
+
+# Filas por lote al recorrer el historial completo (streaming / export).
+# El primer lote es chico para que los primeros bytes salgan enseguida.
+STREAM_BATCH_SIZE = 1000
+STREAM_FIRST_BATCH = 100
 
 def init_db():
     """
-    Inicializa la base de datos con tablas
+    Inicializa la base de datos: aplica las migraciones pendientes
+    (el esquema vive en db/migrations.py)
     """
-    conn = sqlite3.connect(DATABASE)
-    c = conn.cursor()
-    
-    # Tabla de usuarios (mejorada con salt)
-    c.execute('''CREATE TABLE IF NOT EXISTS users
-                 (id INTEGER PRIMARY KEY,
-                  username TEXT UNIQUE NOT NULL,
-                  password_hash TEXT NOT NULL,
-                  password_salt TEXT NOT NULL,
-                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-    
-    # Tabla de transacciones
-    c.execute('''CREATE TABLE IF NOT EXISTS transactions
-                 (id INTEGER PRIMARY KEY,
-                  user_id INTEGER NOT NULL,
-                  description TEXT NOT NULL,
-                  amount REAL NOT NULL,
-                  category TEXT,
-                  type TEXT DEFAULT 'expense',
-                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                  FOREIGN KEY (user_id) REFERENCES users (id))''')
-    
-    conn.commit()
-    conn.close()
+    migrate()
 
 class User:
-    """Modelo de usuario"""
+    """Modelo de usuario (el alta y el login están en db/storage.py)"""
     
     @staticmethod
-    def create(username: str, password: str) -> Optional[int]:
-        """Crea nuevo usuario"""
-        password_hash, salt = hash_password(password)
-        
-        conn = sqlite3.connect(DATABASE)
-        c = conn.cursor()
-        
+    def insert(username: str, password_hash: str, password_salt: str) -> Optional[int]:
+        """Crea el usuario con la contraseña ya hasheada. None si el nombre existe"""
         try:
-            c.execute('INSERT INTO users (username, password_hash, password_salt) VALUES (?, ?, ?)',
-                      (username, password_hash, salt))
-            conn.commit()
-            user_id = c.lastrowid
-            conn.close()
-            return user_id
+            with directory_transaction() as conn:
+                c = conn.execute('INSERT INTO users (username, password_hash, password_salt) VALUES (?, ?, ?)',
+                                 (username, password_hash, password_salt))
+                return c.lastrowid
         except sqlite3.IntegrityError:
-            conn.close()
             return None
     
     @staticmethod
-    def authenticate(username: str, password: str) -> Optional[Dict[str, Any]]:
-        """Autentica usuario"""
-        conn = sqlite3.connect(DATABASE)
-        c = conn.cursor()
-        c.execute('SELECT id, password_hash, password_salt FROM users WHERE username = ?', (username,))
-        result = c.fetchone()
-        conn.close()
-        
-        if not result:
-            return None
-        
-        user_id, stored_hash, salt = result
-        
-        if verify_password(password, stored_hash, salt):
-            return {'id': user_id, 'username': username}
-        
-        return None
+    def get_by_username(username: str) -> Optional[Dict[str, Any]]:
+        """id, username, password_hash y password_salt del usuario"""
+        with directory_connection() as conn:
+            row = conn.execute('SELECT id, username, password_hash, password_salt FROM users WHERE username = ?',
+                               (username,)).fetchone()
+        return dict(row) if row else None
+    
+    @staticmethod
+    def set_password(user_id: int, password_hash: str, password_salt: str) -> None:
+        """Reemplaza el hash guardado (p. ej. al rehashear con parámetros nuevos)"""
+        with directory_transaction() as conn:
+            conn.execute('UPDATE users SET password_hash=?, password_salt=? WHERE id=?',
+                         (password_hash, password_salt, user_id))
 
 class Transaction:
     """Modelo de transacción"""
     
     @staticmethod
-    def create(user_id: int, description: str, amount: float, category: str, trans_type: str) -> Optional[int]:
-        """Crea nueva transacción"""
-        conn = sqlite3.connect(DATABASE)
-        c = conn.cursor()
+    def create(user_id: int, description: str, amount_cents: int, category: str, trans_type: str,
+               created_at: Optional[str] = None) -> Optional[int]:
+        """Crea nueva transacción (monto en centavos); con group commit se agrupa con otras"""
+        now = created_at or datetime.now().isoformat()
+        trans_id = new_id('transactions')
+        def insert(conn):
+            c = conn.execute('''INSERT INTO transactions 
+                                (id, user_id, description, amount_cents, category, type, created_at) 
+                                VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                             (trans_id, user_id, description, amount_cents, category, trans_type, now))
+            return c.lastrowid
+        return write(insert)
+    
+    @staticmethod
+    def create_many(user_id: int, rows: List[Tuple[str, int, str, str, Optional[str]]]) -> List[int]:
+        """
+        Inserta varias transacciones en una sola transacción (un único commit).
+        rows: (description, amount_cents, category, type, created_at o None)
+        Retorna los ids asignados, en el mismo orden.
+        """
+        if not rows:
+            return []
         
         now = datetime.now().isoformat()
-        c.execute('''INSERT INTO transactions 
-                     (user_id, description, amount, category, type, created_at) 
-                     VALUES (?, ?, ?, ?, ?, ?)''',
-                  (user_id, description, amount, category, trans_type, now))
-        conn.commit()
-        trans_id = c.lastrowid
-        conn.close()
+        ids = allocate_ids('transactions', len(rows))
+        params = [(user_id, desc, amount_cents, category, trans_type, created_at or now)
+                  for desc, amount_cents, category, trans_type, created_at in rows]
+        if ids is not None:
+            # Con particiones los ids vienen del directorio
+            with transaction() as conn:
+                conn.executemany('''INSERT INTO transactions 
+                                    (id, user_id, description, amount_cents, category, type, created_at) 
+                                    VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                                 [(trans_id,) + row for trans_id, row in zip(ids, params)])
+            return ids
+        
+        with transaction() as conn:
+            c = conn.cursor()
+            c.executemany('''INSERT INTO transactions 
+                             (user_id, description, amount_cents, category, type, created_at) 
+                             VALUES (?, ?, ?, ?, ?, ?)''', params)
+            last_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
         
-        return trans_id
+        # Con el lock de escritura tomado, los rowid asignados son consecutivos
+        first_id = last_id - len(params) + 1
+        return list(range(first_id, last_id + 1))
+    
+    @staticmethod
+    def get(trans_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+        """Transacción del usuario (columnas de LIST_COLUMNS) o None"""
+        with connection() as conn:
+            row = conn.execute('''SELECT id, description, amount_cents / 100.0, category, type, created_at
+                                  FROM transactions WHERE id=? AND user_id=?''', (trans_id, user_id)).fetchone()
+        return dict(zip(LIST_COLUMNS, row)) if row else None
     
     @staticmethod
     def get_all(user_id: int) -> List[Dict[str, Any]]:
         """Obtiene todas las transacciones del usuario"""
-        conn = sqlite3.connect(DATABASE)
-        c = conn.cursor()
-        c.execute('''SELECT id, description, amount, category, type, created_at 
-                     FROM transactions 
-                     WHERE user_id=? 
-                     ORDER BY created_at DESC''',
-                  (user_id,))
-        transactions = []
-        for row in c.fetchall():
-            transactions.append({
-                'id': row[0],
-                'description': row[1],
-                'amount': row[2],
-                'category': row[3],
-                'type': row[4],
-                'created_at': row[5]
-            })
-        conn.close()
+        with connection() as conn:
+            c = conn.execute('''SELECT id, description, amount_cents / 100.0, category, type, created_at 
+                                FROM transactions 
+                                WHERE user_id=? 
+                                ORDER BY created_at DESC''',
+                             (user_id,))
+            transactions = []
+            for row in c:
+                transactions.append({
+                    'id': row[0],
+                    'description': row[1],
+                    'amount': row[2],
+                    'category': row[3],
+                    'type': row[4],
+                    'created_at': row[5]
+                })
         return transactions
     
     @staticmethod
-    def update(trans_id: int, user_id: int, description: str, amount: float, category: str, trans_type: str) -> bool:
-        """Actualiza transacción"""
-        conn = sqlite3.connect(DATABASE)
-        c = conn.cursor()
-        c.execute('''UPDATE transactions 
-                     SET description=?, amount=?, category=?, type=? 
-                     WHERE id=? AND user_id=?''',
-                  (description, amount, category, trans_type, trans_id, user_id))
-        conn.commit()
-        success = c.rowcount > 0
-        conn.close()
-        return success
+    def encode_cursor(created_at: str, trans_id: int) -> str:
+        """Cursor opaco para la página siguiente"""
+        raw = json.dumps([created_at, trans_id], separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
     
     @staticmethod
-    def delete(trans_id: int, user_id: int) -> bool:
-        """Elimina transacción"""
-        conn = sqlite3.connect(DATABASE)
-        c = conn.cursor()
-        c.execute('DELETE FROM transactions WHERE id=? AND user_id=?', (trans_id, user_id))
-        conn.commit()
-        success = c.rowcount > 0
-        conn.close()
-        return success
+    def decode_cursor(cursor: str) -> Tuple[str, int]:
+        """Inverso de encode_cursor; ValueError si el cursor es inválido"""
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            created_at, trans_id = json.loads(raw)
+        except (ValueError, TypeError, UnicodeDecodeError):
+            raise ValueError('Cursor inválido')
+        if not isinstance(created_at, str) or not isinstance(trans_id, int):
+            raise ValueError('Cursor inválido')
+        return created_at, trans_id
     
     @staticmethod
-    def get_stats(user_id: int) -> Dict[str, Any]:
-        """Obtiene estadísticas del usuario"""
-        conn = sqlite3.connect(DATABASE)
-        c = conn.cursor()
+    def list_query(user_id: int, limit: int, cursor: Optional[str] = None,
+                   filters: Optional[Dict[str, Any]] = None) -> Tuple[str, List[Any]]:
+        """
+        SQL del listado por keyset sobre (created_at, id) descendente.
+        filters: date_from, date_to (exclusivo), category, type, min_amount, max_amount
+        """
+        filters = filters or {}
+        where = ['user_id = ?']
+        params: List[Any] = [user_id]
+        
+        if filters.get('date_from') is not None:
+            where.append('created_at >= ?')
+            params.append(filters['date_from'])
+        if filters.get('date_to') is not None:
+            where.append('created_at < ?')
+            params.append(filters['date_to'])
+        if filters.get('category') is not None:
+            where.append('category = ?')
+            params.append(filters['category'])
+        if filters.get('type') is not None:
+            where.append('type = ?')
+            params.append(filters['type'])
+        if filters.get('min_amount') is not None:
+            where.append('amount_cents >= ?')
+            params.append(to_cents(filters['min_amount']))
+        if filters.get('max_amount') is not None:
+            where.append('amount_cents <= ?')
+            params.append(to_cents(filters['max_amount']))
+        if cursor is not None:
+            where.append('(created_at, id) < (?, ?)')
+            params.extend(Transaction.decode_cursor(cursor))
         
-        # Total gastos
-        c.execute('SELECT SUM(amount) FROM transactions WHERE user_id=? AND type="expense"', (user_id,))
-        total_expenses = c.fetchone()[0] or 0
+        sql = f'''SELECT id, description, amount_cents / 100.0, category, type, created_at 
+                  FROM transactions 
+                  WHERE {' AND '.join(where)} 
+                  ORDER BY created_at DESC, id DESC 
+                  LIMIT ?'''
+        params.append(limit)
+        return sql, params
+    
+    @staticmethod
+    def list_page(user_id: int, limit: int = PAGE_SIZE_DEFAULT, cursor: Optional[str] = None,
+                  filters: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Página de transacciones del usuario (más recientes primero).
+        Retorna (transacciones, cursor de la página siguiente o None).
+        """
+        limit = max(1, min(limit, PAGE_SIZE_MAX))
+        sql, params = Transaction.list_query(user_id, limit + 1, cursor, filters)
         
-        # Total ingresos
-        c.execute('SELECT SUM(amount) FROM transactions WHERE user_id=? AND type="income"', (user_id,))
-        total_income = c.fetchone()[0] or 0
+        with connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        
+        transactions = [{
+            'id': row[0],
+            'description': row[1],
+            'amount': row[2],
+            'category': row[3],
+            'type': row[4],
+            'created_at': row[5]
+        } for row in rows[:limit]]
+        
+        next_cursor = None
+        if len(rows) > limit:
+            last = transactions[-1]
+            next_cursor = Transaction.encode_cursor(last['created_at'], last['id'])
+        return transactions, next_cursor
+    
+    @staticmethod
+    def iter_batches(user_id: int, cursor: Optional[str] = None,
+                     filters: Optional[Dict[str, Any]] = None,
+                     batch_size: int = STREAM_BATCH_SIZE) -> Iterator[List[Tuple]]:
+        """
+        Recorre todas las transacciones del listado en lotes de tuplas
+        (columnas de LIST_COLUMNS). Cada lote es una consulta keyset con su
+        propia conexión del pool: no se retiene una conexión ni una
+        transacción de lectura abierta mientras el cliente consume.
+        """
+        # El pool se fija ahora: el recorrido sigue después de que la vista retorna
+        return Transaction._iter_batches(get_pool(), user_id, cursor, filters, batch_size)
+    
+    @staticmethod
+    def _iter_batches(pool, user_id: int, cursor: Optional[str], filters: Optional[Dict[str, Any]],
+                      batch_size: int) -> Iterator[List[Tuple]]:
+        size = min(STREAM_FIRST_BATCH, batch_size)
+        while True:
+            sql, params = Transaction.list_query(user_id, size, cursor, filters)
+            with pool.connection() as conn:
+                rows = conn.execute(sql, params).fetchall()
+            if rows:
+                yield rows
+            if len(rows) < size:
+                return
+            last = rows[-1]
+            cursor = Transaction.encode_cursor(last[5], last[0])
+            size = batch_size
+    
+    @staticmethod
+    def search(user_id: int, query: str, limit: int = PAGE_SIZE_DEFAULT,
+               cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Búsqueda de texto en las descripciones (db/search.py), de más a
+        menos relevante. Keyset sobre (rank, id); el cursor es opaco como
+        el del listado. ValueError si la búsqueda o el cursor son inválidos.
+        """
+        limit = max(1, min(limit, PAGE_SIZE_MAX))
+        where = ['transactions_fts MATCH ?', 't.user_id = ?']
+        params: List[Any] = [match_expression(user_id, query), user_id]
+        if cursor is not None:
+            rank, trans_id = Transaction.decode_search_cursor(cursor)
+            where.append('(f.rank, t.id) > (?, ?)')
+            params.extend((rank, trans_id))
+        params.append(limit + 1)
         
-        # Por categoría
-        c.execute('''SELECT category, COUNT(*), SUM(amount) 
-                     FROM transactions 
-                     WHERE user_id=? AND type="expense" 
-                     GROUP BY category''', (user_id,))
-        by_category = [{'category': row[0], 'count': row[1], 'total': row[2]} for row in c.fetchall()]
+        with connection() as conn:
+            rows = conn.execute(f'''SELECT t.id, t.description, t.amount_cents / 100.0, t.category,
+                                           t.type, t.created_at, f.rank
+                                    FROM transactions_fts f JOIN transactions t ON t.id = f.rowid
+                                    WHERE {' AND '.join(where)}
+                                    ORDER BY f.rank, t.id
+                                    LIMIT ?''', params).fetchall()
         
-        conn.close()
+        transactions = [dict(zip(LIST_COLUMNS, row[:6])) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = Transaction.encode_search_cursor(last[6], last[0])
+        return transactions, next_cursor
+    
+    @staticmethod
+    def encode_search_cursor(rank: float, trans_id: int) -> str:
+        raw = json.dumps([rank, trans_id], separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+    
+    @staticmethod
+    def decode_search_cursor(cursor: str) -> Tuple[float, int]:
+        """Inverso de encode_search_cursor; ValueError si el cursor es inválido"""
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            rank, trans_id = json.loads(raw)
+        except (ValueError, TypeError, UnicodeDecodeError):
+            raise ValueError('Cursor inválido')
+        if isinstance(rank, bool) or not isinstance(rank, (int, float)) or not isinstance(trans_id, int):
+            raise ValueError('Cursor inválido')
+        return float(rank), trans_id
+    
+    @staticmethod
+    def update(trans_id: int, user_id: int, description: str, amount_cents: int, category: str, trans_type: str) -> bool:
+        """Actualiza transacción (monto en centavos)"""
+        def update(conn):
+            c = conn.execute('''UPDATE transactions 
+                                SET description=?, amount_cents=?, category=?, type=?, updated_at=? 
+                                WHERE id=? AND user_id=?''',
+                             (description, amount_cents, category, trans_type, datetime.now().isoformat(),
+                              trans_id, user_id))
+            return c.rowcount > 0
+        return write(update)
+    
+    @staticmethod
+    def delete(trans_id: int, user_id: int) -> bool:
+        """Elimina transacción"""
+        def delete(conn):
+            c = conn.execute('DELETE FROM transactions WHERE id=? AND user_id=?', (trans_id, user_id))
+            return c.rowcount > 0
+        return write(delete)
+    
+    @staticmethod
+    def data_version(user_id: int) -> int:
+        """Versión de los datos del usuario (cambia con cada escritura)"""
+        with connection() as conn:
+            row = conn.execute('SELECT version FROM user_data_versions WHERE user_id=?',
+                               (user_id,)).fetchone()
+        return row[0] if row else 0
+    
+    @staticmethod
+    def get_stats(user_id: int) -> Dict[str, Any]:
+        """Obtiene estadísticas del usuario (desde user_category_totals)"""
+        with connection() as conn:
+            return read_user_stats(conn, user_id)
+    
+    @staticmethod
+    def get_timeseries(user_id: int, granularity: str, date_from: date, date_to: date,
+                       compare: bool = False) -> Dict[str, Any]:
+        """Serie temporal de ingresos/gastos (desde user_daily_totals)"""
+        with connection() as conn:
+            return read_timeseries(conn, user_id, granularity, date_from, date_to, compare)
+
+    @staticmethod
+    def import_chunk(user_id: int, rows: List[Tuple[str, str, int, str, str, str]],
+                     job_id: Optional[int] = None, progress: Optional[Dict[str, Any]] = None) -> Tuple[int, int]:
+        """
+        Inserta un bloque de movimientos importados descartando los que ya
+        existen según su huella. Todo el bloque (y el progreso del job, si se
+        indica) se confirma en una sola transacción.
+        rows: (fingerprint, description, amount_cents, category, type, created_at)
+        Retorna (insertados, duplicados).
+        """
+        inserted = 0
+        ids = iter(allocate_ids('transactions', len(rows)) or [None] * len(rows))
+        with transaction() as conn:
+            c = conn.cursor()
+            if rows:
+                placeholders = ','.join('?' * len(rows))
+                c.execute(f'''SELECT fingerprint FROM transaction_fingerprints
+                              WHERE user_id=? AND fingerprint IN ({placeholders})''',
+                          [user_id] + [row[0] for row in rows])
+                existing = {row[0] for row in c.fetchall()}
+                
+                for fingerprint, description, amount_cents, category, trans_type, created_at in rows:
+                    if fingerprint in existing:
+                        continue
+                    existing.add(fingerprint)
+                    c.execute('''INSERT INTO transactions 
+                                 (id, user_id, description, amount_cents, category, type, created_at) 
+                                 VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                              (next(ids), user_id, description, amount_cents, category, trans_type, created_at))
+                    c.execute('''INSERT INTO transaction_fingerprints (user_id, fingerprint, transaction_id)
+                                 VALUES (?, ?, ?)''', (user_id, fingerprint, c.lastrowid))
+                    inserted += 1
+            
+            duplicates = len(rows) - inserted
+            if job_id is not None:
+                ImportJob._update(conn, job_id, progress or {}, inserted, duplicates)
         
+        return inserted, duplicates
+
+class ImportJob:
+    """Estado y progreso de una importación de extracto"""
+    
+    FIELDS = ('id', 'user_id', 'filename', 'format', 'status', 'bytes_total', 'bytes_read',
+              'rows_read', 'rows_imported', 'rows_duplicate', 'rows_invalid', 'errors',
+              'created_at', 'updated_at', 'finished_at')
+    
+    @staticmethod
+    def create(user_id: int, filename: str, fmt: str, bytes_total: int) -> int:
+        """Registra una importación pendiente"""
+        now = datetime.now().isoformat()
+        job_id = new_id('import_jobs')
+        with transaction() as conn:
+            c = conn.execute('''INSERT INTO import_jobs 
+                                (id, user_id, filename, format, status, bytes_total, created_at, updated_at) 
+                                VALUES (?, ?, ?, ?, 'pending', ?, ?, ?)''',
+                             (job_id, user_id, filename, fmt, bytes_total, now, now))
+            return c.lastrowid
+    
+    @staticmethod
+    def _update(conn, job_id: int, progress: Dict[str, Any], inserted: int = 0, duplicates: int = 0):
+        conn.execute('''UPDATE import_jobs
+                        SET bytes_read=COALESCE(?, bytes_read),
+                            rows_read=COALESCE(?, rows_read),
+                            rows_invalid=COALESCE(?, rows_invalid),
+                            errors=COALESCE(?, errors),
+                            status=COALESCE(?, status),
+                            rows_imported=rows_imported + ?,
+                            rows_duplicate=rows_duplicate + ?,
+                            updated_at=?
+                        WHERE id=?''',
+                     (progress.get('bytes_read'), progress.get('rows_read'),
+                      progress.get('rows_invalid'), progress.get('errors'), progress.get('status'),
+                      inserted, duplicates, datetime.now().isoformat(), job_id))
+    
+    @staticmethod
+    def update(job_id: int, **progress) -> None:
+        """Actualiza progreso/estado (bytes_read, rows_read, rows_invalid, errors, status)"""
+        with transaction() as conn:
+            ImportJob._update(conn, job_id, progress)
+    
+    @staticmethod
+    def finish(job_id: int, status: str, **progress) -> None:
+        """Marca la importación como terminada ('done' o 'failed')"""
+        with transaction() as conn:
+            ImportJob._update(conn, job_id, dict(progress, status=status))
+            conn.execute('UPDATE import_jobs SET finished_at=? WHERE id=?',
+                         (datetime.now().isoformat(), job_id))
+    
+    @staticmethod
+    def get(job_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+        """Obtiene la importación (verifica pertenencia)"""
+        with connection() as conn:
+            row = conn.execute(f'''SELECT {', '.join(ImportJob.FIELDS)} FROM import_jobs 
+                                   WHERE id=? AND user_id=?''', (job_id, user_id)).fetchone()
+        return dict(row) if row else None
+
+class Budget:
+    """Presupuestos mensuales por categoría y sus alertas (ver db/budgets.py)"""
+    
+    FIELDS = ('id', 'category', 'month', 'limit_cents', 'created_at', 'updated_at')
+    ALERT_FIELDS = ('id', 'budget_id', 'category', 'month', 'threshold', 'spent_cents',
+                    'limit_cents', 'created_at')
+    
+    @staticmethod
+    def _to_api(row, spent: int) -> Dict[str, Any]:
+        limit = row['limit_cents']
         return {
-            'total_expenses': total_expenses,
-            'total_income': total_income,
-            'balance': total_income - total_expenses,
-            'by_category': by_category
+            'id': row['id'],
+            'category': row['category'],
+            'month': row['month'],
+            'limit': from_cents(limit),
+            'spent': from_cents(spent),
+            'remaining': from_cents(limit - spent),
+            'percent': round(100.0 * spent / limit, 1),
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at'],
         }
+    
+    @staticmethod
+    def upsert(user_id: int, category: str, month: str, limit_cents: int) -> Tuple[Dict[str, Any], bool]:
+        """
+        Crea el presupuesto o cambia su límite y reevalúa sus alertas en la
+        misma transacción. Retorna (presupuesto, creado).
+        """
+        now = datetime.now().isoformat()
+        budget_id = new_id('budgets')
+        with transaction() as conn:
+            existing = conn.execute('SELECT id FROM budgets WHERE user_id=? AND category=? AND month=?',
+                                    (user_id, category, month)).fetchone()
+            if existing is None:
+                conn.execute('''INSERT INTO budgets (id, user_id, category, month, limit_cents, created_at, updated_at)
+                                VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                             (budget_id, user_id, category, month, limit_cents, now, now))
+            else:
+                conn.execute('UPDATE budgets SET limit_cents=?, updated_at=? WHERE id=?',
+                             (limit_cents, now, existing[0]))
+            row = dict(conn.execute(f'''SELECT user_id, {', '.join(Budget.FIELDS)} FROM budgets
+                                        WHERE user_id=? AND category=? AND month=?''',
+                                    (user_id, category, month)).fetchone())
+            evaluate_budget(conn, row)
+            spent = spent_cents(conn, user_id, category, month)
+        return Budget._to_api(row, spent), existing is None
+    
+    @staticmethod
+    def list_month(user_id: int, month: str) -> List[Dict[str, Any]]:
+        """Presupuestos del mes con lo gastado (desde user_monthly_totals)"""
+        with connection() as conn:
+            rows = conn.execute(f'''SELECT {', '.join('b.' + field for field in Budget.FIELDS)},
+                                           COALESCE(t.total, 0) AS spent
+                                    FROM budgets b
+                                    LEFT JOIN user_monthly_totals t
+                                      ON t.user_id = b.user_id AND t.month = b.month
+                                     AND t.type = 'expense' AND t.category = b.category
+                                    WHERE b.user_id=? AND b.month=?
+                                    ORDER BY b.category''', (user_id, month)).fetchall()
+        return [Budget._to_api(row, row['spent']) for row in rows]
+    
+    @staticmethod
+    def delete(budget_id: int, user_id: int) -> bool:
+        """Elimina el presupuesto y sus alertas"""
+        with transaction() as conn:
+            c = conn.execute('DELETE FROM budgets WHERE id=? AND user_id=?', (budget_id, user_id))
+            if c.rowcount == 0:
+                return False
+            conn.execute('DELETE FROM budget_alerts WHERE budget_id=?', (budget_id,))
+            return True
+    
+    @staticmethod
+    def alerts(user_id: int, after_id: int = 0, limit: int = 50) -> List[Dict[str, Any]]:
+        """Alertas con id mayor que after_id, de la más vieja a la más nueva"""
+        with connection() as conn:
+            rows = conn.execute(f'''SELECT {', '.join(Budget.ALERT_FIELDS)} FROM budget_alerts
+                                    WHERE user_id=? AND id > ?
+                                    ORDER BY id LIMIT ?''', (user_id, after_id, limit)).fetchall()
+        alerts = []
+        for row in rows:
+            alert = dict(row)
+            alert['spent'] = from_cents(alert.pop('spent_cents'))
+            alert['limit'] = from_cents(alert.pop('limit_cents'))
+            alerts.append(alert)
+        return alerts
+
+class Recurring:
+    """Cargos recurrentes detectados (ver db/recurring.py)"""
+    
+    @staticmethod
+    def for_user(user_id: int, today: Optional[date] = None) -> List[Dict[str, Any]]:
+        """
+        Cargos recurrentes del usuario. Si tiene datos nuevos desde el último
+        análisis (el job no corrió todavía) se lo analiza primero, solo a él.
+        """
+        run_recurring(user_ids=[user_id])
+        with connection() as conn:
+            return read_recurring(conn, user_id, today or date.today())
+
+class CategoryModel:
+    """Correcciones de categoría y conteos del modelo por usuario (ver db/corrections.py)"""
+    
+    @staticmethod
+    def version(user_id: int) -> int:
+        """Versión del modelo (sube con cada corrección)"""
+        with connection() as conn:
+            return model_version(conn, user_id)
+    
+    @staticmethod
+    def load(user_id: int, max_tokens: int) -> Optional[Dict[str, Any]]:
+        """Conteos del modelo (None si el usuario no corrigió nada)"""
+        with connection() as conn:
+            return load_counts(conn, user_id, max_tokens)
+    
+    @staticmethod
+    def correct(user_id: int, trans_id: int, category: str, trans_type: str,
+                tokenize: Callable[[str], List[str]], max_tokens: int) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """
+        Cambia la categoría de la transacción y suma su descripción
+        (tokenizada) a los conteos, en una transacción.
+        Retorna (descripción, conteos nuevos) o None si no existe.
+        """
+        now = datetime.now().isoformat()
+        with transaction() as conn:
+            row = conn.execute('SELECT description FROM transactions WHERE id=? AND user_id=?',
+                               (trans_id, user_id)).fetchone()
+            if row is None:
+                return None
+            apply_correction(conn, user_id, trans_id, tokenize(row[0]), category, now)
+            conn.execute('UPDATE transactions SET category=?, type=? WHERE id=? AND user_id=?',
+                         (category, trans_type, trans_id, user_id))
+            return row[0], load_counts(conn, user_id, max_tokens)
+
+class UserRule:
+    """Reglas de categorización del usuario (ver db/user_rules.py)"""
+    
+    @staticmethod
+    def _to_api(rule: Dict[str, Any]) -> Dict[str, Any]:
+        rule = dict(rule)
+        for field in ('min_amount', 'max_amount'):
+            cents = rule.pop(field + '_cents')
+            rule[field] = from_cents(cents) if cents is not None else None
+        return rule
+    
+    @staticmethod
+    def version(user_id: int) -> int:
+        """Versión de las reglas (sube con cada cambio)"""
+        with connection() as conn:
+            return rules_version(conn, user_id)
+    
+    @staticmethod
+    def load(user_id: int) -> Tuple[int, List[Dict[str, Any]]]:
+        """(versión, reglas en orden de evaluación), para compilar el matcher"""
+        with connection() as conn:
+            return load_user_rules(conn, user_id)
+    
+    @staticmethod
+    def get_all(user_id: int) -> List[Dict[str, Any]]:
+        """Reglas del usuario en orden de evaluación"""
+        return [UserRule._to_api(rule) for rule in UserRule.load(user_id)[1]]
+    
+    @staticmethod
+    def create(user_id: int, rule: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Crea una regla. None si el usuario ya tiene MAX_USER_RULES"""
+        now = datetime.now().isoformat()
+        rule_id = new_id('user_rules')
+        with transaction() as conn:
+            count = conn.execute('SELECT COUNT(*) FROM user_rules WHERE user_id=?', (user_id,)).fetchone()[0]
+            if count >= MAX_USER_RULES:
+                return None
+            c = conn.execute('''INSERT INTO user_rules
+                                (id, user_id, match, pattern, min_amount_cents, max_amount_cents,
+                                 category, type, priority, created_at, updated_at)
+                                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                             (rule_id, user_id, rule['match'], rule['pattern'], rule['min_amount_cents'],
+                              rule['max_amount_cents'], rule['category'], rule['type'],
+                              rule['priority'], now, now))
+            bump_rules_version(conn, user_id, now)
+            row = conn.execute(f"SELECT {', '.join(RULE_FIELDS)} FROM user_rules WHERE id=?",
+                               (c.lastrowid,)).fetchone()
+        return UserRule._to_api(dict(zip(RULE_FIELDS, row)))
+    
+    @staticmethod
+    def update(rule_id: int, user_id: int, rule: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Reemplaza una regla. None si no existe"""
+        now = datetime.now().isoformat()
+        with transaction() as conn:
+            c = conn.execute('''UPDATE user_rules
+                                SET match=?, pattern=?, min_amount_cents=?, max_amount_cents=?,
+                                    category=?, type=?, priority=?, updated_at=?
+                                WHERE id=? AND user_id=?''',
+                             (rule['match'], rule['pattern'], rule['min_amount_cents'],
+                              rule['max_amount_cents'], rule['category'], rule['type'],
+                              rule['priority'], now, rule_id, user_id))
+            if c.rowcount == 0:
+                return None
+            bump_rules_version(conn, user_id, now)
+            row = conn.execute(f"SELECT {', '.join(RULE_FIELDS)} FROM user_rules WHERE id=?",
+                               (rule_id,)).fetchone()
+        return UserRule._to_api(dict(zip(RULE_FIELDS, row)))
+    
+    @staticmethod
+    def delete(rule_id: int, user_id: int) -> bool:
+        """Elimina una regla"""
+        with transaction() as conn:
+            c = conn.execute('DELETE FROM user_rules WHERE id=? AND user_id=?', (rule_id, user_id))
+            if c.rowcount == 0:
+                return False
+            bump_rules_version(conn, user_id, datetime.now().isoformat())
+            return True
+
+class RecategorizeJob:
+    """
+    Jobs de recategorización por bloques (ver utils/recategorizer.py). Los
+    jobs viven en la BD principal; con particiones recorren los archivos en
+    orden y `pool` es la posición del archivo del punto de control.
+    """
+    
+    FIELDS = ('id', 'user_id', 'status', 'chunk_size', 'pool', 'last_id', 'max_id', 'rows_total',
+              'rows_scanned', 'rows_changed', 'elapsed', 'error', 'created_at', 'started_at',
+              'heartbeat_at', 'finished_at')
+    
+    @staticmethod
+    def pools(user_id: Optional[int]) -> List[Any]:
+        """Archivos que recorre el job, en orden"""
+        return pools_for(user_id)
+    
+    @staticmethod
+    def create(user_id: Optional[int], chunk_size: int) -> int:
+        """
+        Registra un job sobre las transacciones existentes (de un usuario o
+        de todos). Las que se creen después ya salen con las reglas nuevas.
+        """
+        now = datetime.now().isoformat()
+        scope, params = ('user_id = ?', (user_id,)) if user_id is not None else ('1', ())
+        max_id = total = 0
+        for pool in RecategorizeJob.pools(user_id):
+            with pool.connection() as conn:
+                pool_max, pool_total = conn.execute(f'SELECT MAX(id), COUNT(*) FROM transactions WHERE {scope}',
+                                                    params).fetchone()
+            max_id, total = max(max_id, pool_max or 0), total + pool_total
+        with directory_transaction() as conn:
+            c = conn.execute('''INSERT INTO recategorize_jobs
+                                (user_id, status, chunk_size, max_id, rows_total, created_at)
+                                VALUES (?, 'pending', ?, ?, ?, ?)''',
+                             (user_id, chunk_size, max_id, total, now))
+            return c.lastrowid
+    
+    @staticmethod
+    def claim(job_id: int, stale_before: str) -> Optional[Dict[str, Any]]:
+        """
+        Toma el job si está pendiente o si quien lo corría dejó de reportar
+        (heartbeat anterior a stale_before). None si otro lo está corriendo
+        o ya terminó.
+        """
+        now = datetime.now().isoformat()
+        with directory_transaction() as conn:
+            c = conn.execute('''UPDATE recategorize_jobs
+                                SET status='running', started_at=COALESCE(started_at, ?), heartbeat_at=?
+                                WHERE id=? AND (status='pending'
+                                                OR (status='running' AND heartbeat_at < ?))''',
+                             (now, now, job_id, stale_before))
+            if c.rowcount == 0:
+                return None
+            row = conn.execute(f"SELECT {', '.join(RecategorizeJob.FIELDS)} FROM recategorize_jobs WHERE id=?",
+                               (job_id,)).fetchone()
+        return dict(row)
+    
+    @staticmethod
+    def stale(stale_before: str) -> List[int]:
+        """Jobs sin terminar que nadie está corriendo"""
+        with directory_connection() as conn:
+            return [row[0] for row in conn.execute(
+                '''SELECT id FROM recategorize_jobs
+                   WHERE status='pending' OR (status='running' AND heartbeat_at < ?)
+                   ORDER BY id''', (stale_before,))]
+    
+    @staticmethod
+    def read_chunk(job: Dict[str, Any], after_id: int) -> List[Tuple]:
+        """
+        Siguiente bloque (por id) del alcance del job, sin las transacciones
+        que el usuario corrigió a mano.
+        (id, user_id, description, amount_cents, category, type, importada)
+        """
+        scope, params = ('t.user_id = ? AND ', [job['user_id']]) if job['user_id'] is not None else ('', [])
+        with connection() as conn:
+            return [tuple(row) for row in conn.execute(f'''
+                SELECT t.id, t.user_id, t.description, t.amount_cents, t.category, t.type,
+                       EXISTS (SELECT 1 FROM transaction_fingerprints f WHERE f.transaction_id = t.id)
+                FROM transactions t
+                WHERE {scope}t.id > ? AND t.id <= ?
+                  AND NOT EXISTS (SELECT 1 FROM category_corrections k
+                                  WHERE k.user_id = t.user_id AND k.transaction_id = t.id)
+                ORDER BY t.id LIMIT ?''', params + [after_id, job['max_id'], job['chunk_size']])]
+    
+    @staticmethod
+    def apply_chunk(job_id: int, pool_index: int, last_id: int, scanned: int,
+                    changes: List[Tuple[str, str, int, str, str, str]], elapsed: float) -> int:
+        """
+        Escribe las categorías que cambiaron y avanza el punto de control en
+        una sola transacción (con particiones, en la del directorio justo
+        después: al retomar, el bloque se repite sin efecto). Una fila que se
+        editó mientras tanto (otra descripción o categoría) no se toca.
+        changes: (category, type, id, description, old_category, old_type)
+        Retorna las filas escritas.
+        """
+        checkpoint = (pool_index, last_id, scanned, elapsed, datetime.now().isoformat(), job_id)
+        with transaction() as conn:
+            changed = 0
+            for change in changes:
+                changed += conn.execute('''UPDATE transactions SET category=?, type=?
+                                           WHERE id=? AND description=? AND category IS ? AND type IS ?''',
+                                        change).rowcount
+            if get_pool() is directory_pool():
+                RecategorizeJob._checkpoint(conn, checkpoint, changed)
+                return changed
+        with directory_transaction() as conn:
+            RecategorizeJob._checkpoint(conn, checkpoint, changed)
+        return changed
+    
+    @staticmethod
+    def _checkpoint(conn, checkpoint: Tuple, changed: int) -> None:
+        pool_index, last_id, scanned, elapsed, now, job_id = checkpoint
+        conn.execute('''UPDATE recategorize_jobs
+                        SET pool=?, last_id=?, rows_scanned=rows_scanned + ?, rows_changed=rows_changed + ?,
+                            elapsed=elapsed + ?, heartbeat_at=?
+                        WHERE id=?''',
+                     (pool_index, last_id, scanned, changed, elapsed, now, job_id))
+    
+    @staticmethod
+    def finish(job_id: int, status: str, error: Optional[str] = None) -> None:
+        """Marca el job como terminado ('done' o 'failed')"""
+        with directory_transaction() as conn:
+            conn.execute('UPDATE recategorize_jobs SET status=?, error=?, finished_at=? WHERE id=?',
+                         (status, error, datetime.now().isoformat(), job_id))
+    
+    @staticmethod
+    def get(job_id: int) -> Optional[Dict[str, Any]]:
+        with directory_connection() as conn:
+            row = conn.execute(f"SELECT {', '.join(RecategorizeJob.FIELDS)} FROM recategorize_jobs WHERE id=?",
+                               (job_id,)).fetchone()
+        return dict(row) if row else None
+    
+    @staticmethod
+    def recent(limit: int = 20) -> List[Dict[str, Any]]:
+        with directory_connection() as conn:
+            rows = conn.execute(f'''SELECT {', '.join(RecategorizeJob.FIELDS)} FROM recategorize_jobs
+                                    ORDER BY id DESC LIMIT ?''', (limit,)).fetchall()
+        return [dict(row) for row in rows]
+
+class Session:
+    """Sesiones persistidas (la caché y la validación están en utils.sessions)"""
+    
+    @staticmethod
+    def create(token_hash: str, user_id: int, expires_at: str) -> None:
+        """Registra una sesión nueva"""
+        now = datetime.now().isoformat()
+        with directory_transaction() as conn:
+            conn.execute('''INSERT INTO sessions (token_hash, user_id, created_at, expires_at, last_seen)
+                            VALUES (?, ?, ?, ?, ?)''',
+                         (token_hash, user_id, now, expires_at, now))
+    
+    @staticmethod
+    def get(token_hash: str) -> Optional[Dict[str, Any]]:
+        """Sesión por hash de token (vigente o no)"""
+        with directory_connection() as conn:
+            row = conn.execute('SELECT user_id, expires_at FROM sessions WHERE token_hash=?',
+                               (token_hash,)).fetchone()
+        return {'user_id': row[0], 'expires_at': row[1]} if row else None
+    
+    @staticmethod
+    def delete(token_hash: str) -> bool:
+        """Revoca una sesión"""
+        with directory_transaction() as conn:
+            return conn.execute('DELETE FROM sessions WHERE token_hash=?', (token_hash,)).rowcount > 0
+    
+    @staticmethod
+    def touch_many(items: List[Tuple[str, str]]) -> None:
+        """Actualiza last_seen en lote: items = [(last_seen, token_hash)]"""
+        with directory_transaction() as conn:
+            conn.executemany('UPDATE sessions SET last_seen=? WHERE token_hash=?', items)
+    
+    @staticmethod
+    def purge_expired() -> int:
+        """Elimina sesiones vencidas"""
+        with directory_transaction() as conn:
+            return conn.execute('DELETE FROM sessions WHERE expires_at < ?',
+                                (datetime.now().isoformat(),)).rowcount
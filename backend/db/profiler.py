@@ -0,0 +1,197 @@
+"""
+Perfilado de consultas SQL
+
+Las conexiones del pool se crean con ProfiledConnection, que mide cada
+execute/executemany (tanto de la conexión como de sus cursores), así que
+cubre todo el acceso a la BD (db/models.py, rollups, búsqueda...).
+
+- Las sentencias que tardan más de SLOW_QUERY_MS se registran en el logger
+  'db.slow_query' con el SQL normalizado, la forma de los parámetros, la
+  duración y la salida de EXPLAIN QUERY PLAN.
+- Por cada SQL normalizado se acumulan llamadas, tiempo total y máximo;
+  top_queries() devuelve las de más tiempo total (GET /api/admin/queries).
+
+El tiempo medido es el de execute(): preparar la sentencia y avanzar
+hasta la primera fila, que es donde SQLite ordena, agrupa o escribe. La
+lectura del resto de filas con fetch* no se incluye.
+
+QUERY_PROFILER=0 desactiva el perfilado (conexiones sqlite3 normales).
+"""
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+QUERY_PROFILER = os.environ.get('QUERY_PROFILER', '1') not in ('0', 'false', 'no')
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '100'))
+# SQL normalizados distintos que se acumulan (el resto se agrupa en uno)
+MAX_TRACKED_QUERIES = 1000
+
+logger = logging.getLogger('db.slow_query')
+
+# Sentencias a las que se les puede pedir EXPLAIN QUERY PLAN
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE')
+OTHER_QUERIES = '(otras consultas)'
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_SPACES = re.compile(r'\s+')
+
+_normalized: Dict[str, str] = {}
+
+
+def normalize_sql(sql: str) -> str:
+    """SQL sin literales ni espacios redundantes (clave de agregación)"""
+    normalized = _normalized.get(sql)
+    if normalized is None:
+        normalized = _SPACES.sub(' ', sql).strip()
+        normalized = _STRING.sub('?', normalized)
+        normalized = _NUMBER.sub('?', normalized)
+        normalized = _IN_LIST.sub('IN (...)', normalized)
+        if len(_normalized) < MAX_TRACKED_QUERIES * 4:
+            _normalized[sql] = normalized
+    return normalized
+
+
+def params_shape(params: Any, many: bool = False) -> str:
+    """Tipos de los parámetros sin sus valores, p. ej. '(int, str, NoneType)'"""
+    if many:
+        if isinstance(params, (list, tuple)):
+            first = params_shape(params[0]) if params else '()'
+            return f'{len(params)} x {first}'
+        return 'iterable x ?'
+    if params is None:
+        return '()'
+    if isinstance(params, dict):
+        return '{' + ', '.join(f'{key}: {type(value).__name__}' for key, value in params.items()) + '}'
+    return '(' + ', '.join(type(value).__name__ for value in params) + ')'
+
+
+class QueryStats:
+    """Tiempo acumulado por SQL normalizado (por proceso)"""
+
+    def __init__(self, max_queries: int = MAX_TRACKED_QUERIES):
+        self.max_queries = max_queries
+        self._stats: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, sql: str, seconds: float, slow: bool) -> None:
+        with self._lock:
+            entry = self._stats.get(sql)
+            if entry is None:
+                if len(self._stats) >= self.max_queries:
+                    sql = OTHER_QUERIES
+                    entry = self._stats.get(sql)
+                if entry is None:
+                    entry = self._stats[sql] = [0, 0.0, 0.0, 0]
+            entry[0] += 1
+            entry[1] += seconds
+            if seconds > entry[2]:
+                entry[2] = seconds
+            if slow:
+                entry[3] += 1
+
+    def top(self, limit: int = 20) -> List[Dict[str, Any]]:
+        with self._lock:
+            items = sorted(self._stats.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+        return [{
+            'sql': sql,
+            'calls': calls,
+            'total_ms': round(total * 1000, 3),
+            'avg_ms': round(total * 1000 / calls, 3),
+            'max_ms': round(worst * 1000, 3),
+            'slow': slow,
+        } for sql, (calls, total, worst, slow) in items]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+_stats = QueryStats()
+
+
+def top_queries(limit: int = 20) -> List[Dict[str, Any]]:
+    """Consultas con más tiempo total en el proceso actual"""
+    return _stats.top(limit)
+
+
+def reset_stats() -> None:
+    _stats.reset()
+
+
+def explain(conn: sqlite3.Connection, sql: str, params: Any) -> List[str]:
+    """EXPLAIN QUERY PLAN como líneas indentadas según el árbol del plan"""
+    rows = sqlite3.Connection.execute(conn, 'EXPLAIN QUERY PLAN ' + sql, params or ()).fetchall()
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[node_id] + detail)
+    return lines
+
+
+def _report_slow(conn: sqlite3.Connection, sql: str, normalized: str,
+                 params: Any, many: bool, seconds: float) -> None:
+    shape = params_shape(params, many)
+    plan = []
+    if sql.lstrip()[:7].upper().startswith(EXPLAINABLE):
+        try:
+            if many:
+                params = params[0] if isinstance(params, (list, tuple)) and params else None
+            if params is not None or not many:
+                plan = explain(conn, sql, params)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            plan = [f'(sin plan: {e})']
+    logger.warning("Consulta lenta (%.1f ms): %s | parámetros %s%s",
+                   seconds * 1000, normalized, shape,
+                   ''.join('\n    ' + line for line in plan))
+
+
+def _profile(conn: sqlite3.Connection, run, sql: str, params: Any, many: bool):
+    start = time.perf_counter()
+    try:
+        return run()
+    finally:
+        seconds = time.perf_counter() - start
+        normalized = normalize_sql(sql)
+        slow = seconds * 1000 >= SLOW_QUERY_MS
+        _stats.record(normalized, seconds, slow)
+        if slow:
+            try:
+                _report_slow(conn, sql, normalized, params, many, seconds)
+            except Exception:
+                logger.exception("Error registrando consulta lenta")
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        return _profile(self.connection, lambda: super(ProfiledCursor, self).execute(sql, parameters),
+                        sql, parameters, False)
+
+    def executemany(self, sql, seq_of_parameters):
+        return _profile(self.connection,
+                        lambda: super(ProfiledCursor, self).executemany(sql, seq_of_parameters),
+                        sql, seq_of_parameters, True)
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """Conexión cuyas sentencias se miden (ver módulo)"""
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def connection_factory() -> Optional[type]:
+    """Clase de conexión para sqlite3.connect (None: sin perfilado)"""
+    return ProfiledConnection if QUERY_PROFILER else None
@@ -0,0 +1,407 @@
+"""
+Detección de cargos recurrentes (suscripciones, alquiler, sueldo)
+
+Proceso por lotes: agrupa las transacciones de cada usuario por
+descripción normalizada (sin números, acentos ni signos) y tipo, y marca
+como recurrente cada grupo con al menos RECURRING_MIN_OCCURRENCES
+movimientos cuyos intervalos entre fechas son regulares (semanal,
+quincenal, mensual, trimestral o anual) y cuyos montos son parecidos.
+Guarda el período, el monto típico y la próxima fecha esperada en
+recurring_charges (GET /api/recurring).
+
+Las estadísticas por grupo (intervalos, medianas, dispersión) se calculan
+con NumPy sobre todo el lote a la vez, sin recorrer grupo por grupo.
+
+Es incremental: recurring_state guarda la versión de datos de cada
+usuario analizado (user_data_versions, la misma de los ETag) y una corrida
+solo procesa los usuarios cuya versión cambió desde entonces.
+
+    cd backend && python -m db.recurring run [--full] [--batch-rows 200000]
+"""
+import argparse
+import logging
+import os
+import re
+import sys
+import time
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from db.connection import connection, transaction, use_pool
+from db.sharding import pools_for
+from utils.categorizer import normalize_text
+from utils.money import from_cents
+
+logger = logging.getLogger(__name__)
+
+RECURRING_MIN_OCCURRENCES = 3
+# Fracción mínima de intervalos dentro de la tolerancia del período
+RECURRING_MIN_REGULARITY = 0.75
+# Coeficiente de variación máximo de los montos del grupo
+RECURRING_MAX_AMOUNT_CV = 0.3
+# Filas de transactions por lote (se agrupan usuarios enteros hasta llenarlo).
+# Un lote ocupa ~50 bytes por fila en arrays, más las descripciones distintas.
+RECURRING_BATCH_ROWS = int(os.environ.get('RECURRING_BATCH_ROWS', '1000000'))
+RECURRING_FETCH_ROWS = 50_000
+
+# Nombre -> (días, tolerancia en días, meses para la próxima fecha)
+PERIODS = {
+    'weekly': (7.0, 1.0, 0),
+    'biweekly': (14.0, 2.0, 0),
+    'monthly': (30.44, 3.5, 1),
+    'quarterly': (91.31, 8.0, 3),
+    'yearly': (365.25, 12.0, 12),
+}
+
+RECURRING_TABLES = [
+    '''CREATE TABLE IF NOT EXISTS recurring_charges
+       (user_id INTEGER NOT NULL,
+        description_key TEXT NOT NULL,
+        type TEXT NOT NULL,
+        description TEXT NOT NULL,
+        category TEXT,
+        period TEXT NOT NULL,
+        interval_days REAL NOT NULL,
+        amount_cents INTEGER NOT NULL,
+        occurrences INTEGER NOT NULL,
+        first_date TEXT NOT NULL,
+        last_date TEXT NOT NULL,
+        next_date TEXT NOT NULL,
+        regularity REAL NOT NULL,
+        PRIMARY KEY (user_id, description_key, type)) WITHOUT ROWID''',
+    '''CREATE TABLE IF NOT EXISTS recurring_state
+       (user_id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL,
+        analyzed_at TIMESTAMP)''',
+]
+
+_NOISE = re.compile(r'[\W\d_]+')
+# Palabras que cambian de un mes a otro en el mismo cargo ('Sueldo marzo')
+_MONTH_WORDS = frozenset(
+    'enero febrero marzo abril mayo junio julio agosto septiembre setiembre octubre noviembre diciembre '
+    'ene feb mar abr may jun jul ago sep set oct nov dic'.split())
+_EPOCH = date(1970, 1, 1)
+
+
+def create_recurring(conn) -> None:
+    """Tablas de resultados y de estado (idempotente)"""
+    for statement in RECURRING_TABLES:
+        conn.execute(statement)
+
+
+def description_key(description: str) -> str:
+    """'Netflix 12/03 #4471' -> 'netflix', 'Sueldo Marzo' -> 'sueldo' (clave de agrupación)"""
+    words = _NOISE.sub(' ', normalize_text(description)).split()
+    return ' '.join(word for word in words if word not in _MONTH_WORDS)
+
+
+# ==================== DETECCIÓN ====================
+
+def _group_medians(group: np.ndarray, values: np.ndarray, starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Mediana (inferior) de `values` por grupo; `group` debe venir ordenado"""
+    order = np.lexsort((values, group))
+    # Los grupos vacíos dan un valor cualquiera: el llamador los descarta
+    index = np.minimum(starts + (np.maximum(counts, 1) - 1) // 2, values.size - 1)
+    return values[order][index]
+
+
+def detect(group: np.ndarray, days: np.ndarray, amounts: np.ndarray, group_count: int) -> Dict[str, np.ndarray]:
+    """
+    Estadísticas vectorizadas de todos los grupos de un lote.
+
+    group, days, amounts: un elemento por transacción (grupo, día desde
+    1970-01-01, centavos), ordenados por (grupo, día). Retorna arrays
+    indexados por grupo: recurring (bool), period (índice en PERIODS),
+    interval, amount, occurrences, first_day, last_day, regularity.
+    """
+    occurrences = np.bincount(group, minlength=group_count)
+    starts = np.concatenate(([0], np.cumsum(occurrences)[:-1]))
+    last_index = np.maximum(starts + occurrences - 1, 0)
+
+    # Intervalos entre movimientos consecutivos del mismo grupo
+    same = group[1:] == group[:-1]
+    gaps = (days[1:] - days[:-1])[same].astype(np.float64)
+    gap_group = group[1:][same]
+    gap_counts = np.bincount(gap_group, minlength=group_count)
+    gap_starts = np.concatenate(([0], np.cumsum(gap_counts)[:-1]))
+
+    candidate = occurrences >= RECURRING_MIN_OCCURRENCES
+    interval = np.zeros(group_count)
+    has_gaps = gap_counts > 0
+    if gaps.size:
+        interval[has_gaps] = _group_medians(gap_group, gaps, gap_starts, gap_counts)[has_gaps]
+
+    # Período conocido más cercano a la mediana de los intervalos
+    names = list(PERIODS)
+    lengths = np.array([PERIODS[name][0] for name in names])
+    tolerances = np.array([PERIODS[name][1] for name in names])
+    distance = np.abs(interval[:, None] - lengths[None, :])
+    period = np.argmin(distance, axis=1)
+    matches = distance[np.arange(group_count), period] <= tolerances[period]
+
+    # Regularidad: intervalos a distancia del período dentro de la tolerancia
+    regular = np.abs(gaps - lengths[period][gap_group]) <= tolerances[period][gap_group]
+    regularity = np.zeros(group_count)
+    np.divide(np.bincount(gap_group, weights=regular, minlength=group_count), gap_counts,
+              out=regularity, where=has_gaps)
+
+    # Montos: mediana y coeficiente de variación
+    values = amounts.astype(np.float64)
+    total = np.bincount(group, weights=values, minlength=group_count)
+    squares = np.bincount(group, weights=values * values, minlength=group_count)
+    mean = np.divide(total, occurrences, out=np.zeros(group_count), where=occurrences > 0)
+    variance = np.divide(squares, occurrences, out=np.zeros(group_count), where=occurrences > 0) - mean ** 2
+    cv = np.divide(np.sqrt(np.maximum(variance, 0)), np.abs(mean),
+                   out=np.full(group_count, np.inf), where=mean != 0)
+    amount = _group_medians(group, amounts, starts, occurrences)
+
+    recurring = (candidate & matches & (regularity >= RECURRING_MIN_REGULARITY)
+                 & (cv <= RECURRING_MAX_AMOUNT_CV))
+    return {
+        'recurring': recurring,
+        'period': period,
+        'interval': interval,
+        'amount': amount,
+        'occurrences': occurrences,
+        'first_day': days[starts],
+        'last_day': days[last_index],
+        'last_index': last_index,
+        'regularity': regularity,
+    }
+
+
+def next_date(last: date, period: str, interval: float) -> date:
+    """Próxima fecha esperada: mismo día del mes para períodos mensuales o más"""
+    months = PERIODS[period][2]
+    if not months:
+        return last + timedelta(days=round(interval))
+    total = last.year * 12 + last.month - 1 + months
+    year, month = total // 12, total % 12 + 1
+    for day in (last.day, 30, 29, 28):
+        try:
+            return date(year, month, day)
+        except ValueError:
+            continue
+
+
+def _load_batch(conn, user_ids: List[int], scan: bool) -> Tuple[Dict[str, np.ndarray], List[str]]:
+    """
+    Columnas de las transacciones de los usuarios como arrays: id, user,
+    key (índice en la lista de claves), income (0/1), amount y day.
+    Con scan=True se recorre la tabla en orden en vez de ir por el índice
+    de usuario (más rápido cuando el lote es buena parte de la tabla).
+    """
+    placeholders = ','.join('?' * len(user_ids))
+    user_column = '+user_id' if scan else 'user_id'
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute(f'''SELECT id, user_id, description, type IS 'income', amount_cents,
+                              CAST(julianday(substr(created_at, 1, 10)) - 2440587.5 AS INTEGER)
+                       FROM transactions
+                       WHERE {user_column} IN ({placeholders})
+                         AND julianday(substr(created_at, 1, 10)) IS NOT NULL''', user_ids)
+
+    keys: Dict[str, int] = {}
+    key_of: Dict[str, int] = {}
+    parts = []
+    while True:
+        rows = cursor.fetchmany(RECURRING_FETCH_ROWS)
+        if not rows:
+            break
+        ids, users, descriptions, income, amounts, days = zip(*rows)
+        # Cada descripción distinta se normaliza una sola vez
+        for description in set(descriptions).difference(key_of):
+            key_of[description] = keys.setdefault(description_key(description), len(keys))
+        parts.append((
+            np.array(ids, dtype=np.int64), np.array(users, dtype=np.int64),
+            np.fromiter(map(key_of.__getitem__, descriptions), dtype=np.int64, count=len(rows)),
+            np.array(income, dtype=np.int64), np.array(amounts, dtype=np.int64), np.array(days, dtype=np.int64),
+        ))
+    names = ('id', 'user', 'key', 'income', 'amount', 'day')
+    if not parts:
+        return {name: np.zeros(0, dtype=np.int64) for name in names}, []
+    columns = {name: np.concatenate([part[i] for part in parts]) for i, name in enumerate(names)}
+    return columns, list(keys)
+
+
+def analyze(columns: Dict[str, np.ndarray], keys: List[str]) -> List[Dict[str, Any]]:
+    """
+    Cargos recurrentes de un lote (columnas de _load_batch). Cada uno
+    lleva el id de su movimiento más reciente en 'last_id'.
+    """
+    if not columns['id'].size:
+        return []
+    # Grupo = (usuario, clave, tipo) codificado en un entero
+    code = (columns['user'] * len(keys) + columns['key']) * 2 + columns['income']
+    codes, group = np.unique(code, return_inverse=True)
+    group = group.ravel()
+
+    order = np.lexsort((columns['day'], group))
+    stats = detect(group[order], columns['day'][order], columns['amount'][order], len(codes))
+
+    names = list(PERIODS)
+    result = []
+    for g in np.flatnonzero(stats['recurring']):
+        user_key, income = divmod(int(codes[g]), 2)
+        user_id, key = divmod(user_key, len(keys))
+        if not keys[key]:
+            continue
+        period = names[stats['period'][g]]
+        interval = float(stats['interval'][g])
+        last = _EPOCH + timedelta(days=int(stats['last_day'][g]))
+        result.append({
+            'user_id': user_id,
+            'description_key': keys[key],
+            'type': 'income' if income else 'expense',
+            'last_id': int(columns['id'][order[stats['last_index'][g]]]),
+            'period': period,
+            'interval_days': round(interval, 1),
+            'amount_cents': int(stats['amount'][g]),
+            'occurrences': int(stats['occurrences'][g]),
+            'first_date': (_EPOCH + timedelta(days=int(stats['first_day'][g]))).isoformat(),
+            'last_date': last.isoformat(),
+            'next_date': next_date(last, period, interval).isoformat(),
+            'regularity': round(float(stats['regularity'][g]), 3),
+        })
+    return result
+
+
+def _describe(conn, charges: List[Dict[str, Any]]) -> None:
+    """Descripción y categoría de cada cargo: las de su movimiento más reciente"""
+    ids = [charge['last_id'] for charge in charges]
+    found = {}
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        found.update((row[0], (row[1], row[2])) for row in conn.execute(
+            f"SELECT id, description, category FROM transactions WHERE id IN ({','.join('?' * len(chunk))})",
+            chunk))
+    for charge in charges:
+        charge['description'], charge['category'] = found.get(charge['last_id'], (charge['description_key'], None))
+
+
+# ==================== CORRIDAS ====================
+
+def pending_users(conn, full: bool = False, user_ids: Optional[List[int]] = None) -> List[Tuple[int, int, int]]:
+    """(user_id, versión, filas) de los usuarios a analizar"""
+    conditions, params = [], []
+    if not full:
+        conditions.append('(s.version IS NULL OR s.version <> v.version)')
+    if user_ids is not None:
+        conditions.append(f"v.user_id IN ({','.join('?' * len(user_ids))})")
+        params.extend(user_ids)
+    where = 'WHERE ' + ' AND '.join(conditions) if conditions else ''
+    return [tuple(row) for row in conn.execute(f'''
+        SELECT v.user_id, v.version,
+               (SELECT COUNT(*) FROM transactions t WHERE t.user_id = v.user_id)
+        FROM user_data_versions v
+        LEFT JOIN recurring_state s ON s.user_id = v.user_id
+        {where}
+        ORDER BY v.user_id''', params)]
+
+
+def _batches(users: List[Tuple[int, int, int]], batch_rows: int):
+    batch, rows = [], 0
+    for user in users:
+        if batch and rows + user[2] > batch_rows:
+            yield batch
+            batch, rows = [], 0
+        batch.append(user)
+        rows += user[2]
+    if batch:
+        yield batch
+
+
+_CHARGE_COLUMNS = ('user_id', 'description_key', 'type', 'description', 'category', 'period', 'interval_days',
+                   'amount_cents', 'occurrences', 'first_date', 'last_date', 'next_date', 'regularity')
+
+
+def _save(conn, users: List[Tuple[int, int, int]], charges: List[Dict[str, Any]]) -> None:
+    user_ids = [user[0] for user in users]
+    placeholders = ','.join('?' * len(user_ids))
+    conn.execute(f'DELETE FROM recurring_charges WHERE user_id IN ({placeholders})', user_ids)
+    conn.executemany(f'''INSERT INTO recurring_charges ({', '.join(_CHARGE_COLUMNS)})
+                         VALUES ({', '.join('?' * len(_CHARGE_COLUMNS))})''',
+                     [tuple(charge[column] for column in _CHARGE_COLUMNS) for charge in charges])
+    now = time.strftime('%Y-%m-%dT%H:%M:%S')
+    conn.executemany('''INSERT INTO recurring_state (user_id, version, analyzed_at) VALUES (?, ?, ?)
+                        ON CONFLICT (user_id) DO UPDATE
+                        SET version = excluded.version, analyzed_at = excluded.analyzed_at''',
+                     [(user_id, version, now) for user_id, version, _ in users])
+
+
+def run(full: bool = False, batch_rows: int = RECURRING_BATCH_ROWS,
+        user_ids: Optional[List[int]] = None) -> Dict[str, Any]:
+    """
+    Analiza los usuarios con datos nuevos (todos con full=True, o solo
+    `user_ids`). La versión se lee antes que las transacciones: si alguien
+    escribe durante la corrida, el usuario queda pendiente para la próxima.
+    """
+    start = time.perf_counter()
+    with connection() as conn:
+        users = pending_users(conn, full, user_ids)
+        table_rows = conn.execute('SELECT MAX(id) FROM transactions').fetchone()[0] or 0
+
+    rows_read = charges_found = 0
+    for batch in _batches(users, batch_rows):
+        # Si el lote es más de la mitad de la tabla conviene leerla entera en orden
+        scan = sum(user[2] for user in batch) * 2 >= table_rows
+        with connection() as conn:
+            columns, keys = _load_batch(conn, [user[0] for user in batch], scan)
+            charges = analyze(columns, keys)
+            _describe(conn, charges)
+        with transaction() as conn:
+            _save(conn, batch, charges)
+        rows_read += columns['id'].size
+        charges_found += len(charges)
+    seconds = time.perf_counter() - start
+    if users:
+        logger.info("Recurrentes: %d usuarios, %d filas, %d cargos en %.2fs",
+                    len(users), rows_read, charges_found, seconds)
+    return {'users': len(users), 'rows': rows_read, 'charges': charges_found, 'seconds': round(seconds, 3)}
+
+
+def read_recurring(conn, user_id: int, today: date) -> List[Dict[str, Any]]:
+    """
+    Cargos recurrentes del usuario por próxima fecha. `active` es False si
+    la próxima fecha pasó hace más de un período (p. ej. una suscripción
+    dada de baja).
+    """
+    result = []
+    for row in conn.execute('''SELECT description, category, type, period, interval_days, amount_cents,
+                                      occurrences, first_date, last_date, next_date, regularity
+                               FROM recurring_charges WHERE user_id = ?
+                               ORDER BY next_date, description_key''', (user_id,)):
+        charge = dict(row)
+        charge['amount'] = from_cents(charge.pop('amount_cents'))
+        overdue = (today - date.fromisoformat(charge['next_date'])).days
+        charge['active'] = overdue <= charge['interval_days']
+        result.append(charge)
+    return result
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog='python -m db.recurring')
+    sub = parser.add_subparsers(dest='command', required=True)
+    cmd = sub.add_parser('run', help='analiza los usuarios con datos nuevos')
+    cmd.add_argument('--full', action='store_true', help='reanaliza a todos los usuarios')
+    cmd.add_argument('--batch-rows', type=int, default=RECURRING_BATCH_ROWS)
+    args = parser.parse_args(argv[1:])
+
+    # Una BD sin migrar se pone al día (crea estas tablas)
+    from db.migrations import migrate
+    migrate()
+
+    results = []
+    for pool in pools_for():
+        with use_pool(pool):
+            results.append(run(args.full, args.batch_rows))
+    result = {key: sum(r[key] for r in results) for key in results[0]}
+    print(f"{result['users']} usuario(s), {result['rows']:,} filas, "
+          f"{result['charges']} cargo(s) recurrente(s) en {result['seconds']}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,392 @@
+"""
+Totales precalculados mantenidos incrementalmente
+
+- user_category_totals: (cantidad, total) por usuario, tipo y categoría
+  (alimenta /api/stats)
+- user_daily_totals: lo mismo por día (alimenta /api/stats/timeseries)
+- user_monthly_totals: lo mismo por mes 'YYYY-MM' (presupuestos, ver
+  db/budgets.py)
+
+Las tablas se actualizan con triggers en la misma transacción que cada
+INSERT/UPDATE/DELETE sobre transactions, así que cualquier camino de
+escritura (rutas, modelos, importaciones, lotes) las mantiene al día y las
+estadísticas solo leen unas pocas filas. Los totales están en centavos
+(enteros), así que acumularlos no pierde precisión.
+
+Comando de mantenimiento (recalcula desde cero y reporta diferencias):
+
+    cd backend && python -m db.rollups verify [user_id]
+    cd backend && python -m db.rollups rebuild [user_id]
+"""
+import sys
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from db.connection import connection, transaction, use_pool
+from db.sharding import pools_for
+from utils.money import from_cents
+
+# Tabla -> columnas de agrupación (nombre, expresión sobre la fila {row}).
+# NULL se guarda como '' porque la clave primaria no admite NULL.
+ROLLUPS = {
+    'user_category_totals': [
+        ('type', "COALESCE({row}.type, '')"),
+        ('category', "COALESCE({row}.category, '')"),
+    ],
+    'user_daily_totals': [
+        ('day', "COALESCE(substr({row}.created_at, 1, 10), '')"),
+        ('type', "COALESCE({row}.type, '')"),
+        ('category', "COALESCE({row}.category, '')"),
+    ],
+    'user_monthly_totals': [
+        ('month', "COALESCE(substr({row}.created_at, 1, 7), '')"),
+        ('type', "COALESCE({row}.type, '')"),
+        ('category', "COALESCE({row}.category, '')"),
+    ],
+}
+
+# Columnas de transactions que, al cambiar, mueven la fila de grupo
+_SOURCE_COLUMNS = {
+    'user_category_totals': 'user_id, amount_cents, category, type',
+    'user_daily_totals': 'user_id, amount_cents, category, type, created_at',
+    'user_monthly_totals': 'user_id, amount_cents, category, type, created_at',
+}
+
+_TRIGGER_PREFIX = {
+    'user_category_totals': 'trg_category_totals',
+    'user_daily_totals': 'trg_daily_totals',
+    'user_monthly_totals': 'trg_monthly_totals',
+}
+
+
+def _table_sql(table: str) -> str:
+    keys = [name for name, _ in ROLLUPS[table]]
+    columns = ''.join(f'{name} TEXT NOT NULL, ' for name in keys)
+    return f'''CREATE TABLE IF NOT EXISTS {table}
+               (user_id INTEGER NOT NULL, {columns}
+                count INTEGER NOT NULL DEFAULT 0,
+                total INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, {', '.join(keys)})) WITHOUT ROWID'''
+
+
+def _trigger_sql(table: str) -> List[str]:
+    prefix = _TRIGGER_PREFIX[table]
+    keys = [name for name, _ in ROLLUPS[table]]
+    new = [expr.format(row='NEW') for _, expr in ROLLUPS[table]]
+    old_match = ' AND '.join(f'{name} = {expr.format(row="OLD")}' for name, expr in ROLLUPS[table])
+
+    add_new = f'''
+        INSERT INTO {table} (user_id, {', '.join(keys)}, count, total)
+        VALUES (NEW.user_id, {', '.join(new)}, 1, NEW.amount_cents)
+        ON CONFLICT (user_id, {', '.join(keys)})
+        DO UPDATE SET count = count + 1, total = total + excluded.total;'''
+    remove_old = f'''
+        UPDATE {table} SET count = count - 1, total = total - OLD.amount_cents
+        WHERE user_id = OLD.user_id AND {old_match};
+        DELETE FROM {table}
+        WHERE user_id = OLD.user_id AND {old_match} AND count <= 0;'''
+
+    return [
+        f'''CREATE TRIGGER IF NOT EXISTS {prefix}_insert
+            AFTER INSERT ON transactions
+            BEGIN {add_new} END''',
+        f'''CREATE TRIGGER IF NOT EXISTS {prefix}_delete
+            AFTER DELETE ON transactions
+            BEGIN {remove_old} END''',
+        f'''CREATE TRIGGER IF NOT EXISTS {prefix}_update
+            AFTER UPDATE OF {_SOURCE_COLUMNS[table]} ON transactions
+            BEGIN {remove_old} {add_new} END''',
+    ]
+
+
+def _aggregate_sql(table: str, where: str) -> str:
+    """Agregación desde transactions con las mismas columnas que la tabla"""
+    exprs = ', '.join(expr.format(row='transactions') for _, expr in ROLLUPS[table])
+    return f'''SELECT user_id, {exprs}, COUNT(*), SUM(amount_cents)
+               FROM transactions {where}
+               GROUP BY user_id, {exprs}'''
+
+
+def create_rollups(conn) -> None:
+    """
+    Crea tablas y triggers (idempotente). Una tabla nueva se llena con los
+    datos existentes en la misma transacción.
+    """
+    for table in ROLLUPS:
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)
+        ).fetchone()
+        conn.execute(_table_sql(table))
+        for trigger in _trigger_sql(table):
+            conn.execute(trigger)
+        if not exists:
+            _rebuild(conn, table)
+
+
+def _rebuild(conn, table: str, user_id: Optional[int] = None) -> None:
+    where, params = ('WHERE user_id = ?', (user_id,)) if user_id is not None else ('', ())
+    keys = ', '.join(name for name, _ in ROLLUPS[table])
+    conn.execute(f'DELETE FROM {table} {where}', params)
+    conn.execute(f'INSERT INTO {table} (user_id, {keys}, count, total) ' + _aggregate_sql(table, where),
+                 params)
+
+
+def rebuild_rollups(user_id: Optional[int] = None) -> None:
+    """Recalcula todas las tablas de totales (todos o un usuario)"""
+    with transaction() as conn:
+        for table in ROLLUPS:
+            _rebuild(conn, table, user_id)
+
+
+def rewrite_totals(conn, expression: str) -> None:
+    """
+    Reescribe las tablas de totales existentes con el esquema actual,
+    transformando `total` con la expresión SQL dada (migraciones).
+    """
+    for table in ROLLUPS:
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)
+        ).fetchone()
+        if not exists:
+            continue
+        keys = ', '.join(name for name, _ in ROLLUPS[table])
+        conn.execute(f'ALTER TABLE {table} RENAME TO {table}_old')
+        conn.execute(_table_sql(table))
+        conn.execute(f'''INSERT INTO {table} (user_id, {keys}, count, total)
+                         SELECT user_id, {keys}, count, {expression} FROM {table}_old''')
+        conn.execute(f'DROP TABLE {table}_old')
+
+
+def verify_rollups(user_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Compara los totales acumulados con un recálculo desde cero.
+    Retorna una fila por cada grupo con diferencias.
+    """
+    where, params = ('WHERE user_id = ?', (user_id,)) if user_id is not None else ('', ())
+    drift = []
+    with connection() as conn:
+        for table, columns in ROLLUPS.items():
+            keys = [name for name, _ in columns]
+            expected = {tuple(row[:-2]): (row[-2], row[-1])
+                        for row in conn.execute(_aggregate_sql(table, where), params)}
+            actual = {tuple(row[:-2]): (row[-2], row[-1])
+                      for row in conn.execute(f'''SELECT user_id, {', '.join(keys)}, count, total
+                                                  FROM {table} {where}''', params)}
+
+            for key in sorted(set(expected) | set(actual)):
+                exp_count, exp_total = expected.get(key, (0, 0))
+                act_count, act_total = actual.get(key, (0, 0))
+                if exp_count != act_count or (exp_total or 0) != (act_total or 0):
+                    drift.append({
+                        'table': table, 'user_id': key[0], **dict(zip(keys, key[1:])),
+                        'expected_count': exp_count, 'actual_count': act_count,
+                        'expected_total': exp_total, 'actual_total': act_total,
+                    })
+    return drift
+
+
+def read_user_stats(conn, user_id: int) -> Dict[str, Any]:
+    """Estadísticas del usuario leídas de la tabla de totales"""
+    return summarize_stats(conn.execute('''SELECT type, category, count, total
+                                           FROM user_category_totals
+                                           WHERE user_id = ?''', (user_id,)))
+
+
+def summarize_stats(rows: Iterable[Tuple[str, str, int, int]]) -> Dict[str, Any]:
+    """Respuesta de /api/stats desde filas (tipo, categoría, cantidad, total en centavos)"""
+    total_expenses = 0
+    total_income = 0
+    by_category = []
+    for row in rows:
+        trans_type, category, count, total = row[0], row[1], row[2], row[3]
+        if trans_type == 'expense':
+            total_expenses += total
+            by_category.append({'category': category or None, 'count': count, 'total': from_cents(total)})
+        elif trans_type == 'income':
+            total_income += total
+
+    return {
+        'total_expenses': from_cents(total_expenses),
+        'total_income': from_cents(total_income),
+        'balance': from_cents(total_income - total_expenses),
+        'by_category': by_category
+    }
+
+
+# ==================== SERIES TEMPORALES ====================
+
+# Inicio del período de cada día (semanas ISO, de lunes a domingo)
+_BUCKET_EXPR = {
+    'day': 'day',
+    'week': "date(day, 'weekday 0', '-6 days')",
+    'month': "substr(day, 1, 8) || '01'",
+}
+
+
+def bucket_start(day: date, granularity: str) -> date:
+    """Primer día del período que contiene a `day`"""
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def shift_bucket(start: date, granularity: str, n: int) -> date:
+    """Inicio del período n posiciones después (o antes, si n < 0)"""
+    if granularity == 'week':
+        return start + timedelta(weeks=n)
+    if granularity == 'month':
+        months = start.year * 12 + start.month - 1 + n
+        return date(months // 12, months % 12 + 1, 1)
+    return start + timedelta(days=n)
+
+
+def _read_buckets(conn, user_id: int, granularity: str, first: date, count: int):
+    """Totales por período (y gastos por categoría) de `count` períodos"""
+    starts = [shift_bucket(first, granularity, i) for i in range(count)]
+    last_day = shift_bucket(starts[-1], granularity, 1) - timedelta(days=1)
+    buckets = {
+        start.isoformat(): {
+            'start': start.isoformat(),
+            'end': (shift_bucket(start, granularity, 1) - timedelta(days=1)).isoformat(),
+            'income': 0, 'expense': 0, 'count': 0, 'by_category': {},
+        }
+        for start in starts
+    }
+
+    for row in conn.execute(f'''SELECT {_BUCKET_EXPR[granularity]} AS bucket, type, category,
+                                       SUM(count), SUM(total)
+                                FROM user_daily_totals
+                                WHERE user_id = ? AND day >= ? AND day <= ?
+                                GROUP BY bucket, type, category''',
+                            (user_id, first.isoformat(), last_day.isoformat())):
+        bucket = buckets.get(row[0])
+        if bucket is None:
+            continue
+        trans_type, category, count, total = row[1], row[2], row[3], row[4]
+        bucket['count'] += count
+        if trans_type == 'income':
+            bucket['income'] += total
+        elif trans_type == 'expense':
+            bucket['expense'] += total
+            name = category or 'Otros'
+            bucket['by_category'][name] = bucket['by_category'].get(name, 0) + total
+
+    result = []
+    for bucket in buckets.values():
+        bucket['balance'] = bucket['income'] - bucket['expense']
+        bucket['by_category'] = dict(sorted(bucket['by_category'].items()))
+        result.append(bucket)
+    return result, last_day
+
+
+def _summarize(buckets: List[Dict[str, Any]]) -> Dict[str, Any]:
+    income = sum(b['income'] for b in buckets)
+    expense = sum(b['expense'] for b in buckets)
+    by_category = {}
+    for b in buckets:
+        for name, total in b['by_category'].items():
+            by_category[name] = by_category.get(name, 0) + total
+    return {
+        'income': income,
+        'expense': expense,
+        'balance': income - expense,
+        'count': sum(b['count'] for b in buckets),
+        'by_category': dict(sorted(by_category.items())),
+    }
+
+
+def _to_money(totals: Dict[str, Any]) -> Dict[str, Any]:
+    """Copia de un período/total con los montos en decimales (la API)"""
+    result = dict(totals)
+    for key in ('income', 'expense', 'balance'):
+        result[key] = from_cents(totals[key])
+    result['by_category'] = {name: from_cents(total) for name, total in totals['by_category'].items()}
+    return result
+
+
+def _change(current: int, previous: int) -> Dict[str, Any]:
+    return {
+        'amount': from_cents(current - previous),
+        'percent': round(100.0 * (current - previous) / abs(previous), 1) if previous else None,
+    }
+
+
+def read_timeseries(conn, user_id: int, granularity: str, date_from: date, date_to: date,
+                    compare: bool = False) -> Dict[str, Any]:
+    """
+    Serie de ingresos/gastos por día, semana o mes entre dos fechas
+    (ajustadas al inicio/fin de sus períodos). Con compare=True agrega el
+    mismo número de períodos inmediatamente anteriores y la variación.
+    """
+    first = bucket_start(date_from, granularity)
+    last = bucket_start(date_to, granularity)
+    count = 0
+    while shift_bucket(first, granularity, count) <= last:
+        count += 1
+
+    buckets, last_day = _read_buckets(conn, user_id, granularity, first, count)
+    totals = _summarize(buckets)
+    result = {
+        'granularity': granularity,
+        'from': first.isoformat(),
+        'to': last_day.isoformat(),
+        'buckets': [_to_money(bucket) for bucket in buckets],
+        'totals': _to_money(totals),
+    }
+
+    if compare:
+        prev_first = shift_bucket(first, granularity, -count)
+        prev_buckets, prev_last_day = _read_buckets(conn, user_id, granularity, prev_first, count)
+        prev_totals = _summarize(prev_buckets)
+        categories = set(totals['by_category']) | set(prev_totals['by_category'])
+        result['previous'] = {
+            'from': prev_first.isoformat(),
+            'to': prev_last_day.isoformat(),
+            'totals': _to_money(prev_totals),
+        }
+        result['change'] = {
+            'income': _change(totals['income'], prev_totals['income']),
+            'expense': _change(totals['expense'], prev_totals['expense']),
+            'balance': _change(totals['balance'], prev_totals['balance']),
+            'by_category': {
+                name: _change(totals['by_category'].get(name, 0), prev_totals['by_category'].get(name, 0))
+                for name in sorted(categories)
+            },
+        }
+    return result
+
+
+def main(argv):
+    if len(argv) < 2 or argv[1] not in ('verify', 'rebuild'):
+        print('Uso: python -m db.rollups verify|rebuild [user_id]')
+        return 2
+    user_id = int(argv[2]) if len(argv) > 2 else None
+
+    # Una BD sin migrar se pone al día (crea y llena estas tablas)
+    from db.migrations import migrate
+    migrate()
+
+    drift = []
+    for pool in pools_for(user_id):
+        with use_pool(pool):
+            drift.extend(verify_rollups(user_id))
+    for d in drift:
+        key = ' '.join(f'{name}={d[name]!r}' for name, _ in ROLLUPS[d['table']])
+        print(f"{d['table']} user={d['user_id']} {key}: "
+              f"count {d['actual_count']} (esperado {d['expected_count']}), "
+              f"total {d['actual_total']} (esperado {d['expected_total']})")
+    print(f'{len(drift)} diferencia(s)')
+
+    if argv[1] == 'rebuild':
+        for pool in pools_for(user_id):
+            with use_pool(pool):
+                rebuild_rollups(user_id)
+        print('Totales recalculados')
+        return 0
+    return 1 if drift else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,173 @@
+"""
+Búsqueda de texto completo sobre las descripciones (FTS5)
+
+transactions_fts guarda por transacción (rowid = id) la descripción y un
+token con el dueño ('u<user_id>'), así la búsqueda de un usuario es una
+intersección de listas del índice y no un filtro posterior. Se tokeniza
+con unicode61 sin acentos ni mayúsculas y con índices de prefijo de 2 y 3
+letras. Triggers sobre transactions lo mantienen al día.
+
+El ranking (bm25) se calcula sobre todas las coincidencias del usuario en
+cada página: el costo crece con la cantidad de coincidencias, no con el
+tamaño de la tabla.
+
+El índice se crea y se llena por lotes con la migración 3 (db/migrations.py).
+Para bases existentes o para reconstruirlo:
+
+    cd backend && python -m db.search backfill   # aplica la migración pendiente
+    cd backend && python -m db.search rebuild    # vacía y vuelve a indexar por lotes
+    cd backend && python -m db.search check      # filas sin indexar / sobrantes
+"""
+import argparse
+import re
+import sys
+import time
+from typing import Any, Dict, List
+
+from db.connection import connection, transaction, use_pool
+from db.sharding import pools_for
+
+SEARCH_MAX_TERMS = 8
+# Palabras más cortas no usan el índice de prefijos (recorrerían todo el vocabulario)
+SEARCH_MIN_TERM = 2
+SEARCH_MAX_LENGTH = 100
+
+SEARCH_TABLE = '''CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts
+                  USING fts5(description, owner,
+                             tokenize = 'unicode61 remove_diacritics 2',
+                             prefix = '2 3')'''
+
+# El dueño no cuenta para el ranking (bm25 con peso 0 en la columna owner)
+_RANK = "INSERT INTO transactions_fts (transactions_fts, rank) VALUES ('rank', 'bm25(1.0, 0.0)')"
+
+SEARCH_TRIGGERS = [
+    '''CREATE TRIGGER IF NOT EXISTS trg_fts_insert AFTER INSERT ON transactions
+       BEGIN
+           INSERT INTO transactions_fts (rowid, description, owner)
+           VALUES (NEW.id, NEW.description, 'u' || NEW.user_id);
+       END''',
+    # Si la fila todavía no se indexó (backfill en curso) no toca nada:
+    # el lote que la copie leerá el valor nuevo
+    '''CREATE TRIGGER IF NOT EXISTS trg_fts_update AFTER UPDATE OF description, user_id ON transactions
+       BEGIN
+           UPDATE transactions_fts SET description = NEW.description, owner = 'u' || NEW.user_id
+           WHERE rowid = OLD.id;
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS trg_fts_delete AFTER DELETE ON transactions
+       BEGIN
+           DELETE FROM transactions_fts WHERE rowid = OLD.id;
+       END''',
+]
+
+_TERM = re.compile(r'\w+', re.UNICODE)
+
+
+def create_search_index(conn) -> None:
+    """Tabla FTS5, ranking y triggers (sin llenar)"""
+    conn.execute(SEARCH_TABLE)
+    conn.execute(_RANK)
+    for trigger in SEARCH_TRIGGERS:
+        conn.execute(trigger)
+
+
+def backfill_step(conn, state: Dict[str, Any], batch_size: int) -> bool:
+    """
+    Indexa el siguiente lote de ids en (last_id, max_id]; True al terminar.
+    Las filas con id > max_id llegaron con los triggers ya activos.
+    """
+    bounds = (state['last_id'], state['max_id'], batch_size)
+    last = conn.execute('''SELECT MAX(id) FROM
+                           (SELECT id FROM transactions WHERE id > ? AND id <= ? ORDER BY id LIMIT ?)''',
+                        bounds).fetchone()[0]
+    if last is None:
+        return True
+    conn.execute('''INSERT OR REPLACE INTO transactions_fts (rowid, description, owner)
+                    SELECT id, description, 'u' || user_id FROM transactions
+                    WHERE id > ? AND id <= ?''', (state['last_id'], last))
+    state['last_id'] = last
+    return last >= state['max_id']
+
+
+def match_expression(user_id: int, query: str) -> str:
+    """
+    Expresión MATCH para la búsqueda de un usuario: cada palabra es un
+    prefijo y tienen que estar todas (se ignoran las de una letra).
+    ValueError si no queda ninguna.
+    """
+    terms = [term for term in _TERM.findall(query[:SEARCH_MAX_LENGTH]) if len(term) >= SEARCH_MIN_TERM]
+    if not terms:
+        raise ValueError(f'La búsqueda debe tener al menos una palabra de {SEARCH_MIN_TERM} letras')
+    terms = terms[:SEARCH_MAX_TERMS]
+    # Entre comillas: las palabras no se interpretan como operadores (AND, NEAR...)
+    words = ' AND '.join(f'"{term}"*' for term in terms)
+    return f'owner : u{int(user_id)} AND description : ({words})'
+
+
+# ==================== MANTENIMIENTO ====================
+
+def rebuild(batch_size: int = 5000, pause: float = 0.01) -> int:
+    """
+    Vacía el índice y lo vuelve a llenar por lotes cortos; los triggers
+    siguen activos, así que se puede correr con la app funcionando.
+    Retorna las filas indexadas.
+    """
+    with transaction() as conn:
+        create_search_index(conn)
+        conn.execute('DELETE FROM transactions_fts')
+        max_id = conn.execute('SELECT MAX(id) FROM transactions').fetchone()[0] or 0
+    state = {'last_id': 0, 'max_id': max_id}
+    done = max_id == 0
+    while not done:
+        with transaction() as conn:
+            done = backfill_step(conn, state, batch_size)
+        if pause > 0:
+            time.sleep(pause)
+    with connection() as conn:
+        return conn.execute('SELECT COUNT(*) FROM transactions_fts').fetchone()[0]
+
+
+def check() -> Dict[str, int]:
+    """Transacciones sin indexar y entradas del índice sin transacción"""
+    with connection() as conn:
+        missing = conn.execute('''SELECT COUNT(*) FROM transactions t
+                                  WHERE NOT EXISTS (SELECT 1 FROM transactions_fts f WHERE f.rowid = t.id)'''
+                               ).fetchone()[0]
+        orphaned = conn.execute('''SELECT COUNT(*) FROM transactions_fts f
+                                   WHERE NOT EXISTS (SELECT 1 FROM transactions t WHERE t.id = f.rowid)'''
+                                ).fetchone()[0]
+    return {'missing': missing, 'orphaned': orphaned}
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog='python -m db.search')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('backfill', help='crea y llena el índice (migraciones pendientes)')
+    run = sub.add_parser('rebuild', help='vacía y vuelve a llenar el índice')
+    run.add_argument('--batch-size', type=int, default=5000)
+    run.add_argument('--pause', type=float, default=0.01)
+    sub.add_parser('check', help='compara el índice con transactions')
+    args = parser.parse_args(argv[1:])
+
+    if args.command == 'backfill':
+        from db.migrations import migrate
+        applied = migrate()
+        print(f"{len(applied)} migración(es) aplicada(s)")
+    elif args.command == 'rebuild':
+        start = time.perf_counter()
+        count = 0
+        for pool in pools_for():
+            with use_pool(pool):
+                count += rebuild(args.batch_size, args.pause)
+        print(f"{count:,} transacciones indexadas en {time.perf_counter() - start:.1f}s")
+
+    result = {'missing': 0, 'orphaned': 0}
+    for pool in pools_for():
+        with use_pool(pool):
+            for key, value in check().items():
+                result[key] += value
+    print(f"sin indexar: {result['missing']}, sobrantes: {result['orphaned']}")
+    return 1 if result['missing'] or result['orphaned'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
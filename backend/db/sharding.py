@@ -0,0 +1,492 @@
+"""
+Particiones: los datos de cada usuario en uno de N archivos SQLite
+
+Con DB_SHARDS=N, la BD principal (DATABASE_PATH) pasa a ser el directorio:
+usuarios, sesiones, jobs de recategorización, el mapa usuario -> partición
+(user_shards) y el reparto de ids (id_blocks). Las transacciones y todo lo
+que cuelga de ellas (totales, búsqueda, presupuestos, reglas, modelo,
+recurrentes, importaciones) viven en `<base>.shardK.db`. Todos los archivos
+tienen el mismo esquema (migrate() los migra a todos).
+
+- Un usuario nuevo va a la partición hash(user_id) % N (un trigger sobre
+  users lo anota en user_shards). Uno sin entrada sigue en la BD principal:
+  son los datos de antes de activar las particiones, hasta que `rebalance`
+  los mueva.
+- require_session elige el archivo del usuario una vez por request
+  (user_scope) y los modelos siguen usando connection()/transaction().
+  Cada worker recuerda usuario -> partición DB_SHARD_CACHE_TTL segundos,
+  así un request no consulta el directorio.
+- Los ids de transactions, budgets, user_rules e import_jobs salen de
+  bloques reservados en el directorio (allocate_ids), así son únicos entre
+  archivos y mover a un usuario no los cambia.
+
+Mover a un usuario (move_user) no frena la app:
+1. copia sus filas al destino sin bloquear el origen (ATTACH + INSERT
+   SELECT; los triggers del destino rearman totales, búsqueda y versión);
+2. bloquea las escrituras del origen, recopia lo que cambió mientras tanto
+   y confirma el destino;
+3. apunta el mapa al destino, borra las filas del origen y deja una marca
+   (moved_users) que rechaza las inserciones que llegaron tarde al archivo
+   viejo. Esos requests fallan y el cliente reintenta. Los otros workers
+   pueden seguir yendo al archivo viejo hasta que venza su caché del mapa
+   (DB_SHARD_CACHE_TTL): en ese lapso leen el historial vacío y sus
+   inserciones se rechazan.
+Si el proceso se corta a mitad, `cleanup` borra las copias que quedaron en
+archivos que no son los del mapa. Las alertas de presupuesto se renumeran
+hacia arriba al moverse: un cliente puede recibir alguna dos veces.
+
+Todos los procesos deben usar el mismo DB_SHARDS. Uso (desde backend/):
+    python -m db.sharding status
+    python -m db.sharding rebalance [--dry-run]
+    python -m db.sharding move USER_ID SHARD
+    python -m db.sharding cleanup
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from db.connection import (
+    ConnectionPool, directory_connection, directory_pool, directory_transaction, use_pool
+)
+
+DB_SHARDS = int(os.environ.get('DB_SHARDS', '0'))
+# Ids que reserva cada proceso por viaje al directorio
+ID_BLOCK_SIZE = int(os.environ.get('DB_ID_BLOCK_SIZE', '1000'))
+# Cuánto recuerda cada worker la partición de un usuario (0 = consultar siempre)
+SHARD_CACHE_TTL = float(os.environ.get('DB_SHARD_CACHE_TTL', '5'))
+SHARD_CACHE_SIZE = 100_000
+
+# Tablas cuyos ids reparte el directorio
+ALLOCATED_IDS = ('transactions', 'budgets', 'user_rules', 'import_jobs')
+
+# Tablas por usuario que se copian al moverlo, en orden (presupuestos y
+# alertas antes que transactions: sus triggers ya encuentran las alertas).
+# Las del historial cambian junto con user_data_versions; las demás se
+# recopian siempre en el paso final.
+HISTORY_TABLES = ('transaction_fingerprints', 'category_corrections', 'category_model_docs',
+                  'category_model_tokens', 'category_models')
+SETTINGS_TABLES = ('budgets', 'budget_alerts', 'user_rules', 'user_rule_sets', 'recurring_charges',
+                   'recurring_state', 'import_jobs')
+# Mantenidas por los triggers de transactions (no se copian)
+DERIVED_TABLES = ('user_category_totals', 'user_daily_totals', 'user_monthly_totals', 'user_data_versions')
+# Inserciones que se rechazan para un usuario que ya no vive en el archivo
+GUARDED_TABLES = ('transactions', 'transaction_fingerprints', 'budgets', 'user_rules', 'import_jobs',
+                  'category_corrections')
+
+SHARDING_TABLES = [
+    '''CREATE TABLE IF NOT EXISTS user_shards
+       (user_id INTEGER PRIMARY KEY,
+        shard INTEGER NOT NULL,
+        moved_at TIMESTAMP)''',
+    '''CREATE TABLE IF NOT EXISTS id_blocks
+       (name TEXT PRIMARY KEY,
+        next_id INTEGER NOT NULL)''',
+    '''CREATE TABLE IF NOT EXISTS moved_users
+       (user_id INTEGER PRIMARY KEY,
+        shard INTEGER,
+        moved_at TIMESTAMP)''',
+] + [
+    f'''CREATE TRIGGER IF NOT EXISTS trg_moved_{table} BEFORE INSERT ON {table}
+        WHEN EXISTS (SELECT 1 FROM moved_users WHERE user_id = NEW.user_id)
+        BEGIN SELECT RAISE(ABORT, 'El usuario se movió a otra partición'); END'''
+    for table in GUARDED_TABLES
+]
+
+# Hash multiplicativo (Knuth) de 32 bits, igual en Python y en SQL. Se
+# usan los 16 bits altos: los bajos casi no mezclan ids consecutivos
+_HASH = 2654435761
+
+
+def create_sharding(conn) -> None:
+    """Tablas del directorio y marcas de usuarios movidos (idempotente, en todos los archivos)"""
+    for statement in SHARDING_TABLES:
+        conn.execute(statement)
+
+
+# ==================== ARCHIVOS ====================
+
+_shards = DB_SHARDS
+_shard_pools: Dict[str, ConnectionPool] = {}
+_lock = threading.Lock()
+
+
+def configure_shards(shards: int) -> None:
+    """Cambia la cantidad de particiones del proceso (CLI, benchmarks)"""
+    global _shards
+    _shards = shards
+
+
+def shard_count() -> int:
+    return _shards
+
+
+def shard_path(shard: int, database: Optional[str] = None) -> str:
+    root, ext = os.path.splitext(database or directory_pool().database)
+    return f'{root}.shard{shard}{ext or ".db"}'
+
+
+def shard_pool(shard: int) -> ConnectionPool:
+    """Pool del archivo de la partición (se crea al primer uso)"""
+    path = shard_path(shard)
+    pool = _shard_pools.get(path)
+    if pool is None:
+        with _lock:
+            pool = _shard_pools.get(path)
+            if pool is None:
+                base = directory_pool()
+                pool = _shard_pools[path] = ConnectionPool(
+                    path, base.size, base.timeout, base.busy_timeout_ms, base.busy_retries,
+                    base.statement_cache, base.trace)
+    return pool
+
+
+def pools() -> List[Tuple[str, ConnectionPool]]:
+    """(nombre, pool) de cada archivo: la BD principal y luego las particiones"""
+    return [('principal', directory_pool())] + [(f'shard{i}', shard_pool(i)) for i in range(_shards)]
+
+
+def shard_stats() -> List[Dict[str, Any]]:
+    """Métricas de los pools de las particiones abiertos en este proceso"""
+    return [dict(pool.stats(), database=pool.database) for pool in list(_shard_pools.values())]
+
+
+# ==================== RUTEO ====================
+
+def home_shard(user_id: int, shards: Optional[int] = None) -> int:
+    """Partición que le corresponde al usuario por hash"""
+    return (user_id * _HASH) % 4294967296 // 65536 % (shards or _shards)
+
+
+def user_shard(user_id: int) -> Optional[int]:
+    """Partición donde vive el usuario (None = BD principal)"""
+    with directory_connection() as conn:
+        row = conn.execute('SELECT shard FROM user_shards WHERE user_id = ?', (user_id,)).fetchone()
+    return row[0] if row else None
+
+
+# user_id -> (partición, vence); lecturas y escrituras sueltas de un dict, sin lock
+_routes: Dict[int, Tuple[Optional[int], float]] = {}
+
+
+def cached_user_shard(user_id: int) -> Optional[int]:
+    """user_shard recordado por SHARD_CACHE_TTL segundos en este proceso"""
+    now = time.monotonic()
+    entry = _routes.get(user_id)
+    if entry is not None and entry[1] > now:
+        return entry[0]
+    shard = user_shard(user_id)
+    if SHARD_CACHE_TTL > 0:
+        if len(_routes) >= SHARD_CACHE_SIZE:
+            _routes.clear()
+        _routes[user_id] = (shard, now + SHARD_CACHE_TTL)
+    return shard
+
+
+def pool_for(user_id: int) -> ConnectionPool:
+    """Pool del archivo con los datos del usuario"""
+    if not _shards:
+        return directory_pool()
+    shard = cached_user_shard(user_id)
+    return directory_pool() if shard is None else shard_pool(shard)
+
+
+def pools_for(user_id: Optional[int] = None) -> List[ConnectionPool]:
+    """El archivo del usuario o, sin usuario, todos (comandos de mantenimiento)"""
+    return [pool_for(user_id)] if user_id is not None else [pool for _, pool in pools()]
+
+
+@contextmanager
+def user_scope(user_id: int) -> Iterator[Optional[ConnectionPool]]:
+    """Dentro del bloque, connection()/transaction() van al archivo del usuario"""
+    if not _shards:
+        yield None
+        return
+    with use_pool(pool_for(user_id)) as pool:
+        yield pool
+
+
+# ==================== IDS ====================
+
+_blocks: Dict[str, List[int]] = {}
+
+
+def _after_fork():
+    # Un bloque heredado lo usaría también el padre
+    global _lock
+    _lock = threading.Lock()
+    _blocks.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def allocate_ids(name: str, count: int = 1) -> Optional[List[int]]:
+    """
+    `count` ids nuevos para la tabla (None sin particiones: los asigna
+    SQLite). Llamar antes de abrir la transacción de escritura: el bloque
+    se reserva con otra transacción sobre el directorio.
+    """
+    if not _shards:
+        return None
+    ids: List[int] = []
+    with _lock:
+        while len(ids) < count:
+            block = _blocks.get(name)
+            if block is None or block[0] >= block[1]:
+                size = max(ID_BLOCK_SIZE, count - len(ids))
+                with directory_transaction() as conn:
+                    end = conn.execute('UPDATE id_blocks SET next_id = next_id + ? WHERE name = ? RETURNING next_id',
+                                       (size, name)).fetchone()[0]
+                block = _blocks[name] = [end - size, end]
+            take = min(count - len(ids), block[1] - block[0])
+            ids.extend(range(block[0], block[0] + take))
+            block[0] += take
+    return ids
+
+
+def new_id(name: str) -> Optional[int]:
+    """Un id nuevo para la tabla (None sin particiones)"""
+    ids = allocate_ids(name)
+    return ids[0] if ids else None
+
+
+def prepare_directory() -> None:
+    """
+    Al arrancar con particiones: los contadores de ids quedan por encima de
+    todo id existente y los usuarios nuevos se anotan en su partición.
+    """
+    tops = {name: 0 for name in ALLOCATED_IDS}
+    for _, pool in pools():
+        with pool.connection() as conn:
+            for name in ALLOCATED_IDS:
+                tops[name] = max(tops[name], conn.execute(f'SELECT MAX(id) FROM {name}').fetchone()[0] or 0)
+    with directory_transaction() as conn:
+        conn.executemany('''INSERT INTO id_blocks (name, next_id) VALUES (?, ?)
+                            ON CONFLICT (name) DO UPDATE SET next_id = MAX(next_id, excluded.next_id)''',
+                         [(name, top + 1) for name, top in tops.items()])
+        conn.execute('DROP TRIGGER IF EXISTS trg_user_shard')
+        conn.execute(f'''CREATE TRIGGER trg_user_shard AFTER INSERT ON users
+                         BEGIN INSERT OR IGNORE INTO user_shards (user_id, shard)
+                               VALUES (NEW.id, (NEW.id * {_HASH}) % 4294967296 / 65536 % {int(_shards)}); END''')
+
+
+# ==================== MOVER USUARIOS ====================
+
+def _open(path: str) -> sqlite3.Connection:
+    """Conexión propia (fuera del pool) con las transacciones a mano"""
+    base = directory_pool()
+    conn = sqlite3.connect(path, timeout=base.busy_timeout_ms / 1000, isolation_level=None)
+    conn.execute(f'PRAGMA busy_timeout={int(base.busy_timeout_ms)}')
+    return conn
+
+
+def _columns(conn, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f'PRAGMA main.table_info({table})')]
+
+
+def _signature(conn, schema: str, user_id: int) -> Tuple[int, int]:
+    """(versión de los datos, transacciones) del usuario en el archivo"""
+    version = conn.execute(f'SELECT version FROM {schema}.user_data_versions WHERE user_id = ?',
+                           (user_id,)).fetchone()
+    count = conn.execute(f'SELECT COUNT(*) FROM {schema}.transactions WHERE user_id = ?', (user_id,)).fetchone()[0]
+    return (version[0] if version else 0), count
+
+
+def _copy(conn, user_id: int, tables: Tuple[str, ...]) -> None:
+    """Reemplaza las filas del usuario en main por las de src (ya en una transacción)"""
+    for table in reversed(tables):
+        conn.execute(f'DELETE FROM main.{table} WHERE user_id = ?', (user_id,))
+    conn.execute('DELETE FROM main.moved_users WHERE user_id = ?', (user_id,))
+    for table in tables:
+        columns = _columns(conn, table)
+        select = list(columns)
+        params: List[Any] = []
+        if table == 'budget_alerts':
+            # Los ids de alertas los asigna SQLite: se corren por encima de los del destino
+            top = conn.execute('SELECT COALESCE(MAX(id), 0) FROM main.budget_alerts').fetchone()[0]
+            low = conn.execute('SELECT MIN(id) FROM src.budget_alerts WHERE user_id = ?', (user_id,)).fetchone()[0]
+            select[columns.index('id')] = 'id + ?'
+            params.append(max(0, top - (low or 0) + 1))
+        conn.execute(f'''INSERT INTO main.{table} ({', '.join(columns)})
+                         SELECT {', '.join(select)} FROM src.{table} WHERE user_id = ?''', params + [user_id])
+
+
+def _purge(conn, user_id: int, moved_to: Optional[int]) -> None:
+    """Borra al usuario del archivo y deja la marca (ya en una transacción)"""
+    # Primero transactions: sus triggers vacían totales y búsqueda
+    conn.execute('DELETE FROM transactions WHERE user_id = ?', (user_id,))
+    for table in HISTORY_TABLES + SETTINGS_TABLES + DERIVED_TABLES:
+        conn.execute(f'DELETE FROM {table} WHERE user_id = ?', (user_id,))
+    conn.execute('''INSERT INTO moved_users (user_id, shard, moved_at) VALUES (?, ?, ?)
+                    ON CONFLICT (user_id) DO UPDATE SET shard = excluded.shard, moved_at = excluded.moved_at''',
+                 (user_id, moved_to, datetime.now().isoformat()))
+
+
+def move_user(user_id: int, target: int) -> Dict[str, Any]:
+    """
+    Mueve los datos del usuario a la partición `target` con la app en
+    marcha (ver el docstring del módulo). Retorna lo copiado y cuánto
+    estuvieron bloqueadas las escrituras del origen.
+    """
+    source_shard = user_shard(user_id)
+    if source_shard == target:
+        return {'user_id': user_id, 'moved': False}
+    source_path = directory_pool().database if source_shard is None else shard_path(source_shard)
+    start = time.perf_counter()
+
+    dest = _open(shard_path(target))
+    dest.execute('ATTACH DATABASE ? AS src', (source_path,))
+    source = None
+    try:
+        # 1. Copia con el origen libre
+        dest.execute('BEGIN')
+        copied = _signature(dest, 'src', user_id)
+        _copy(dest, user_id, SETTINGS_TABLES + HISTORY_TABLES + ('transactions',))
+        dest.execute('COMMIT')
+
+        # 2. Con las escrituras del origen bloqueadas, lo que cambió mientras tanto
+        source = _open(source_path)
+        source.execute('BEGIN IMMEDIATE')
+        locked = time.perf_counter()
+        dest.execute('BEGIN')
+        current = _signature(dest, 'src', user_id)
+        changed = current != copied or _signature(dest, 'main', user_id)[1] != copied[1]
+        _copy(dest, user_id, (SETTINGS_TABLES + HISTORY_TABLES + ('transactions',)) if changed else SETTINGS_TABLES)
+        # La versión sigue subiendo: los ETag y cachés del origen no valen en el destino
+        version = max(current[0], _signature(dest, 'main', user_id)[0]) + 1
+        dest.execute('''INSERT INTO main.user_data_versions (user_id, version) VALUES (?, ?)
+                        ON CONFLICT (user_id) DO UPDATE SET version = excluded.version''', (user_id, version))
+        dest.execute('COMMIT')
+
+        # 3. Mapa al destino, origen vacío y marcado
+        now = datetime.now().isoformat()
+        flip = ('''INSERT INTO user_shards (user_id, shard, moved_at) VALUES (?, ?, ?)
+                   ON CONFLICT (user_id) DO UPDATE SET shard = excluded.shard, moved_at = excluded.moved_at''',
+                (user_id, target, now))
+        if source_shard is None:
+            source.execute(*flip)
+        else:
+            with directory_transaction() as conn:
+                conn.execute(*flip)
+        _purge(source, user_id, target)
+        source.execute('COMMIT')
+        blocked = time.perf_counter() - locked
+        _routes.pop(user_id, None)
+    except BaseException:
+        for conn in (dest, source):
+            if conn is not None and conn.in_transaction:
+                conn.execute('ROLLBACK')
+        raise
+    finally:
+        dest.close()
+        if source is not None:
+            source.close()
+    return {
+        'user_id': user_id,
+        'moved': True,
+        'from': source_shard,
+        'to': target,
+        'transactions': current[1],
+        'recopied': changed,
+        'blocked_ms': round(blocked * 1000, 1),
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+
+
+def rebalance(dry_run: bool = False) -> Iterator[Dict[str, Any]]:
+    """Mueve a su partición (por hash) a cada usuario que no está en ella"""
+    with directory_connection() as conn:
+        users = conn.execute('''SELECT u.id, s.shard FROM users u
+                                LEFT JOIN user_shards s ON s.user_id = u.id ORDER BY u.id''').fetchall()
+    for user_id, shard in users:
+        target = home_shard(user_id)
+        if shard == target:
+            continue
+        yield {'user_id': user_id, 'moved': False, 'from': shard, 'to': target} if dry_run \
+            else move_user(user_id, target)
+
+
+def cleanup() -> Dict[str, int]:
+    """
+    Borra las filas de usuarios que quedaron en un archivo que no es el
+    suyo (movimientos cortados). No correrlo junto con un rebalance.
+    """
+    with directory_connection() as conn:
+        located = dict(conn.execute('SELECT user_id, shard FROM user_shards').fetchall())
+    union = ' UNION '.join(f'SELECT user_id FROM {table}'
+                           for table in ('transactions',) + HISTORY_TABLES + SETTINGS_TABLES + DERIVED_TABLES)
+    purged = {}
+    for index, (label, pool) in enumerate(pools()):
+        shard = None if index == 0 else index - 1
+        with pool.connection() as conn:
+            present = [row[0] for row in conn.execute(union)]
+        strays = [user_id for user_id in present if located.get(user_id) != shard]
+        for user_id in strays:
+            with pool.transaction() as conn:
+                _purge(conn, user_id, located.get(user_id))
+        purged[label] = len(strays)
+    return purged
+
+
+def status() -> List[Dict[str, Any]]:
+    """Usuarios, transacciones y tamaño de cada archivo"""
+    result = []
+    for label, pool in pools():
+        with pool.connection() as conn:
+            users, rows = conn.execute('SELECT COUNT(DISTINCT user_id), COUNT(*) FROM transactions').fetchone()
+        size = os.path.getsize(pool.database) if os.path.exists(pool.database) else 0
+        result.append({'file': label, 'database': pool.database, 'users': users, 'transactions': rows,
+                       'bytes': size})
+    return result
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog='python -m db.sharding')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('status', help='usuarios y transacciones por archivo')
+    cmd = sub.add_parser('rebalance', help='mueve a cada usuario a su partición')
+    cmd.add_argument('--dry-run', action='store_true', help='solo lista los movimientos')
+    cmd = sub.add_parser('move', help='mueve un usuario a una partición')
+    cmd.add_argument('user_id', type=int)
+    cmd.add_argument('shard', type=int)
+    sub.add_parser('cleanup', help='borra copias sobrantes de movimientos cortados')
+    args = parser.parse_args(argv[1:])
+
+    if not _shards:
+        print('DB_SHARDS no está configurado')
+        return 2
+    # Crea y migra los archivos que falten
+    from db.migrations import migrate
+    migrate()
+
+    if args.command in ('rebalance', 'move'):
+        moves = rebalance(args.dry_run) if args.command == 'rebalance' else [move_user(args.user_id, args.shard)]
+        count = 0
+        for move in moves:
+            origin = 'principal' if move.get('from') is None else f"shard{move['from']}"
+            if move.get('moved'):
+                count += 1
+                print(f"usuario {move['user_id']}: {origin} -> shard{move['to']}, {move['transactions']} "
+                      f"transacciones en {move['seconds']}s (escrituras bloqueadas {move['blocked_ms']} ms)")
+            elif 'to' in move:
+                print(f"usuario {move['user_id']}: {origin} -> shard{move['to']} (sin mover)")
+        print(f"{count} usuario(s) movido(s)")
+    elif args.command == 'cleanup':
+        for label, count in cleanup().items():
+            print(f"{label:<10} {count} usuario(s) limpiado(s)")
+
+    for info in status():
+        print(f"{info['file']:<10} {info['users']:>6} usuarios {info['transactions']:>10,} transacciones "
+              f"{info['bytes'] / 1e6:>9.1f} MB  {info['database']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,286 @@
+"""
+Interfaz de almacenamiento: usuarios, sesiones, transacciones,
+estadísticas, operaciones en bloque y lo que lee el categorizador por
+usuario (versiones y contenido de reglas y modelo)
+
+Las rutas, las sesiones, el categorizador, el streaming y la caché HTTP
+hablan con get_storage() en lugar de armar SQL. Hay dos motores:
+
+- SQLiteStorage (por defecto): delega en los modelos de db/models.py, con
+  pool, particiones, group commit y triggers.
+- MemoryStorage (db/memory_storage.py): diccionarios e índices ordenados
+  en el proceso, sin disco. Para tests y benchmarks en paralelo y para
+  medir cuánto del tiempo es SQLite. No abre ni crea ningún archivo.
+
+STORAGE_BACKEND=memory elige el segundo. Búsqueda, series temporales,
+presupuestos, reglas, recurrentes, correcciones, importaciones y
+recategorización no forman parte de la interfaz y leen SQLite, donde no
+están las filas del motor en memoria: con ese motor la app responde 501
+en esas rutas (ver sqlite_only_route). Como reglas y correcciones no se
+pueden escribir, el motor en memoria las lee vacías.
+"""
+import os
+import re
+import threading
+from abc import ABC, abstractmethod
+from contextlib import nullcontext
+from typing import Any, ContextManager, Dict, Iterator, List, Optional, Tuple
+
+from db.models import (
+    PAGE_SIZE_DEFAULT, STREAM_BATCH_SIZE, CategoryModel, Session, Transaction, User, UserRule
+)
+from db.sharding import user_scope
+from utils.security import hash_password, verify_and_update
+
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'sqlite')
+
+# (description, amount_cents, category, type, created_at o None)
+NewRow = Tuple[str, int, str, str, Optional[str]]
+# (fingerprint, description, amount_cents, category, type, created_at)
+ImportRow = Tuple[str, str, int, str, str, str]
+
+# Rutas que van directo a SQLite, fuera de la interfaz
+_SQLITE_ONLY_ROUTES = re.compile(
+    r'/api/(transactions/search|transactions/\d+/category|stats/timeseries'
+    r'|budgets|rules|recurring|imports|admin/recategorize)(/|$)'
+)
+
+
+class Storage(ABC):
+    """Repositorio de usuarios y transacciones (montos en centavos)"""
+
+    # ==================== USERS ====================
+
+    @abstractmethod
+    def create_user(self, username: str, password_hash: str, password_salt: str) -> Optional[int]:
+        """Id del usuario nuevo o None si el nombre ya existe"""
+
+    @abstractmethod
+    def get_user(self, username: str) -> Optional[Dict[str, Any]]:
+        """id, username, password_hash y password_salt"""
+
+    @abstractmethod
+    def set_password(self, user_id: int, password_hash: str, password_salt: str) -> None:
+        pass
+
+    def register(self, username: str, password: str) -> Optional[int]:
+        """Hashea la contraseña y crea el usuario (HashingBusyError si el pool está saturado)"""
+        password_hash, salt = hash_password(password)
+        return self.create_user(username, password_hash, salt)
+
+    def authenticate(self, username: str, password: str) -> Optional[Dict[str, Any]]:
+        """{'id', 'username'} si las credenciales son válidas; rehashea si hace falta"""
+        user = self.get_user(username)
+        if not user:
+            return None
+        valid, rehashed = verify_and_update(password, user['password_hash'], user['password_salt'])
+        if not valid:
+            return None
+        # Hash con parámetros viejos: se actualiza con los actuales
+        if rehashed:
+            self.set_password(user['id'], *rehashed)
+        return {'id': user['id'], 'username': user['username']}
+
+    def user_scope(self, user_id: int) -> ContextManager:
+        """Contexto de un request del usuario (con particiones, su archivo)"""
+        return nullcontext()
+
+    # ==================== SESSIONS ====================
+
+    @abstractmethod
+    def create_session(self, token_hash: str, user_id: int, expires_at: str) -> None:
+        pass
+
+    @abstractmethod
+    def get_session(self, token_hash: str) -> Optional[Dict[str, Any]]:
+        """user_id y expires_at (vigente o no), o None"""
+
+    @abstractmethod
+    def delete_session(self, token_hash: str) -> bool:
+        pass
+
+    @abstractmethod
+    def touch_sessions(self, items: List[Tuple[str, str]]) -> None:
+        """last_seen en lote: items = [(last_seen, token_hash)]"""
+
+    @abstractmethod
+    def purge_sessions(self) -> int:
+        """Borra las sesiones vencidas; retorna cuántas"""
+
+    # ==================== CATEGORIZATION ====================
+
+    @abstractmethod
+    def rules_version(self, user_id: int) -> int:
+        """Versión de las reglas del usuario (sube con cada cambio)"""
+
+    @abstractmethod
+    def load_rules(self, user_id: int) -> Tuple[int, List[Dict[str, Any]]]:
+        """(versión, reglas en orden de evaluación), para compilar el matcher"""
+
+    @abstractmethod
+    def model_version(self, user_id: int) -> int:
+        """Versión del modelo de correcciones del usuario"""
+
+    @abstractmethod
+    def load_model(self, user_id: int, max_tokens: int) -> Optional[Dict[str, Any]]:
+        """Conteos del modelo (version, docs, counts) o None sin correcciones"""
+
+    # ==================== TRANSACTIONS ====================
+
+    @abstractmethod
+    def create_transaction(self, user_id: int, description: str, amount_cents: int, category: str,
+                           trans_type: str, created_at: Optional[str] = None) -> Optional[int]:
+        pass
+
+    @abstractmethod
+    def get_transaction(self, trans_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+        """Columnas de LIST_COLUMNS, o None si no existe o es de otro usuario"""
+
+    @abstractmethod
+    def update_transaction(self, trans_id: int, user_id: int, description: str, amount_cents: int,
+                           category: str, trans_type: str) -> bool:
+        pass
+
+    @abstractmethod
+    def delete_transaction(self, trans_id: int, user_id: int) -> bool:
+        pass
+
+    @abstractmethod
+    def list_page(self, user_id: int, limit: int = PAGE_SIZE_DEFAULT, cursor: Optional[str] = None,
+                  filters: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Igual que Transaction.list_page: (transacciones, cursor siguiente o None)"""
+
+    @abstractmethod
+    def iter_batches(self, user_id: int, cursor: Optional[str] = None,
+                     filters: Optional[Dict[str, Any]] = None,
+                     batch_size: int = STREAM_BATCH_SIZE) -> Iterator[List[Tuple]]:
+        """Todo el listado en lotes de tuplas (columnas de LIST_COLUMNS)"""
+
+    @abstractmethod
+    def data_version(self, user_id: int) -> int:
+        """Cambia con cada escritura del usuario (ETags)"""
+
+    # ==================== STATS ====================
+
+    @abstractmethod
+    def get_stats(self, user_id: int) -> Dict[str, Any]:
+        """total_expenses, total_income, balance y by_category"""
+
+    # ==================== BULK ====================
+
+    @abstractmethod
+    def create_many(self, user_id: int, rows: List[NewRow]) -> List[int]:
+        """Inserta todas las filas de una vez; ids en el mismo orden"""
+
+    @abstractmethod
+    def import_chunk(self, user_id: int, rows: List[ImportRow]) -> Tuple[int, int]:
+        """Inserta descartando huellas ya vistas; (insertados, duplicados)"""
+
+
+class SQLiteStorage(Storage):
+    """Motor por defecto: los modelos de db/models.py"""
+
+    def create_user(self, username, password_hash, password_salt):
+        return User.insert(username, password_hash, password_salt)
+
+    def get_user(self, username):
+        return User.get_by_username(username)
+
+    def set_password(self, user_id, password_hash, password_salt):
+        User.set_password(user_id, password_hash, password_salt)
+
+    def user_scope(self, user_id):
+        return user_scope(user_id)
+
+    def create_session(self, token_hash, user_id, expires_at):
+        Session.create(token_hash, user_id, expires_at)
+
+    def get_session(self, token_hash):
+        return Session.get(token_hash)
+
+    def delete_session(self, token_hash):
+        return Session.delete(token_hash)
+
+    def touch_sessions(self, items):
+        Session.touch_many(items)
+
+    def purge_sessions(self):
+        return Session.purge_expired()
+
+    def rules_version(self, user_id):
+        return UserRule.version(user_id)
+
+    def load_rules(self, user_id):
+        return UserRule.load(user_id)
+
+    def model_version(self, user_id):
+        return CategoryModel.version(user_id)
+
+    def load_model(self, user_id, max_tokens):
+        return CategoryModel.load(user_id, max_tokens)
+
+    def create_transaction(self, user_id, description, amount_cents, category, trans_type, created_at=None):
+        return Transaction.create(user_id, description, amount_cents, category, trans_type, created_at)
+
+    def get_transaction(self, trans_id, user_id):
+        return Transaction.get(trans_id, user_id)
+
+    def update_transaction(self, trans_id, user_id, description, amount_cents, category, trans_type):
+        return Transaction.update(trans_id, user_id, description, amount_cents, category, trans_type)
+
+    def delete_transaction(self, trans_id, user_id):
+        return Transaction.delete(trans_id, user_id)
+
+    def list_page(self, user_id, limit=PAGE_SIZE_DEFAULT, cursor=None, filters=None):
+        return Transaction.list_page(user_id, limit, cursor, filters)
+
+    def iter_batches(self, user_id, cursor=None, filters=None, batch_size=STREAM_BATCH_SIZE):
+        return Transaction.iter_batches(user_id, cursor, filters, batch_size)
+
+    def data_version(self, user_id):
+        return Transaction.data_version(user_id)
+
+    def get_stats(self, user_id):
+        return Transaction.get_stats(user_id)
+
+    def create_many(self, user_id, rows):
+        return Transaction.create_many(user_id, rows)
+
+    def import_chunk(self, user_id, rows):
+        return Transaction.import_chunk(user_id, rows)
+
+
+_storage: Optional[Storage] = None
+_lock = threading.Lock()
+
+
+def _build(backend: str) -> Storage:
+    if backend == 'memory':
+        from db.memory_storage import MemoryStorage
+        return MemoryStorage()
+    if backend == 'sqlite':
+        return SQLiteStorage()
+    raise ValueError(f'STORAGE_BACKEND desconocido: {backend}')
+
+
+def get_storage() -> Storage:
+    """Motor del proceso (se crea al primer uso según STORAGE_BACKEND)"""
+    global _storage
+    if _storage is None:
+        with _lock:
+            if _storage is None:
+                _storage = _build(STORAGE_BACKEND)
+    return _storage
+
+
+def sqlite_only_route(path: str) -> bool:
+    """True si la ruta necesita SQLite y el motor del proceso es otro"""
+    return not isinstance(get_storage(), SQLiteStorage) and _SQLITE_ONLY_ROUTES.match(path) is not None
+
+
+def configure_storage(backend: str = STORAGE_BACKEND) -> Storage:
+    """Reemplaza el motor del proceso (tests, benchmarks)"""
+    global _storage
+    with _lock:
+        _storage = _build(backend)
+    return _storage
@@ -0,0 +1,72 @@
+"""
+Reglas de categorización definidas por cada usuario
+
+Una regla asigna (categoría, tipo) a las transacciones cuya descripción
+contiene un texto (match = 'contains') o cumple una expresión regular
+('regex'), opcionalmente solo dentro de un rango de montos; con
+match = 'amount' decide solo el rango. Se evalúan por prioridad (menor
+primero, luego id) y antes que las reglas globales; ver
+utils/rule_matcher.py.
+
+user_rule_sets guarda la versión de las reglas de cada usuario: sube con
+cada alta, cambio o baja y las cachés de los workers la comparan para
+saber si recompilar.
+"""
+from typing import Any, Dict, List, Tuple
+
+# Máximo de reglas por usuario
+MAX_USER_RULES = 500
+# De esas, cuántas pueden ser 'regex' (cada una cuesta una búsqueda por descripción)
+MAX_REGEX_RULES = 50
+
+RULE_FIELDS = ('id', 'match', 'pattern', 'min_amount_cents', 'max_amount_cents',
+               'category', 'type', 'priority', 'created_at', 'updated_at')
+
+USER_RULE_TABLES = [
+    '''CREATE TABLE IF NOT EXISTS user_rules
+       (id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        match TEXT NOT NULL CHECK (match IN ('contains', 'regex', 'amount')),
+        pattern TEXT,
+        min_amount_cents INTEGER,
+        max_amount_cents INTEGER,
+        category TEXT NOT NULL,
+        type TEXT NOT NULL CHECK (type IN ('income', 'expense')),
+        priority INTEGER NOT NULL DEFAULT 100,
+        created_at TIMESTAMP,
+        updated_at TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id))''',
+    # Carga de las reglas de un usuario en orden de evaluación
+    'CREATE INDEX IF NOT EXISTS idx_user_rules_user ON user_rules(user_id, priority, id)',
+    '''CREATE TABLE IF NOT EXISTS user_rule_sets
+       (user_id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP)''',
+]
+
+
+def create_user_rules(conn) -> None:
+    """Tablas de reglas por usuario (idempotente)"""
+    for statement in USER_RULE_TABLES:
+        conn.execute(statement)
+
+
+def bump_rules_version(conn, user_id: int, now: str) -> int:
+    """Sube la versión de las reglas del usuario en la transacción abierta"""
+    conn.execute('''INSERT INTO user_rule_sets (user_id, version, updated_at) VALUES (?, 1, ?)
+                    ON CONFLICT (user_id) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at''',
+                 (user_id, now))
+    return rules_version(conn, user_id)
+
+
+def rules_version(conn, user_id: int) -> int:
+    row = conn.execute('SELECT version FROM user_rule_sets WHERE user_id = ?', (user_id,)).fetchone()
+    return row[0] if row else 0
+
+
+def load_rules(conn, user_id: int) -> Tuple[int, List[Dict[str, Any]]]:
+    """(versión, reglas en orden de evaluación)"""
+    version = rules_version(conn, user_id)
+    rows = conn.execute(f'''SELECT {', '.join(RULE_FIELDS)} FROM user_rules
+                            WHERE user_id = ? ORDER BY priority, id''', (user_id,)).fetchall()
+    return version, [dict(zip(RULE_FIELDS, row)) for row in rows]
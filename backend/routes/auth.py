@@ -1,8 +1,9 @@
 """Rutas de autenticación"""
 from flask import Blueprint, request, jsonify
-import sqlite3
 from utils.validators import ValidationError, validate_username, validate_password
-from utils.security import hash_password, verify_password
+from db.storage import get_storage
+from utils.security import HashingBusyError
+from utils.sessions import get_sessions, request_token
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -18,22 +19,16 @@ def register():
         password = validate_password(data.get('password', ''))
         
         # Hash password con salt
-        password_hash, salt = hash_password(password)
-        
-        conn = sqlite3.connect('expenses.db')
-        c = conn.cursor()
-        c.execute('INSERT INTO users (username, password_hash, password_salt) VALUES (?, ?, ?)',
-                  (username, password_hash, salt))
-        conn.commit()
-        user_id = c.lastrowid
-        conn.close()
+        user_id = get_storage().register(username, password)
+        if user_id is None:
+            return jsonify({'error': 'Usuario ya existe'}), 400
         
         return jsonify({'id': user_id, 'username': username}), 201
     
     except ValidationError as e:
         return jsonify({'error': str(e)}), 400
-    except sqlite3.IntegrityError:
-        return jsonify({'error': 'Usuario ya existe'}), 400
+    except HashingBusyError:
+        return jsonify({'error': 'Servidor ocupado'}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({'error': 'Error interno'}), 500
 
@@ -48,24 +43,30 @@ def login():
         username = validate_username(data.get('username', ''))
         password = data.get('password', '')
         
-        conn = sqlite3.connect('expenses.db')
-        c = conn.cursor()
-        c.execute('SELECT id, password_hash, password_salt FROM users WHERE username = ?', 
-                  (username,))
-        result = c.fetchone()
-        conn.close()
-        
-        if not result:
+        user = get_storage().authenticate(username, password)
+        if not user:
             return jsonify({'error': 'Credenciales incorrectas'}), 401
+        user_id = user['id']
         
-        user_id, stored_hash, salt = result
+        token, expires_at = get_sessions().create(user_id)
         
-        if not verify_password(password, stored_hash, salt):
-            return jsonify({'error': 'Credenciales incorrectas'}), 401
-        
-        return jsonify({'id': user_id, 'username': username}), 200
+        return jsonify({'id': user_id, 'username': username, 'token': token, 'expires_at': expires_at}), 200
     
     except ValidationError as e:
         return jsonify({'error': str(e)}), 400
+    except HashingBusyError:
+        return jsonify({'error': 'Servidor ocupado'}), 503, {'Retry-After': '1'}
+    except Exception as e:
+        return jsonify({'error': 'Error interno'}), 500
+
+@auth_bp.route('/logout', methods=['POST'])
+def logout():
+    """Revoca la sesión del header Authorization"""
+    try:
+        token = request_token()
+        if token:
+            get_sessions().revoke(token)
+        return jsonify({'message': 'Sesión cerrada'}), 200
+    
     except Exception as e:
         return jsonify({'error': 'Error interno'}), 500
@@ -0,0 +1,83 @@
+"""Rutas de presupuestos mensuales y sus alertas"""
+from datetime import date
+from flask import Blueprint, g, request, jsonify
+from db.models import Budget
+from utils.validators import ValidationError, validate_alert_params, validate_budget, validate_month
+from utils.categorizer import expense_categories
+from utils.http_cache import versioned_json
+from utils.sessions import require_session
+
+budgets_bp = Blueprint('budgets', __name__)
+
+@budgets_bp.route('', methods=['GET'])
+@require_session
+def get_budgets():
+    """Presupuestos del mes (?month=YYYY-MM, por defecto el actual) con lo gastado"""
+    try:
+        user_id = g.user_id
+        month = validate_month(request.args['month']) if request.args.get('month') \
+            else date.today().strftime('%Y-%m')
+
+        return versioned_json(user_id, 'budgets', (month,), lambda: (Budget.list_month(user_id, month), {}))
+
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'Error interno'}), 500
+
+@budgets_bp.route('', methods=['POST'])
+@require_session
+def set_budget():
+    """
+    Crea o actualiza el presupuesto de una categoría para un mes:
+    {category, month?, limit}. 201 si es nuevo, 200 si cambió el límite.
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'Datos inválidos'}), 400
+
+        category, month, limit_cents = validate_budget(data, expense_categories())
+        budget, created = Budget.upsert(g.user_id, category, month, limit_cents)
+
+        return jsonify(budget), 201 if created else 200
+
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'Error interno'}), 500
+
+@budgets_bp.route('/<int:budget_id>', methods=['DELETE'])
+@require_session
+def delete_budget(budget_id):
+    """Elimina un presupuesto y sus alertas"""
+    try:
+        if not Budget.delete(budget_id, g.user_id):
+            return jsonify({'error': 'Presupuesto no encontrado'}), 404
+
+        return jsonify({'message': 'Eliminado'}), 200
+
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'Error interno'}), 500
+
+@budgets_bp.route('/alerts', methods=['GET'])
+@require_session
+def get_alerts():
+    """
+    Alertas de presupuesto (80% y 100% del límite) con id mayor que
+    ?after=, de la más vieja a la más nueva. Pensado para sondeo: con
+    If-None-Match responde 304 mientras no haya escrituras del usuario.
+    """
+    try:
+        user_id = g.user_id
+        after, limit = validate_alert_params(request.args)
+
+        return versioned_json(user_id, 'budgets/alerts', (after, limit),
+                              lambda: (Budget.alerts(user_id, after, limit), {}))
+
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'Error interno'}), 500
@@ -0,0 +1,60 @@
+"""Rutas de importación de extractos bancarios"""
+from flask import Blueprint, g, request, jsonify, current_app
+from utils.validators import ValidationError
+from utils.importer import start_import, get_import_status
+from utils.sessions import require_session
+from utils.statement_parsers import PARSERS
+
+imports_bp = Blueprint('imports', __name__)
+
+@imports_bp.route('', methods=['POST'])
+@require_session
+def create_import():
+    """
+    Sube un extracto (multipart): file, format? (csv|ofx|qif),
+    date_format? (p. ej. %d/%m/%Y), day_first? (true|false)
+    Responde 202 con el id para consultar el progreso.
+    """
+    try:
+        user_id = g.user_id
+        upload = request.files.get('file')
+        if upload is None:
+            return jsonify({'error': 'Falta el archivo (campo file)'}), 400
+        
+        fmt = request.form.get('format') or None
+        if fmt is not None and fmt not in PARSERS:
+            return jsonify({'error': f"Formato no soportado (usar {', '.join(PARSERS)})"}), 400
+        
+        date_format = request.form.get('date_format') or None
+        day_first = request.form.get('day_first')
+        if day_first is not None:
+            day_first = day_first.lower() in ('1', 'true', 'si', 'sí')
+        
+        job_id = start_import(user_id, upload, fmt, date_format, day_first)
+        
+        return jsonify({'id': job_id, 'status': 'pending'}), 202
+    
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"Error al iniciar importación: {str(e)}")
+        return jsonify({'error': 'Error interno'}), 500
+
+@imports_bp.route('/<int:job_id>', methods=['GET'])
+@require_session
+def get_import(job_id):
+    """Estado y progreso de una importación: GET /api/imports/<id>"""
+    try:
+        user_id = g.user_id
+        
+        job = get_import_status(job_id, user_id)
+        if not job:
+            return jsonify({'error': 'Importación no encontrada'}), 404
+        
+        return jsonify(job), 200
+    
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"Error al consultar importación: {str(e)}")
+        return jsonify({'error': 'Error interno'}), 500
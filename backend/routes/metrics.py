@@ -0,0 +1,53 @@
+"""Endpoint /metrics (Prometheus) y registro de cada request"""
+import time
+
+from flask import Blueprint, Response, g, request
+
+from utils import metrics
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@metrics_bp.record_once
+def _setup(state):
+    metrics.instrument_database()
+
+
+@metrics_bp.before_app_request
+def _start_request():
+    g.metrics_start = time.perf_counter()
+    metrics.inc('ahorrapp_http_requests_in_flight')
+    metrics.start_request_sql()
+
+
+@metrics_bp.after_app_request
+def _record_status(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+@metrics_bp.teardown_app_request
+def _finish_request(error):
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return
+    statements, sql_seconds = metrics.stop_request_sql()
+    metrics.inc('ahorrapp_http_requests_in_flight', amount=-1)
+
+    # La regla (/api/transactions/<int:trans_id>) y no la URL, para acotar las series
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    status = g.pop('metrics_status', 500)
+    route_labels = metrics.labels(route=route, method=request.method)
+    metrics.inc('ahorrapp_http_requests_total',
+                metrics.labels(route=route, method=request.method, status=status))
+    metrics.observe('ahorrapp_http_request_duration_seconds', time.perf_counter() - start, route_labels)
+    metrics.observe('ahorrapp_sql_statements_per_request', statements, route_labels)
+    metrics.observe('ahorrapp_sql_seconds_per_request', sql_seconds, route_labels)
+    metrics.inc('ahorrapp_sql_statements_total', route_labels, statements)
+    metrics.inc('ahorrapp_sql_seconds_total', route_labels, sql_seconds)
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Métricas de todos los workers en formato de texto de Prometheus"""
+    return Response(metrics.collect(), content_type='text/plain; version=0.0.4; charset=utf-8')
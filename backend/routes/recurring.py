@@ -0,0 +1,29 @@
+"""Rutas de cargos recurrentes"""
+from datetime import date
+from flask import Blueprint, g, jsonify
+from db.models import Recurring
+from utils.validators import ValidationError
+from utils.http_cache import versioned_json
+from utils.sessions import require_session
+
+recurring_bp = Blueprint('recurring', __name__)
+
+@recurring_bp.route('', methods=['GET'])
+@require_session
+def get_recurring():
+    """
+    Cargos recurrentes detectados (suscripciones, alquiler, sueldo) con su
+    período, monto típico y próxima fecha esperada
+    """
+    try:
+        user_id = g.user_id
+        today = date.today()
+
+        # `active` depende del día: entra en la clave del ETag
+        return versioned_json(user_id, 'recurring', (today,),
+                              lambda: (Recurring.for_user(user_id, today), {}))
+
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'Error interno'}), 500
@@ -0,0 +1,95 @@
+"""Rutas de reglas de categorización del usuario"""
+from flask import Blueprint, g, request, jsonify
+from db.models import UserRule
+from db.user_rules import MAX_REGEX_RULES, MAX_USER_RULES
+from utils.validators import ValidationError, validate_user_rule
+from utils.categorizer import all_categories, income_categories
+from utils.category_model import refresh_user_rules
+from utils.sessions import require_session
+
+rules_bp = Blueprint('rules', __name__)
+
+def _check_regex_limit(user_id, rule, rule_id=None):
+    """ValidationError si la regla deja al usuario con más de MAX_REGEX_RULES regex"""
+    if rule['match'] != 'regex':
+        return
+    others = sum(1 for r in UserRule.get_all(user_id) if r['match'] == 'regex' and r['id'] != rule_id)
+    if others >= MAX_REGEX_RULES:
+        raise ValidationError(f'Máximo {MAX_REGEX_RULES} reglas regex por usuario')
+
+@rules_bp.route('', methods=['GET'])
+@require_session
+def get_rules():
+    """Reglas del usuario en orden de evaluación"""
+    try:
+        return jsonify(UserRule.get_all(g.user_id)), 200
+
+    except Exception as e:
+        return jsonify({'error': 'Error interno'}), 500
+
+@rules_bp.route('', methods=['POST'])
+@require_session
+def create_rule():
+    """
+    Crea una regla: {match: contains|regex|amount, pattern?, min_amount?,
+    max_amount?, category, type?, priority?}. Se aplica a las transacciones
+    que se creen o editen desde ahora, antes que las reglas globales.
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'Datos inválidos'}), 400
+
+        user_id = g.user_id
+        rule = validate_user_rule(data, all_categories(), income_categories())
+        _check_regex_limit(user_id, rule)
+        rule = UserRule.create(user_id, rule)
+        if rule is None:
+            return jsonify({'error': f'Máximo {MAX_USER_RULES} reglas por usuario'}), 400
+        refresh_user_rules(user_id)
+
+        return jsonify(rule), 201
+
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'Error interno'}), 500
+
+@rules_bp.route('/<int:rule_id>', methods=['PUT'])
+@require_session
+def update_rule(rule_id):
+    """Reemplaza una regla (mismo body que POST)"""
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'Datos inválidos'}), 400
+
+        user_id = g.user_id
+        rule = validate_user_rule(data, all_categories(), income_categories())
+        _check_regex_limit(user_id, rule, rule_id)
+        rule = UserRule.update(rule_id, user_id, rule)
+        if rule is None:
+            return jsonify({'error': 'Regla no encontrada'}), 404
+        refresh_user_rules(user_id)
+
+        return jsonify(rule), 200
+
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'Error interno'}), 500
+
+@rules_bp.route('/<int:rule_id>', methods=['DELETE'])
+@require_session
+def delete_rule(rule_id):
+    """Elimina una regla"""
+    try:
+        user_id = g.user_id
+        if not UserRule.delete(rule_id, user_id):
+            return jsonify({'error': 'Regla no encontrada'}), 404
+        refresh_user_rules(user_id)
+
+        return jsonify({'message': 'Eliminada'}), 200
+
+    except Exception as e:
+        return jsonify({'error': 'Error interno'}), 500
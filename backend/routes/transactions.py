@@ -1,13 +1,24 @@
 """Rutas de transacciones"""
-from flask import Blueprint, request, jsonify
-import sqlite3
+from flask import Blueprint, g, request, jsonify
 from datetime import datetime
-from utils.validators import ValidationError, validate_description, validate_amount, validate_user_id
-from utils.categorizer import categorize_transaction
+from db.models import Transaction
+from db.storage import get_storage
+from utils.validators import (
+    ValidationError, validate_category, validate_description, validate_amount, validate_list_params,
+    validate_export_params, validate_search_params, validate_stream_format, validate_timeseries_params
+)
+from utils.categorizer import all_categories
+from utils.category_model import categorize_for_user, record_correction
+from utils.http_cache import versioned_json
+from utils.money import from_cents
+from utils.export import export_response
+from utils.streaming import stream_transactions
+from utils.sessions import require_session
 
 trans_bp = Blueprint('transactions', __name__)
 
 @trans_bp.route('', methods=['POST'])
+@require_session
 def add_transaction():
     """Crea nueva transacción"""
     try:
@@ -15,27 +26,19 @@ def add_transaction():
         if not data:
             return jsonify({'error': 'Datos inválidos'}), 400
         
-        user_id = validate_user_id(data.get('user_id'))
+        user_id = g.user_id
         description = validate_description(data.get('description', ''))
-        amount = validate_amount(data.get('amount'))
+        amount_cents = validate_amount(data.get('amount'))
         
-        category, trans_type = categorize_transaction(description)
+        category, trans_type = categorize_for_user(user_id, description, amount_cents)
         
-        conn = sqlite3.connect('expenses.db')
-        c = conn.cursor()
         now = datetime.now().isoformat()
-        c.execute(
-            'INSERT INTO transactions (user_id, description, amount, category, type, created_at) VALUES (?, ?, ?, ?, ?, ?)',
-            (user_id, description, amount, category, trans_type, now)
-        )
-        conn.commit()
-        trans_id = c.lastrowid
-        conn.close()
+        trans_id = get_storage().create_transaction(user_id, description, amount_cents, category, trans_type, now)
         
         return jsonify({
             'id': trans_id,
             'description': description,
-            'amount': amount,
+            'amount': from_cents(amount_cents),
             'category': category,
             'type': trans_type,
             'created_at': now
@@ -47,6 +50,7 @@ def add_transaction():
         return jsonify({'error': 'Error interno'}), 500
 
 @trans_bp.route('/<int:trans_id>', methods=['PUT'])
+@require_session
 def update_transaction(trans_id):
     """Actualiza transacción"""
     try:
@@ -54,20 +58,13 @@ def update_transaction(trans_id):
         if not data:
             return jsonify({'error': 'Datos inválidos'}), 400
         
-        user_id = validate_user_id(data.get('user_id'))
+        user_id = g.user_id
         description = validate_description(data.get('description', ''))
-        amount = validate_amount(data.get('amount'))
+        amount_cents = validate_amount(data.get('amount'))
         
-        category, trans_type = categorize_transaction(description)
+        category, trans_type = categorize_for_user(user_id, description, amount_cents)
         
-        conn = sqlite3.connect('expenses.db')
-        c = conn.cursor()
-        c.execute(
-            'UPDATE transactions SET description=?, amount=?, category=?, type=? WHERE id=? AND user_id=?',
-            (description, amount, category, trans_type, trans_id, user_id)
-        )
-        conn.commit()
-        conn.close()
+        get_storage().update_transaction(trans_id, user_id, description, amount_cents, category, trans_type)
         
         return jsonify({'message': 'Actualizado'}), 200
     
@@ -76,21 +73,38 @@ def update_transaction(trans_id):
     except Exception as e:
         return jsonify({'error': 'Error interno'}), 500
 
-@trans_bp.route('/<int:trans_id>', methods=['DELETE'])
-def delete_transaction(trans_id):
-    """Elimina transacción"""
+@trans_bp.route('/<int:trans_id>/category', methods=['PUT'])
+@require_session
+def correct_category(trans_id):
+    """
+    Corrige la categoría de una transacción: {category}. La corrección
+    entrena el modelo del usuario, que se usa al categorizar las siguientes.
+    """
     try:
         data = request.get_json()
         if not data:
             return jsonify({'error': 'Datos inválidos'}), 400
         
-        user_id = validate_user_id(data.get('user_id'))
+        category = validate_category(data, all_categories())
+        corrected = record_correction(g.user_id, trans_id, category)
+        if corrected is None:
+            return jsonify({'error': 'Transacción no encontrada'}), 404
         
-        conn = sqlite3.connect('expenses.db')
-        c = conn.cursor()
-        c.execute('DELETE FROM transactions WHERE id=? AND user_id=?', (trans_id, user_id))
-        conn.commit()
-        conn.close()
+        return jsonify(corrected), 200
+    
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'Error interno'}), 500
+
+@trans_bp.route('/<int:trans_id>', methods=['DELETE'])
+@require_session
+def delete_transaction(trans_id):
+    """Elimina transacción"""
+    try:
+        user_id = g.user_id
+        
+        get_storage().delete_transaction(trans_id, user_id)
         
         return jsonify({'message': 'Eliminado'}), 200
     
@@ -100,30 +114,70 @@ def delete_transaction(trans_id):
         return jsonify({'error': 'Error interno'}), 500
 
 @trans_bp.route('', methods=['GET'])
+@require_session
 def get_transactions():
-    """Obtiene transacciones del usuario"""
+    """Obtiene transacciones del usuario, paginadas (cursor en X-Next-Cursor)"""
+    try:
+        user_id = g.user_id
+        limit, cursor, filters = validate_list_params(request.args)
+        
+        # ?stream=json|ndjson: todo el historial en streaming, sin límite
+        stream = validate_stream_format(request.args)
+        if stream is not None:
+            return stream_transactions(user_id, stream, cursor, filters)
+        
+        def build():
+            try:
+                transactions, next_cursor = get_storage().list_page(user_id, limit, cursor, filters)
+            except ValueError as e:
+                raise ValidationError(str(e))
+            return transactions, {'X-Next-Cursor': next_cursor} if next_cursor else {}
+        
+        # ETag por versión de datos: 304 o respuesta cacheada sin consultar
+        params = (limit, cursor, tuple(sorted(filters.items())))
+        return versioned_json(user_id, 'transactions', params, build)
+    
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'Error interno'}), 500
+
+@trans_bp.route('/search', methods=['GET'])
+@require_session
+def search_transactions():
+    """
+    Búsqueda en las descripciones (prefijos, sin distinguir acentos ni
+    mayúsculas), de más a menos relevante. Query: q, limit?, cursor?
+    El cursor de la página siguiente viene en el header X-Next-Cursor.
+    """
     try:
-        user_id = validate_user_id(request.args.get('user_id'))
+        user_id = g.user_id
+        q, limit, cursor = validate_search_params(request.args)
         
-        conn = sqlite3.connect('expenses.db')
-        c = conn.cursor()
-        c.execute(
-            'SELECT id, description, amount, category, type, created_at FROM transactions WHERE user_id=? ORDER BY created_at DESC',
-            (user_id,)
-        )
-        transactions = []
-        for row in c.fetchall():
-            transactions.append({
-                'id': row[0],
-                'description': row[1],
-                'amount': row[2],
-                'category': row[3],
-                'type': row[4],
-                'created_at': row[5]
-            })
-        conn.close()
-        
-        return jsonify(transactions), 200
+        def build():
+            try:
+                transactions, next_cursor = Transaction.search(user_id, q, limit, cursor)
+            except ValueError as e:
+                raise ValidationError(str(e))
+            return transactions, {'X-Next-Cursor': next_cursor} if next_cursor else {}
+        
+        return versioned_json(user_id, 'transactions/search', (q, limit, cursor), build)
+    
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'Error interno'}), 500
+
+@trans_bp.route('/export', methods=['GET'])
+@require_session
+def export_transactions():
+    """
+    Descarga todas las transacciones del usuario (gzip si el cliente lo acepta)
+    Query: format=csv|ndjson, from?, to? (y los filtros del listado)
+    """
+    try:
+        fmt, filters = validate_export_params(request.args)
+        return export_response(g.user_id, fmt, filters, request.accept_encodings['gzip'] > 0)
     
     except ValidationError as e:
         return jsonify({'error': str(e)}), 400
@@ -131,38 +185,33 @@ def get_transactions():
         return jsonify({'error': 'Error interno'}), 500
 
 @trans_bp.route('/stats', methods=['GET'])
+@require_session
 def get_stats():
     """Obtiene estadísticas del usuario"""
     try:
-        user_id = validate_user_id(request.args.get('user_id'))
-        
-        conn = sqlite3.connect('expenses.db')
-        c = conn.cursor()
-        
-        c.execute('SELECT SUM(amount) FROM transactions WHERE user_id=? AND type="expense"', (user_id,))
-        total_expenses = c.fetchone()[0] or 0
-        
-        c.execute('SELECT SUM(amount) FROM transactions WHERE user_id=? AND type="income"', (user_id,))
-        total_income = c.fetchone()[0] or 0
+        user_id = g.user_id
         
-        balance = total_income - total_expenses
+        return versioned_json(user_id, 'stats', (), lambda: (get_storage().get_stats(user_id), {}))
+    
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'Error interno'}), 500
+
+@trans_bp.route('/stats/timeseries', methods=['GET'])
+@require_session
+def get_stats_timeseries():
+    """Ingresos, gastos y gastos por categoría agrupados por período"""
+    try:
+        user_id = g.user_id
+        granularity, date_from, date_to, compare = validate_timeseries_params(request.args)
         
-        c.execute(
-            'SELECT category, COUNT(*), SUM(amount) FROM transactions WHERE user_id=? AND type="expense" GROUP BY category',
-            (user_id,)
+        return versioned_json(
+            user_id, 'stats/timeseries', (granularity, date_from, date_to, compare),
+            lambda: (Transaction.get_timeseries(user_id, granularity, date_from, date_to, compare), {})
         )
-        by_category = [{'category': row[0], 'count': row[1], 'total': row[2]} for row in c.fetchall()]
-        
-        conn.close()
-        
-        return jsonify({
-            'total_expenses': total_expenses,
-            'total_income': total_income,
-            'balance': balance,
-            'by_category': by_category
-        }), 200
     
     except ValidationError as e:
         return jsonify({'error': str(e)}), 400
     except Exception as e:
-        return jsonify({'error': 'Error interno'}), 500
+        return jsonify({'error': 'Error interno del servidor'}), 500
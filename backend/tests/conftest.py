@@ -0,0 +1,32 @@
+"""
+Fixtures compartidas por los tests del backend
+
+    cd backend && python -m pytest tests
+"""
+import os
+
+# Sin pool de procesos para el hashing: los tests corren en el proceso
+os.environ.setdefault('PASSWORD_HASH_WORKERS', '0')
+
+import pytest
+
+from db import connection as db
+from db.migrations import migrate
+from db.storage import STORAGE_BACKEND, configure_storage
+
+
+@pytest.fixture
+def sqlite_db(tmp_path):
+    """BD SQLite temporal y migrada como BD principal del proceso"""
+    previous = db.get_pool().database
+    db.configure(str(tmp_path / 'test.db'))
+    migrate()
+    yield db.get_pool()
+    db.configure(previous)
+
+
+@pytest.fixture
+def memory_storage():
+    """MemoryStorage como motor del proceso (se restaura el configurado al terminar)"""
+    yield configure_storage('memory')
+    configure_storage(STORAGE_BACKEND)
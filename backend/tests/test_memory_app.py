@@ -0,0 +1,51 @@
+"""
+La app con STORAGE_BACKEND=memory: registro, login, alta y listado sin
+tocar SQLite (ni crear el archivo de la BD)
+"""
+import pytest
+
+from db import connection as db
+
+
+@pytest.fixture
+def client(tmp_path, memory_storage):
+    previous = db.get_pool().database
+    path = tmp_path / 'nunca.db'
+    db.configure(str(path))
+    from app import app
+    from utils.sessions import get_sessions
+    yield app.test_client()
+    # Los last_seen pendientes van al motor en memoria, no a SQLite al salir
+    get_sessions().flush()
+    db.configure(previous)
+    assert not path.exists()
+
+
+def test_register_login_add_list(client):
+    credentials = {'username': 'usuario1', 'password': 'Clave123!x'}
+    assert client.post('/api/auth/register', json=credentials).status_code == 201
+    response = client.post('/api/auth/login', json=credentials)
+    assert response.status_code == 200
+    headers = {'Authorization': f"Bearer {response.get_json()['token']}"}
+
+    response = client.post('/api/transactions', headers=headers,
+                           json={'description': 'Uber al centro', 'amount': 12.5})
+    assert response.status_code == 201
+    created = response.get_json()
+    assert created['category'] == 'Transporte'
+
+    response = client.get('/api/transactions', headers=headers)
+    assert response.status_code == 200
+    assert response.get_json() == [created]
+
+    stats = client.get('/api/stats', headers=headers).get_json()
+    assert stats['total_expenses'] == 12.5
+
+
+def test_sqlite_only_routes_answer_501(client):
+    credentials = {'username': 'usuario2', 'password': 'Clave123!x'}
+    client.post('/api/auth/register', json=credentials)
+    token = client.post('/api/auth/login', json=credentials).get_json()['token']
+    headers = {'Authorization': f'Bearer {token}'}
+    for url in ('/api/transactions/search?q=uber', '/api/stats/timeseries', '/api/budgets', '/api/rules'):
+        assert client.get(url, headers=headers).status_code == 501
@@ -0,0 +1,91 @@
+"""
+Planes de consulta del listado de transacciones (Transaction.list_query)
+
+Cada combinación de filtros, con y sin cursor, tiene que resolverse con uno
+de los índices compuestos por usuario, sin recorrer la tabla ni ordenar en
+un B-tree temporal: así una página cuesta lo mismo con 100 filas que con
+100.000.
+
+    cd backend && python -m pytest tests/test_query_plans.py
+"""
+import itertools
+import random
+
+import pytest
+
+from db import connection as db
+from db.migrations import migrate
+from db.models import Transaction
+
+USER_INDEXES = ('idx_tx_user_created', 'idx_tx_user_category',
+                'idx_tx_user_type')
+
+# Valores de ejemplo por filtro (solo importan para el plan)
+FILTER_SAMPLES = {
+    'date_from': '2024-01-01T00:00:00',
+    'date_to': '2024-07-01T00:00:00',
+    'category': 'Alimentacion',
+    'type': 'expense',
+    'min_amount': 10.0,
+    'max_amount': 500.0,
+}
+
+CATEGORIES = ['Alimentacion', 'Transporte', 'Entretenimiento', 'Salud', 'Servicios',
+              'Compras', 'Ingresos', 'Otros']
+
+CURSOR = Transaction.encode_cursor('2024-06-01T00:00:00', 1000)
+
+COMBOS = [combo for size in range(len(FILTER_SAMPLES) + 1)
+          for combo in itertools.combinations(FILTER_SAMPLES, size)]
+
+
+@pytest.fixture(scope='module')
+def seeded(tmp_path_factory):
+    """Un usuario pesado (la mitad de 20.000 filas) entre otros 19"""
+    previous = db.get_pool().database
+    db.configure(str(tmp_path_factory.mktemp('plans') / 'plans.db'))
+    migrate()
+    rnd = random.Random(7)
+    batch = []
+    for i in range(20_000):
+        category = rnd.choice(CATEGORIES)
+        batch.append((1 if i % 2 == 0 else rnd.randint(2, 20), f'mov {i}', rnd.randint(100, 200000), category,
+                      'income' if category == 'Ingresos' else 'expense',
+                      f'2024-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}T12:00:00'))
+    with db.transaction() as conn:
+        conn.executemany('''INSERT INTO transactions
+                            (user_id, description, amount_cents, category, type, created_at)
+                            VALUES (?, ?, ?, ?, ?, ?)''', batch)
+    yield
+    db.configure(previous)
+
+
+def explain(combo, cursor):
+    filters = {name: FILTER_SAMPLES[name] for name in combo}
+    sql, params = Transaction.list_query(1, 51, cursor, filters)
+    with db.connection() as conn:
+        return [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+
+
+def test_plain_listing_uses_created_index(seeded):
+    for cursor in (None, CURSOR):
+        plan = explain((), cursor)
+        assert len(plan) == 1 and 'idx_tx_user_created' in plan[0], plan
+
+
+# Sin estadísticas primero: ANALYZE no se deshace
+@pytest.mark.parametrize('analyzed', [False, True], ids=['sin-analyze', 'con-analyze'])
+def test_every_filter_combination_uses_user_index(seeded, analyzed):
+    if analyzed:
+        with db.connection() as conn:
+            conn.execute('ANALYZE')
+    failures = []
+    for combo in COMBOS:
+        for cursor in (None, CURSOR):
+            plan = explain(combo, cursor)
+            ok = (len(plan) == 1 and plan[0].startswith('SEARCH transactions USING')
+                  and any(index in plan[0] for index in USER_INDEXES)
+                  and not any('TEMP B-TREE' in step for step in plan))
+            if not ok:
+                failures.append(('+'.join(combo) or '(sin filtros)', cursor is not None, plan))
+    assert failures == []
@@ -0,0 +1,70 @@
+"""Regex de reglas de usuario: subconjunto seguro (utils/rule_matcher.py)
+
+    cd backend && python -m pytest tests
+"""
+import time
+
+import pytest
+
+from utils.rule_matcher import UserRuleMatcher, compile_user_regex
+
+REJECTED = [
+    '(a+)+$',
+    '((a+))+$',            # grupo extra alrededor del cuantificado
+    '(?:(a+))+$',
+    '(a|aa)+',             # alternancia repetida
+    '(a|a?)+$',
+    '(?:x)*',
+    '(\\w*)*',
+    '(ab){2,}',
+    'a*a*a*a*!',           # varios cuantificadores variables (polinomial)
+    '\\d+\\d+',
+    '^*',
+    '(?P=n)',
+    '(?i)uber',
+]
+
+ACCEPTED = [
+    '^uber',
+    'netflix|spotify',
+    '^(uber|cabify)',
+    '(?:super|hiper)mercado',
+    'pago\\s+tarjeta',
+    'super.*mercado',
+    '\\d{4}',
+    'a{2}b{3}c?',
+    '[)]+',
+    '\\(+',
+    '(?<!no )pago',
+]
+
+
+@pytest.mark.parametrize('pattern', REJECTED)
+def test_rejects_unsafe_patterns(pattern):
+    with pytest.raises(ValueError):
+        compile_user_regex(pattern)
+
+
+@pytest.mark.parametrize('pattern', ACCEPTED)
+def test_accepts_safe_patterns(pattern):
+    compile_user_regex(pattern)
+
+
+def _rule(rule_id, pattern):
+    return {'id': rule_id, 'match': 'regex', 'pattern': pattern, 'min_amount_cents': None,
+            'max_amount_cents': None, 'category': 'Otros', 'type': 'expense'}
+
+
+def test_worst_case_is_bounded():
+    # Una regex aceptada y una descripción armada para forzar backtracking
+    matcher = UserRuleMatcher(1, [_rule(1, '\\w+!x')])
+    start = time.perf_counter()
+    assert matcher.match('a' * 500) is None
+    assert time.perf_counter() - start < 0.1
+
+
+def test_stored_unsafe_regex_is_ignored():
+    # Reglas guardadas antes de la restricción no rompen el matcher
+    matcher = UserRuleMatcher(1, [_rule(1, '((a+))+$'), _rule(2, '^uber')])
+    assert matcher.match('a' * 26 + '!') is None
+    assert matcher.match('Uber viaje') == ('Otros', 'expense')
@@ -0,0 +1,184 @@
+"""
+Motores de almacenamiento: SQLiteStorage y MemoryStorage dan lo mismo
+
+Una secuencia aleatoria de altas (de a una, en lote e importadas con
+huellas repetidas), cambios y bajas se aplica a los dos motores; después
+de cada paso se comparan listados paginados con filtros, el recorrido
+completo con iter_batches, las estadísticas y los resultados de cada
+operación. Los ids pueden diferir (SQLite reutiliza el último id borrado),
+así que los del motor en memoria se traducen a los de SQLite; las filas
+importadas (import_chunk no devuelve ids) se emparejan por created_at,
+que es único.
+"""
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from db.memory_storage import MemoryStorage
+from db.storage import SQLiteStorage
+
+CATEGORIES = ['Alimentacion', 'Transporte', 'Servicios', 'Salud', 'Otros']
+START = datetime(2026, 1, 1)
+
+
+class Pair:
+    """Los dos motores y la traducción de ids memoria -> SQLite"""
+
+    def __init__(self, rnd: random.Random):
+        self.rnd = rnd
+        self.sqlite = SQLiteStorage()
+        self.memory = MemoryStorage()
+        self.ids = {}
+        self.live = []
+        # Fechas únicas: el orden (created_at, id) no depende de los ids
+        self.moments = list(range(100_000))
+        rnd.shuffle(self.moments)
+
+    def both(self, method, *args):
+        return getattr(self.sqlite, method)(*args), getattr(self.memory, method)(*args)
+
+    def row(self):
+        rnd = self.rnd
+        category = rnd.choice(CATEGORIES)
+        return (f'compra {rnd.randrange(50)}', rnd.randrange(1, 400) * 50, category,
+                'income' if category == 'Otros' else 'expense',
+                (START + timedelta(minutes=self.moments.pop())).isoformat())
+
+    def created(self, sqlite_ids, memory_ids):
+        assert len(sqlite_ids) == len(memory_ids)
+        for sqlite_id, memory_id in zip(sqlite_ids, memory_ids):
+            self.ids[memory_id] = sqlite_id
+            self.live.append((sqlite_id, memory_id))
+
+    def imported(self, user_id: int):
+        """Empareja las filas importadas por su created_at"""
+        by_created = {row[5]: row[0] for batch in self.sqlite.iter_batches(user_id) for row in batch}
+        known = set(self.ids)
+        new = [(by_created[row[5]], row[0]) for batch in self.memory.iter_batches(user_id)
+               for row in batch if row[0] not in known]
+        self.created([sqlite_id for sqlite_id, _ in new], [memory_id for _, memory_id in new])
+
+    def translate(self, rows):
+        """Filas del motor en memoria con los ids de SQLite"""
+        if rows and isinstance(rows[0], dict):
+            return [dict(row, id=self.ids[row['id']]) for row in rows]
+        return [(self.ids[row[0]],) + tuple(row[1:]) for row in rows]
+
+
+def random_filters(rnd: random.Random):
+    # Montos y límites en múltiplos de 0.50: los bordes de los rangos se tocan
+    filters = {}
+    if rnd.random() < 0.3:
+        filters['category'] = rnd.choice(CATEGORIES)
+    if rnd.random() < 0.3:
+        filters['type'] = rnd.choice(['income', 'expense'])
+    if rnd.random() < 0.3:
+        filters['date_from'] = (START + timedelta(days=rnd.randrange(60))).isoformat()
+    if rnd.random() < 0.3:
+        filters['date_to'] = (START + timedelta(days=rnd.randrange(20, 80))).isoformat()
+    if rnd.random() < 0.3:
+        filters['min_amount'] = rnd.randrange(0, 100) + rnd.choice([0, 0.5])
+    if rnd.random() < 0.3:
+        filters['max_amount'] = rnd.randrange(50, 200) + rnd.choice([0, 0.5])
+    return filters
+
+
+def all_pages(storage, user_id, limit, filters):
+    pages, cursor = [], None
+    while True:
+        page, cursor = storage.list_page(user_id, limit, cursor, filters)
+        pages.append(page)
+        if cursor is None:
+            return pages
+        # Un cursor que no avanza no debe colgar el test
+        assert len(pages) <= 2000
+
+
+def check_reads(pair: Pair, user_id: int):
+    rnd = pair.rnd
+    filters = random_filters(rnd)
+    limit = rnd.choice([1, 7, 50])
+    sqlite_pages = all_pages(pair.sqlite, user_id, limit, filters)
+    memory_pages = all_pages(pair.memory, user_id, limit, filters)
+    assert [pair.translate(page) for page in memory_pages] == sqlite_pages
+
+    batch_size = rnd.choice([3, 64])
+    sqlite_rows = [tuple(row) for batch in pair.sqlite.iter_batches(user_id, None, filters, batch_size)
+                   for row in batch]
+    memory_rows = [row for batch in pair.memory.iter_batches(user_id, None, filters, batch_size) for row in batch]
+    assert pair.translate(memory_rows) == sqlite_rows
+
+    assert pair.memory.get_stats(user_id) == pair.sqlite.get_stats(user_id)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_engines_agree(sqlite_db, seed):
+    rnd = random.Random(seed)
+    pair = Pair(rnd)
+    users = [pair.both('create_user', f'usuario{i}', 'hash', 'salt') for i in range(3)]
+    assert all(sqlite_id == memory_id for sqlite_id, memory_id in users)
+    users = [sqlite_id for sqlite_id, _ in users]
+    fingerprints = [f'huella{i}' for i in range(40)]
+
+    for _ in range(120):
+        user_id = rnd.choice(users)
+        op = rnd.random()
+        if op < 0.3:
+            row = pair.row()
+            sqlite_id, memory_id = pair.both('create_transaction', user_id, *row)
+            pair.created([sqlite_id], [memory_id])
+        elif op < 0.45:
+            rows = [pair.row() for _ in range(rnd.randrange(1, 20))]
+            pair.created(*pair.both('create_many', user_id, rows))
+        elif op < 0.6:
+            rows = [(rnd.choice(fingerprints),) + pair.row() for _ in range(rnd.randrange(1, 10))]
+            sqlite_result, memory_result = pair.both('import_chunk', user_id, rows)
+            assert memory_result == sqlite_result
+            pair.imported(user_id)
+        elif op < 0.75 and pair.live:
+            sqlite_id, memory_id = rnd.choice(pair.live)
+            description, amount_cents, category, trans_type, _ = pair.row()
+            owner = rnd.choice(users)
+            assert (pair.memory.update_transaction(memory_id, owner, description, amount_cents, category,
+                                                   trans_type) ==
+                    pair.sqlite.update_transaction(sqlite_id, owner, description, amount_cents, category,
+                                                   trans_type))
+        elif op < 0.85 and pair.live:
+            sqlite_id, memory_id = rnd.choice(pair.live)
+            owner = rnd.choice(users)
+            deleted = pair.sqlite.delete_transaction(sqlite_id, owner)
+            assert pair.memory.delete_transaction(memory_id, owner) == deleted
+            if deleted:
+                pair.live.remove((sqlite_id, memory_id))
+                del pair.ids[memory_id]
+        elif pair.live:
+            sqlite_id, memory_id = rnd.choice(pair.live)
+            owner = rnd.choice(users)
+            memory_row = pair.memory.get_transaction(memory_id, owner)
+            expected = pair.sqlite.get_transaction(sqlite_id, owner)
+            assert (pair.translate([memory_row])[0] if memory_row else None) == expected
+        check_reads(pair, user_id)
+
+    for user_id in users:
+        sqlite_rows = [tuple(row) for batch in pair.sqlite.iter_batches(user_id) for row in batch]
+        memory_rows = [row for batch in pair.memory.iter_batches(user_id) for row in batch]
+        assert pair.translate(memory_rows) == sqlite_rows
+
+
+def test_sessions_agree(sqlite_db):
+    sqlite, memory = SQLiteStorage(), MemoryStorage()
+    user_id = sqlite.create_user('usuario', 'hash', 'salt')
+    assert memory.create_user('usuario', 'hash', 'salt') == user_id
+    past = (datetime.now() - timedelta(hours=1)).isoformat()
+    future = (datetime.now() + timedelta(hours=1)).isoformat()
+    for storage in (sqlite, memory):
+        storage.create_session('vieja', user_id, past)
+        storage.create_session('nueva', user_id, future)
+        storage.touch_sessions([(datetime.now().isoformat(), 'nueva')])
+    for key in ('vieja', 'nueva', 'otra'):
+        assert memory.get_session(key) == sqlite.get_session(key)
+    assert memory.purge_sessions() == sqlite.purge_sessions() == 1
+    assert memory.get_session('vieja') is None
+    assert memory.delete_session('nueva') == sqlite.delete_session('nueva') is True
+    assert memory.delete_session('nueva') == sqlite.delete_session('nueva') is False
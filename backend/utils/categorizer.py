@@ -1,31 +1,224 @@
-"""Categorización automática de transacciones"""
+"""Categorización automática de transacciones
+
+Las reglas (palabras clave por categoría) se cargan desde un archivo
+JSON o TOML y se compilan una sola vez en un autómata Aho-Corasick, de
+modo que cada descripción se recorre una única vez sin importar cuántas
+palabras clave haya. El archivo se vuelve a cargar automáticamente
+cuando cambia; el reemplazo de las reglas es atómico.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+RULES_PATH = os.environ.get(
+    'CATEGORIZER_RULES',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'rules', 'categories.json')
+)
+
+# Cada cuántos segundos, como máximo, se revisa si el archivo cambió
+RELOAD_INTERVAL = float(os.environ.get('CATEGORIZER_RELOAD_INTERVAL', '2'))
+
+_NO_MATCH = 1 << 30
+
+
+def normalize_text(text):
+    """Minúsculas y sin acentos ('Médico' -> 'medico')"""
+    if text.isascii():
+        return text.lower()
+    text = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(ch for ch in text if not unicodedata.combining(ch))
+
+
+class RuleSet:
+    """
+    Reglas compiladas (inmutables). La prioridad de una categoría es su
+    posición en el archivo: gana la primera que tenga alguna coincidencia.
+    """
+
+    def __init__(self, categories: List[Dict], default_category: str = 'Otros'):
+        self.default_category = default_category
+        self.names = [cat['name'] for cat in categories]
+        # Categorías que puede recibir un gasto (las de presupuestos)
+        self.expense_names = [cat['name'] for cat in categories if cat.get('type') != 'income']
+        if default_category not in self.expense_names:
+            self.expense_names.append(default_category)
+        self.income_names = frozenset(cat['name'] for cat in categories if cat.get('type') == 'income')
+        self.keyword_count = 0
+
+        # Trie: goto[estado] = {caracter: estado}
+        goto: List[Dict[str, int]] = [{}]
+        best: List[int] = [_NO_MATCH]
+        income: List[bool] = [False]
+
+        for priority, cat in enumerate(categories):
+            is_income = cat.get('type') == 'income'
+            for keyword in cat.get('keywords', []):
+                keyword = normalize_text(keyword)
+                if not keyword:
+                    continue
+                self.keyword_count += 1
+                state = 0
+                for ch in keyword:
+                    nxt = goto[state].get(ch)
+                    if nxt is None:
+                        nxt = len(goto)
+                        goto[state][ch] = nxt
+                        goto.append({})
+                        best.append(_NO_MATCH)
+                        income.append(False)
+                    state = nxt
+                best[state] = min(best[state], priority)
+                income[state] = income[state] or is_income
+
+        # Enlaces de fallo (BFS); la salida de cada estado incluye la de su
+        # enlace de fallo, así la búsqueda solo mira el estado actual
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for ch, nxt in goto[state].items():
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                target = goto[f].get(ch, 0)
+                fail[nxt] = target if target != nxt else 0
+                best[nxt] = min(best[nxt], best[fail[nxt]])
+                income[nxt] = income[nxt] or income[fail[nxt]]
+                queue.append(nxt)
+
+        self._goto = goto
+        self._fail = fail
+        self._best = best
+        self._income = income
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'RuleSet':
+        categories = data.get('categories')
+        if not isinstance(categories, list):
+            raise ValueError("Reglas inválidas: falta la lista 'categories'")
+        for cat in categories:
+            if not isinstance(cat, dict) or not isinstance(cat.get('name'), str):
+                raise ValueError("Reglas inválidas: cada categoría necesita 'name'")
+        return cls(categories, data.get('default_category', 'Otros'))
+
+    def match(self, description: str) -> Tuple[str, str]:
+        """Una pasada sobre la descripción: (categoría, tipo)"""
+        goto, fail, best, income = self._goto, self._fail, self._best, self._income
+        state = 0
+        top = _NO_MATCH
+        is_income = False
+
+        for ch in normalize_text(description):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if best[state] < top:
+                top = best[state]
+            if income[state]:
+                is_income = True
+
+        category = self.names[top] if top != _NO_MATCH else self.default_category
+        return category, 'income' if is_income else 'expense'
+
+
+def load_rules(path: str) -> RuleSet:
+    """Lee y compila un archivo de reglas (.json o .toml)"""
+    if path.endswith('.toml'):
+        import tomllib
+        with open(path, 'rb') as f:
+            data = tomllib.load(f)
+    else:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    return RuleSet.from_dict(data)
+
+
+class Categorizer:
+    """Reglas compiladas con recarga en caliente desde archivo"""
+
+    def __init__(self, path: str = RULES_PATH, reload_interval: float = RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._signature = self._file_signature()
+        self._rules = load_rules(path)
+        self._next_check = time.monotonic() + reload_interval
+
+    def _file_signature(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        Recompila si el archivo cambió. Si el archivo nuevo es inválido se
+        conservan las reglas anteriores.
+        """
+        with self._lock:
+            signature = self._file_signature()
+            if not force and (signature is None or signature == self._signature):
+                return False
+            try:
+                rules = load_rules(self.path)
+            except (OSError, ValueError) as e:
+                logger.error(f"No se pudieron recargar las reglas de {self.path}: {e}")
+                return False
+            # Reemplazo atómico: las llamadas en curso terminan con las reglas viejas
+            self._rules = rules
+            self._signature = signature
+            return True
+
+    @property
+    def rules(self) -> RuleSet:
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + self.reload_interval
+            self.reload()
+        return self._rules
+
+    def categorize(self, description: str) -> Tuple[str, str]:
+        return self.rules.match(description)
+
+
+_categorizer: Optional[Categorizer] = None
+_init_lock = threading.Lock()
+
+
+def get_categorizer() -> Categorizer:
+    global _categorizer
+    if _categorizer is None:
+        with _init_lock:
+            if _categorizer is None:
+                _categorizer = Categorizer()
+    return _categorizer
+
 
 def categorize_transaction(description):
     """Categoriza transacción y detecta ingreso vs gasto"""
-    desc_lower = description.lower()
-    
-    income_keywords = [
-        'sueldo', 'salario', 'pago', 'ingreso', 'venta', 
-        'bonus', 'ganancia', 'reembolso', 'comisión'
-    ]
-    
-    is_income = any(kw in desc_lower for kw in income_keywords)
-    trans_type = 'income' if is_income else 'expense'
-    
-    categories = {
-        'Alimentacion': ['café', 'comida', 'desayuno', 'almuerzo', 'cena', 'restaurant'],
-        'Transporte': ['taxi', 'bus', 'uber', 'gasolina', 'metro', 'tren'],
-        'Entretenimiento': ['cine', 'película', 'juego', 'música', 'bar', 'pub'],
-        'Salud': ['farmacia', 'medicina', 'doctor', 'médico', 'hospital', 'gym'],
-        'Servicios': ['internet', 'teléfono', 'electricidad', 'agua', 'gas'],
-        'Compras': ['ropa', 'zapatos', 'tienda', 'regalo', 'amazon'],
-        'Ingresos': income_keywords,
-    }
-    
-    category = 'Otros'
-    for cat, keywords in categories.items():
-        if any(kw in desc_lower for kw in keywords):
-            category = cat
-            break
-    
-    return category, trans_type
+    return get_categorizer().categorize(description)
+
+
+def expense_categories() -> List[str]:
+    """Categorías de gasto de las reglas actuales (incluye la por defecto)"""
+    return list(get_categorizer().rules.expense_names)
+
+
+def income_categories() -> List[str]:
+    """Categorías de ingreso de las reglas actuales"""
+    return sorted(get_categorizer().rules.income_names)
+
+
+def all_categories() -> List[str]:
+    """Todas las categorías de las reglas actuales (incluye la por defecto)"""
+    rules = get_categorizer().rules
+    return rules.names + [rules.default_category] if rules.default_category not in rules.names else list(rules.names)
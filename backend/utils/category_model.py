@@ -0,0 +1,225 @@
+"""Categorización por usuario: reglas propias y naive Bayes multinomial
+
+Las reglas que define el usuario (/api/rules, utils/rule_matcher.py) se
+evalúan primero; si ninguna aplica decide el modelo de correcciones junto
+con las reglas globales.
+
+Cuando un usuario corrige la categoría de una transacción, las palabras de
+la descripción suman a su modelo (conteos en SQLite, ver db/corrections.py;
+el categorizador los lee a través de get_storage()).
+Al categorizar, el modelo del usuario decide entre las categorías que
+aprendió y la que proponen las reglas globales, que entra como prior con
+RULE_PRIOR_DOCS descripciones de ventaja. Si ninguna palabra de la
+descripción aparece en el modelo se usan solo las reglas.
+
+Cada worker guarda los modelos compilados (log-probabilidades por palabra)
+y los matchers de reglas en LRUs de CATEGORY_MODEL_CACHE_SIZE usuarios. Un
+cambio en este worker reemplaza la entrada al momento; los de otros
+workers se notan al revisar la versión, como mucho cada CATEGORY_MODEL_TTL
+segundos.
+"""
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from db.models import CategoryModel
+from db.storage import get_storage
+from utils.categorizer import get_categorizer, normalize_text
+from utils.rule_matcher import UserRuleMatcher
+
+CATEGORY_MODEL_CACHE_SIZE = int(os.environ.get('CATEGORY_MODEL_CACHE_SIZE', '2000'))
+CATEGORY_MODEL_TTL = float(os.environ.get('CATEGORY_MODEL_TTL', '30'))
+# Palabras por modelo (las más frecuentes); acota memoria y tiempo de carga
+CATEGORY_MODEL_MAX_TOKENS = 5000
+# Suavizado de Laplace
+ALPHA = 1.0
+# Descripciones "virtuales" a favor de la categoría que proponen las reglas
+RULE_PRIOR_DOCS = 2.0
+
+_WORD = re.compile(r'[^\W\d_]{2,}')
+
+
+def tokenize(description: str) -> List[str]:
+    """Palabras de al menos 2 letras, sin acentos ni números"""
+    return _WORD.findall(normalize_text(description))
+
+
+class NaiveBayesModel:
+    """Modelo compilado (inmutable) de un usuario"""
+
+    __slots__ = ('version', 'categories', 'index', 'docs', 'total_docs', 'unseen', 'table')
+
+    def __init__(self, version: int, docs: Sequence[Tuple[str, int, int]], counts: Dict[str, Dict[str, int]]):
+        self.version = version
+        self.categories = [category for category, _, _ in docs]
+        self.index = {category: i for i, category in enumerate(self.categories)}
+        self.docs = [count for _, count, _ in docs]
+        self.total_docs = sum(self.docs)
+        vocabulary = max(len(counts), 1)
+        denominators = [tokens + ALPHA * vocabulary for _, _, tokens in docs]
+        # log P(palabra no vista | categoría)
+        self.unseen = tuple(math.log(ALPHA / d) for d in denominators)
+        # palabra -> log P(palabra | categoría) por categoría
+        self.table = {
+            token: tuple(math.log((by_category.get(category, 0) + ALPHA) / d)
+                         for category, d in zip(self.categories, denominators))
+            for token, by_category in counts.items()
+        }
+
+    def predict(self, tokens: Sequence[str], rule_category: Optional[str]) -> Optional[str]:
+        """
+        Categoría más probable o None si el modelo no conoce ninguna de
+        las palabras (decide la regla global).
+        """
+        table = self.table
+        rows = [table[token] for token in tokens if token in table]
+        if not rows:
+            return None
+        rule = self.index.get(rule_category, -1) if rule_category is not None else -1
+        best, best_score = None, -math.inf
+        unseen_count = len(tokens) - len(rows)
+        for i, category in enumerate(self.categories):
+            prior = self.docs[i] + ALPHA + (RULE_PRIOR_DOCS if i == rule else 0.0)
+            score = math.log(prior) + unseen_count * self.unseen[i]
+            for row in rows:
+                score += row[i]
+            if score > best_score:
+                best, best_score = category, score
+        # La regla propone una categoría que el modelo no aprendió: es una
+        # categoría vacía (cada palabra con probabilidad 1/vocabulario) más
+        # el prior de la regla
+        if rule < 0 and rule_category is not None:
+            uniform = -math.log(max(len(table), 1)) * len(tokens)
+            if math.log(RULE_PRIOR_DOCS + ALPHA) + uniform > best_score:
+                return rule_category
+        return best
+
+
+class VersionedCache:
+    """
+    LRU por usuario de objetos compilados con atributo `version`; cada
+    entrada se revalida cada `ttl` segundos comparando `version(user_id)`
+    y se recompila con `load(user_id)` solo si cambió.
+    """
+
+    def __init__(self, version: Callable[[int], int], load: Callable[[int], Optional[Any]],
+                 max_size: int = CATEGORY_MODEL_CACHE_SIZE, ttl: float = CATEGORY_MODEL_TTL):
+        self.version = version
+        self.load = load
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(user_id)
+            if entry is not None and entry[1] > now:
+                self._data.move_to_end(user_id)
+                self.hits += 1
+                return entry[0]
+        self.misses += 1
+        if entry is not None and entry[0] is not None and self.version(user_id) == entry[0].version:
+            value = entry[0]
+        else:
+            value = self.load(user_id)
+        self.put(user_id, value)
+        return value
+
+    def put(self, user_id: int, value: Optional[Any]) -> None:
+        with self._lock:
+            self._data[user_id] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(user_id)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def stats(self):
+        return {'entries': len(self._data), 'hits': self.hits, 'misses': self.misses}
+
+
+def _load_model(user_id: int) -> Optional[NaiveBayesModel]:
+    data = get_storage().load_model(user_id, CATEGORY_MODEL_MAX_TOKENS)
+    return NaiveBayesModel(data['version'], data['docs'], data['counts']) if data else None
+
+
+def _load_matcher(user_id: int) -> Optional[UserRuleMatcher]:
+    version, rules = get_storage().load_rules(user_id)
+    return UserRuleMatcher(version, rules) if rules else None
+
+
+def _new_caches():
+    return (VersionedCache(lambda user_id: get_storage().model_version(user_id), _load_model),
+            VersionedCache(lambda user_id: get_storage().rules_version(user_id), _load_matcher))
+
+
+_cache, _rules_cache = _new_caches()
+
+
+def get_model_cache() -> VersionedCache:
+    return _cache
+
+
+def get_rules_cache() -> VersionedCache:
+    return _rules_cache
+
+
+def _after_fork():
+    # Los workers no comparten las cachés (ni sus locks) con el proceso padre
+    global _cache, _rules_cache
+    _cache, _rules_cache = _new_caches()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def refresh_user_rules(user_id: int) -> None:
+    """Recompila las reglas del usuario tras un cambio hecho en este worker"""
+    _rules_cache.put(user_id, _load_matcher(user_id))
+
+
+def categorize_for_user(user_id: int, description: str,
+                        amount_cents: Optional[int] = None) -> Tuple[str, str]:
+    """
+    (categoría, tipo): primero las reglas del usuario; si ninguna aplica,
+    reglas globales + modelo del usuario
+    """
+    matcher = _rules_cache.get(user_id)
+    if matcher is not None:
+        result = matcher.match(description, amount_cents)
+        if result is not None:
+            return result
+    rules = get_categorizer().rules
+    category, trans_type = rules.match(description)
+    model = _cache.get(user_id)
+    if model is None:
+        return category, trans_type
+    rule_category = category if category != rules.default_category else None
+    learned = model.predict(tokenize(description), rule_category)
+    if learned is None or learned == category:
+        return category, trans_type
+    return learned, 'income' if learned in rules.income_names else 'expense'
+
+
+def record_correction(user_id: int, transaction_id: int, category: str) -> Optional[Dict[str, str]]:
+    """
+    Cambia la categoría de la transacción y entrena el modelo del usuario
+    con su descripción. Retorna la transacción corregida o None si no existe.
+    """
+    rules = get_categorizer().rules
+    trans_type = 'income' if category in rules.income_names else 'expense'
+    result = CategoryModel.correct(user_id, transaction_id, category, trans_type,
+                                   tokenize, CATEGORY_MODEL_MAX_TOKENS)
+    if result is None:
+        return None
+    description, data = result
+    # Este worker ve la corrección enseguida; los demás al revalidar
+    _cache.put(user_id, NaiveBayesModel(data['version'], data['docs'], data['counts']))
+    return {'id': transaction_id, 'description': description, 'category': category, 'type': trans_type}
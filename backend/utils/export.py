@@ -0,0 +1,87 @@
+"""Exportación de transacciones (CSV / NDJSON) comprimida en streaming
+
+Las filas salen del almacenamiento por lotes (Storage.iter_batches), se
+serializan y pasan por un compresor gzip incremental; cada bloque
+comprimido se envía apenas está listo. Nunca se arma el resultado
+completo en memoria, ni sin comprimir ni comprimido.
+"""
+import csv
+import io
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from flask import Response
+
+from db.models import LIST_COLUMNS
+from db.storage import get_storage
+from utils.streaming import ndjson_chunks
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+GZIP_LEVEL = 6
+
+# Caracteres con los que Excel/LibreOffice interpretan una celda como fórmula
+_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _safe_cell(value: Any) -> Any:
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _needs_escape(rows: List[Tuple]) -> bool:
+    return any(
+        (description and description.startswith(_FORMULA_PREFIXES))
+        or (category and category.startswith(_FORMULA_PREFIXES))
+        for _, description, _, category, _, _ in rows
+    )
+
+
+def csv_chunks(batches: Iterable[List[Tuple]]) -> Iterator[bytes]:
+    """Encabezado + un bloque CSV por lote"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(LIST_COLUMNS)
+    for rows in batches:
+        # Casi nunca hay algo que escapar: en ese caso las tuplas van directo
+        if _needs_escape(rows):
+            rows = [tuple(_safe_cell(value) for value in row) for row in rows]
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = GZIP_LEVEL) -> Iterator[bytes]:
+    """Comprime un flujo de bloques en formato gzip, sin acumularlos"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_chunks(user_id: int, fmt: str, filters: Dict[str, Any], compress: bool = True) -> Iterator[bytes]:
+    batches = get_storage().iter_batches(user_id, None, filters)
+    chunks = csv_chunks(batches) if fmt == 'csv' else ndjson_chunks(batches)
+    return gzip_chunks(chunks) if compress else chunks
+
+
+def export_response(user_id: int, fmt: str, filters: Dict[str, Any], accept_gzip: bool) -> Response:
+    """Respuesta de descarga; gzip si el cliente lo acepta"""
+    response = Response(export_chunks(user_id, fmt, filters, accept_gzip), mimetype=EXPORT_FORMATS[fmt])
+    filename = f"transacciones-{datetime.now().strftime('%Y%m%d')}.{fmt}"
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    if accept_gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'private, no-store'
+    return response
@@ -0,0 +1,130 @@
+"""GET condicionales y caché de respuestas por versión de datos
+
+Cada usuario tiene una versión que sube con cada escritura en
+transactions o budgets (ver db.migrations). Las respuestas de lectura llevan un ETag
+fuerte derivado de (usuario, endpoint, parámetros, versión):
+
+- Si el cliente envía If-None-Match con ese ETag se responde 304 sin
+  ejecutar la consulta.
+- Si no, se busca el cuerpo ya serializado en una caché LRU en memoria
+  del worker, acotada en bytes. Como la versión es parte de la clave, una
+  escritura invalida todo lo del usuario sin borrar nada explícitamente.
+
+Las respuestas en streaming (versioned_stream) llevan el mismo ETag y
+aceptan 304, pero su cuerpo no se guarda.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Iterator, Optional, Tuple
+
+from flask import Response, current_app, request
+
+from db.storage import get_storage
+
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', '10000'))
+
+# Respuestas más grandes que esto no se guardan (no desplazan al resto)
+MAX_ENTRY_BYTES = RESPONSE_CACHE_MAX_BYTES // 8
+
+
+class ResponseCache:
+    """LRU de cuerpos serializados acotada por bytes y por cantidad"""
+
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+                 max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Tuple[bytes, Dict[str, str]]]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: Hashable, body: bytes, headers: Dict[str, str]) -> None:
+        if len(body) > MAX_ENTRY_BYTES:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= len(old[0])
+            self._data[key] = (body, headers)
+            self.size += len(body)
+            while self._data and (self.size > self.max_bytes or len(self._data) > self.max_entries):
+                _, (evicted, _) = self._data.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def stats(self):
+        return {'entries': len(self._data), 'bytes': self.size, 'hits': self.hits, 'misses': self.misses}
+
+
+_cache = ResponseCache()
+
+
+def get_response_cache() -> ResponseCache:
+    return _cache
+
+
+def make_etag(user_id: int, endpoint: str, params: Hashable, version: int) -> str:
+    key = f'{user_id}|{endpoint}|{params!r}|{version}'.encode('utf-8')
+    return hashlib.sha1(key).hexdigest()[:24]
+
+
+def versioned_json(user_id: int, endpoint: str, params: Hashable,
+                   build: Callable[[], Tuple[object, Dict[str, str]]]) -> Response:
+    """
+    Respuesta JSON con ETag y caché. `params` debe ser hashable y contener
+    todo lo que cambia el cuerpo (parámetros ya validados); `build` retorna
+    (payload, headers extra) y solo se llama si no hay nada en caché.
+    """
+    version = get_storage().data_version(user_id)
+    etag = make_etag(user_id, endpoint, params, version)
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        key = (user_id, endpoint, params, version)
+        entry = _cache.get(key)
+        if entry is None:
+            payload, headers = build()
+            body = current_app.json.dumps(payload).encode('utf-8')
+            entry = (body, headers)
+            _cache.put(key, body, headers)
+        body, headers = entry
+        response = Response(body, status=200, mimetype='application/json')
+        response.headers.update(headers)
+
+    response.set_etag(etag)
+    # El cliente puede guardar la respuesta pero debe revalidarla siempre
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def versioned_stream(user_id: int, endpoint: str, params: Hashable,
+                     generate: Callable[[], Iterator[bytes]], mimetype: str) -> Response:
+    """Como versioned_json para respuestas en streaming: ETag y 304, sin caché"""
+    etag = make_etag(user_id, endpoint, params, get_storage().data_version(user_id))
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(generate(), status=200, mimetype=mimetype)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
@@ -0,0 +1,202 @@
+"""Importación de extractos bancarios
+
+Pipeline en streaming: el archivo subido se guarda en disco, se parsea
+con un generador (utils.statement_parsers), cada movimiento se normaliza
+y valida, se categoriza por bloques y se inserta en transacciones cortas
+de CHUNK_SIZE filas, descartando duplicados por huella
+(usuario, fecha, monto, descripción). La memoria usada no depende del
+tamaño del archivo.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from db.models import ImportJob, Transaction
+from db.sharding import user_scope
+from utils.categorizer import normalize_text
+from utils.category_model import categorize_for_user
+from utils.statement_parsers import StatementParseError, detect_format, parse_statement
+from utils.validators import ValidationError, validate_amount, validate_description
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', '500'))
+MAX_UPLOAD_BYTES = int(os.environ.get('IMPORT_MAX_BYTES', str(200 * 1024 * 1024)))
+UPLOAD_DIR = os.environ.get('IMPORT_UPLOAD_DIR') or tempfile.gettempdir()
+
+# Errores de fila que se guardan en el job (el resto solo se cuenta)
+MAX_REPORTED_ERRORS = 50
+
+# Claves recordadas para numerar movimientos idénticos del mismo archivo
+MAX_OCCURRENCE_KEYS = 50_000
+
+
+class _OccurrenceCounter:
+    """
+    Cuenta repeticiones de (fecha, monto, descripción) dentro del archivo,
+    para que dos cafés iguales el mismo día no se tomen como duplicados.
+    Acotado a las últimas MAX_OCCURRENCE_KEYS claves (los extractos vienen
+    ordenados por fecha, así que las repeticiones están cerca).
+    """
+
+    def __init__(self, max_keys: int = MAX_OCCURRENCE_KEYS):
+        self.max_keys = max_keys
+        self._counts = OrderedDict()
+
+    def next(self, key) -> int:
+        count = self._counts.pop(key, 0) + 1
+        self._counts[key] = count
+        if len(self._counts) > self.max_keys:
+            self._counts.popitem(last=False)
+        return count
+
+
+def fingerprint(user_id: int, date: str, amount_cents: int, description: str,
+                occurrence: int = 1, ref: Optional[str] = None) -> str:
+    """Huella estable de un movimiento importado"""
+    if ref:
+        key = f"{user_id}|ref|{ref}"
+    else:
+        # Mismo formato que cuando el monto era float (huellas ya guardadas)
+        key = f"{user_id}|{date}|{amount_cents / 100:.2f}|{normalize_text(description)}|{occurrence}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def save_upload(file_storage) -> str:
+    """Copia el archivo subido a disco en bloques; retorna la ruta"""
+    fd, path = tempfile.mkstemp(prefix='import-', suffix='.upload', dir=UPLOAD_DIR)
+    with os.fdopen(fd, 'wb') as out:
+        written = 0
+        while True:
+            block = file_storage.stream.read(64 * 1024)
+            if not block:
+                break
+            written += len(block)
+            if written > MAX_UPLOAD_BYTES:
+                out.close()
+                os.remove(path)
+                raise ValidationError(f"Archivo demasiado grande (máx {MAX_UPLOAD_BYTES // (1024 * 1024)} MB)")
+            out.write(block)
+    return path
+
+
+def start_import(user_id: int, file_storage, fmt: Optional[str] = None,
+                 date_format: Optional[str] = None, day_first: Optional[bool] = None) -> int:
+    """
+    Guarda el archivo, registra el job y lo procesa en un hilo de fondo.
+    Retorna el id del job para consultar el progreso.
+    """
+    path = save_upload(file_storage)
+    filename = file_storage.filename or ''
+    try:
+        with open(path, 'rb') as raw:
+            fmt = fmt or detect_format(filename, raw)
+        job_id = ImportJob.create(user_id, filename[:255], fmt, os.path.getsize(path))
+    except Exception:
+        os.remove(path)
+        raise
+
+    thread = threading.Thread(
+        target=run_import, args=(job_id, user_id, path, fmt, date_format, day_first),
+        name=f'import-{job_id}', daemon=True
+    )
+    thread.start()
+    return job_id
+
+
+def run_import(job_id: int, user_id: int, path: str, fmt: str,
+               date_format: Optional[str] = None, day_first: Optional[bool] = None,
+               remove_file: bool = True) -> Dict[str, int]:
+    """Procesa el archivo completo; actualiza el job después de cada bloque"""
+    # El hilo arranca sin el archivo del request: se elige el del usuario
+    with user_scope(user_id):
+        return _run_import(job_id, user_id, path, fmt, date_format, day_first, remove_file)
+
+
+def _run_import(job_id: int, user_id: int, path: str, fmt: str, date_format: Optional[str],
+                day_first: Optional[bool], remove_file: bool) -> Dict[str, int]:
+    stats = {'rows_read': 0, 'rows_invalid': 0, 'rows_imported': 0, 'rows_duplicate': 0}
+    errors = []
+    occurrences = _OccurrenceCounter()
+    pending = []
+    size = os.path.getsize(path)
+
+    def flush(raw):
+        # Categorizar el bloque y confirmarlo junto con el progreso
+        rows = []
+        for fp, description, amount_cents, created_at in pending:
+            category, _ = categorize_for_user(user_id, description, amount_cents)
+            trans_type = 'income' if amount_cents > 0 else 'expense'
+            rows.append((fp, description, abs(amount_cents), category, trans_type, created_at))
+        inserted, duplicates = Transaction.import_chunk(user_id, rows, job_id, {
+            'status': 'running',
+            # El lector de texto cierra el archivo al agotarse
+            'bytes_read': size if raw.closed else raw.tell(),
+            'rows_read': stats['rows_read'],
+            'rows_invalid': stats['rows_invalid'],
+            'errors': json.dumps(errors, ensure_ascii=False),
+        })
+        stats['rows_imported'] += inserted
+        stats['rows_duplicate'] += duplicates
+        pending.clear()
+
+    try:
+        with open(path, 'rb') as raw:
+            ImportJob.update(job_id, status='running')
+            for record in parse_statement(raw, fmt, date_format, day_first):
+                stats['rows_read'] += 1
+                try:
+                    if record['error']:
+                        raise ValidationError(record['error'])
+                    description = validate_description(record['description'])
+                    amount_cents = validate_amount(record['amount'])
+                except ValidationError as e:
+                    stats['rows_invalid'] += 1
+                    if len(errors) < MAX_REPORTED_ERRORS:
+                        errors.append({'row': stats['rows_read'], 'error': str(e)})
+                    continue
+
+                date = record['date']
+                occurrence = occurrences.next((date, amount_cents, description))
+                fp = fingerprint(user_id, date, amount_cents, description, occurrence, record['ref'])
+                pending.append((fp, description, amount_cents, f"{date}T00:00:00"))
+
+                if len(pending) >= CHUNK_SIZE:
+                    flush(raw)
+
+            flush(raw)
+
+        ImportJob.finish(job_id, 'done', bytes_read=size, rows_read=stats['rows_read'],
+                         rows_invalid=stats['rows_invalid'],
+                         errors=json.dumps(errors, ensure_ascii=False))
+    except StatementParseError as e:
+        ImportJob.finish(job_id, 'failed', errors=json.dumps([{'error': str(e)}], ensure_ascii=False))
+    except Exception:
+        logger.exception(f"Error en importación {job_id}")
+        ImportJob.finish(job_id, 'failed', errors=json.dumps([{'error': 'Error interno'}]))
+    finally:
+        if remove_file:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    return stats
+
+
+def get_import_status(job_id: int, user_id: int) -> Optional[Dict]:
+    """Estado del job con porcentaje de avance"""
+    job = ImportJob.get(job_id, user_id)
+    if not job:
+        return None
+    job['errors'] = json.loads(job['errors']) if job['errors'] else []
+    total = job['bytes_total'] or 0
+    job['progress'] = 100.0 if job['status'] == 'done' else (
+        round(100.0 * job['bytes_read'] / total, 1) if total else 0.0
+    )
+    return job
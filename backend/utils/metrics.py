@@ -0,0 +1,342 @@
+"""Métricas en formato Prometheus
+
+Contadores, gauges e histogramas en memoria del proceso. Con gunicorn cada
+worker tiene los suyos, así que si METRICS_DIR está definido cada worker
+vuelca una foto de sus métricas a METRICS_DIR/<pid>.json (como mucho cada
+METRICS_FLUSH_INTERVAL segundos y al terminar) y /metrics suma las de
+todos los archivos:
+
+- contadores e histogramas se suman, incluidos los de workers que ya
+  murieron (un contador nunca baja);
+- los gauges (requests en curso) solo se suman de workers vivos.
+
+El directorio debe vaciarse al arrancar el servidor (ver Dockerfile).
+Sin METRICS_DIR se exponen solo las métricas del proceso actual.
+
+Las rutas se registran en routes/metrics.py.
+"""
+import atexit
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+METRICS_DIR = os.environ.get('METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', '1'))
+
+logger = logging.getLogger(__name__)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# Nombre -> (tipo, ayuda, buckets de histograma)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS = {
+    'ahorrapp_http_requests_total': (
+        'counter', 'Requests HTTP atendidos', None),
+    'ahorrapp_http_request_duration_seconds': (
+        'histogram', 'Latencia de los requests HTTP', LATENCY_BUCKETS),
+    'ahorrapp_http_requests_in_flight': (
+        'gauge', 'Requests HTTP en curso', None),
+    'ahorrapp_sql_statements_per_request': (
+        'histogram', 'Sentencias SQL ejecutadas por request (incluye triggers)',
+        (0, 1, 2, 5, 10, 20, 50, 100, 500)),
+    'ahorrapp_sql_seconds_per_request': (
+        'histogram', 'Segundos por request con una conexión de la BD prestada',
+        (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)),
+    'ahorrapp_sql_statements_total': (
+        'counter', 'Sentencias SQL ejecutadas durante requests', None),
+    'ahorrapp_sql_seconds_total': (
+        'counter', 'Segundos con una conexión de la BD prestada durante requests', None),
+    'ahorrapp_password_hash_seconds': (
+        'histogram', 'Tiempo de hashing de contraseñas (incluye la espera en el pool)',
+        (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)),
+}
+
+
+def labels(**values) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in values.items()))
+
+
+class Registry:
+    """Métricas del proceso actual"""
+
+    def __init__(self):
+        self._values: Dict[Tuple[str, Labels], float] = {}
+        # Histogramas: conteos por bucket (no acumulados, +Inf al final), suma y cantidad
+        self._histograms: Dict[Tuple[str, Labels], List[float]] = {}
+        self._lock = threading.Lock()
+        self.changed = False
+
+    def inc(self, name: str, label_values: Labels = (), amount: float = 1.0) -> None:
+        key = (name, label_values)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+            self.changed = True
+
+    def observe(self, name: str, value: float, label_values: Labels = ()) -> None:
+        buckets = METRICS[name][2]
+        key = (name, label_values)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(buckets) + 1) + [0.0, 0]
+            histogram[bisect.bisect_left(buckets, value)] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+            self.changed = True
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self.changed = False
+            return {
+                'values': [[name, list(map(list, label_values)), value]
+                           for (name, label_values), value in self._values.items()],
+                'histograms': [[name, list(map(list, label_values)), list(histogram)]
+                               for (name, label_values), histogram in self._histograms.items()],
+            }
+
+
+def merge(snapshots: Iterable[Tuple[dict, bool]]) -> Tuple[dict, dict]:
+    """Suma fotos (foto, proceso vivo); retorna (valores, histogramas)"""
+    values: Dict[Tuple[str, Labels], float] = {}
+    histograms: Dict[Tuple[str, Labels], List[float]] = {}
+    for snapshot, alive in snapshots:
+        for name, label_values, value in snapshot.get('values', []):
+            if name not in METRICS or (METRICS[name][0] == 'gauge' and not alive):
+                continue
+            key = (name, tuple(map(tuple, label_values)))
+            values[key] = values.get(key, 0.0) + value
+        for name, label_values, histogram in snapshot.get('histograms', []):
+            if name not in METRICS or len(histogram) != len(METRICS[name][2]) + 3:
+                continue
+            key = (name, tuple(map(tuple, label_values)))
+            total = histograms.get(key)
+            if total is None:
+                histograms[key] = list(histogram)
+            else:
+                for i, value in enumerate(histogram):
+                    total[i] += value
+    return values, histograms
+
+
+# ==================== FORMATO DE TEXTO ====================
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(label_values: Iterable[Tuple[str, str]]) -> str:
+    if not label_values:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in label_values) + '}'
+
+
+def _format_number(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+def render(values: dict, histograms: dict) -> str:
+    """Formato de exposición de texto de Prometheus (0.0.4)"""
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        series = [(key[1], value) for key, value in values.items() if key[0] == name]
+        if kind == 'histogram':
+            series = [(key[1], value) for key, value in histograms.items() if key[0] == name]
+        if not series and kind != 'gauge':
+            continue
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'gauge' and not series:
+            series = [((), 0.0)]
+        for label_values, value in sorted(series):
+            if kind != 'histogram':
+                lines.append(f'{name}{_format_labels(label_values)} {_format_number(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip(list(buckets) + ['+Inf'], value):
+                cumulative += count
+                le = bound if bound == '+Inf' else _format_number(float(bound))
+                lines.append(f'{name}_bucket{_format_labels(label_values + (("le", le),))} '
+                             f'{_format_number(cumulative)}')
+            lines.append(f'{name}_sum{_format_labels(label_values)} {_format_number(value[-2])}')
+            lines.append(f'{name}_count{_format_labels(label_values)} {_format_number(value[-1])}')
+    return '\n'.join(lines) + '\n'
+
+
+# ==================== MULTIPROCESO ====================
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MultiprocessStore:
+    """Fotos por worker en un directorio compartido"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, pid: int, snapshot: dict) -> None:
+        path = os.path.join(self.directory, f'{pid}.json')
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(snapshot, f, separators=(',', ':'))
+        # Reemplazo atómico: quien lee nunca ve un archivo a medio escribir
+        os.replace(tmp, path)
+
+    def read_all(self) -> List[Tuple[dict, bool]]:
+        snapshots = []
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                pid = int(filename[:-5])
+                with open(os.path.join(self.directory, filename)) as f:
+                    snapshots.append((json.load(f), _alive(pid)))
+            except (ValueError, OSError):
+                continue
+        return snapshots
+
+
+# ==================== ESTADO DEL PROCESO ====================
+
+_registry = Registry()
+_store: Optional[MultiprocessStore] = MultiprocessStore(METRICS_DIR) if METRICS_DIR else None
+_flusher: Optional[threading.Thread] = None
+_flusher_lock = threading.Lock()
+_stop = threading.Event()
+
+
+def get_registry() -> Registry:
+    return _registry
+
+
+def inc(name: str, label_values: Labels = (), amount: float = 1.0) -> None:
+    _registry.inc(name, label_values, amount)
+    _ensure_flusher()
+
+
+def observe(name: str, value: float, label_values: Labels = ()) -> None:
+    _registry.observe(name, value, label_values)
+    _ensure_flusher()
+
+
+def flush() -> None:
+    """Vuelca la foto del proceso actual (si hay METRICS_DIR)"""
+    if _store is not None:
+        _store.write(os.getpid(), _registry.snapshot())
+
+
+def collect() -> str:
+    """Métricas de todos los workers en formato Prometheus"""
+    if _store is None:
+        return render(*merge([(_registry.snapshot(), True)]))
+    flush()
+    return render(*merge(_store.read_all()))
+
+
+def _ensure_flusher() -> None:
+    global _flusher
+    if _store is None or _flusher is not None:
+        return
+    with _flusher_lock:
+        if _flusher is not None:
+            return
+        _flusher = threading.Thread(target=_flush_loop, name='metrics-flush', daemon=True)
+        _flusher.start()
+
+
+def _flush_loop() -> None:
+    while not _stop.wait(METRICS_FLUSH_INTERVAL):
+        if not _registry.changed:
+            continue
+        try:
+            flush()
+        except OSError:
+            logger.exception("Error escribiendo métricas en %s", METRICS_DIR)
+
+
+def _after_fork():
+    # El hijo empieza de cero: lo del padre ya está en el archivo del padre
+    global _registry, _flusher, _flusher_lock, _stop
+    _registry = Registry()
+    _flusher = None
+    _flusher_lock = threading.Lock()
+    _stop = threading.Event()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+@atexit.register
+def _flush_at_exit():
+    if _store is not None and _registry.changed:
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+# ==================== SQL POR REQUEST ====================
+
+_request_sql = threading.local()
+
+
+def start_request_sql() -> None:
+    """Empieza a contar sentencias y tiempo de BD del hilo actual"""
+    _request_sql.statements = 0
+    _request_sql.seconds = 0.0
+    _request_sql.active = True
+
+
+def stop_request_sql() -> Tuple[int, float]:
+    """Deja de contar; retorna (sentencias, segundos)"""
+    _request_sql.active = False
+    return getattr(_request_sql, 'statements', 0), getattr(_request_sql, 'seconds', 0.0)
+
+
+def _on_statement(sql: str) -> None:
+    if getattr(_request_sql, 'active', False):
+        _request_sql.statements += 1
+
+
+def _on_hold(seconds: float) -> None:
+    if getattr(_request_sql, 'active', False):
+        _request_sql.seconds += seconds
+
+
+def instrument_database() -> None:
+    """Instala los callbacks de SQL en el pool de conexiones"""
+    from db.connection import instrument
+
+    instrument(statement=_on_statement, hold=_on_hold)
+
+
+def timed(name: str, label_values: Labels = ()):
+    """Context manager que observa la duración del bloque en un histograma"""
+    return _Timer(name, label_values)
+
+
+class _Timer:
+    def __init__(self, name: str, label_values: Labels):
+        self.name = name
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.start, self.label_values)
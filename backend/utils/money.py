@@ -0,0 +1,32 @@
+"""Montos en centavos
+
+En la base los montos se guardan como enteros (centavos), así las sumas
+son exactas. La API sigue usando decimales: se convierte al entrar
+(to_cents) y al salir (from_cents).
+"""
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+# Mayor monto convertible. Más allá, quantize excede la precisión de
+# Decimal (InvalidOperation, que no es ValueError)
+MAX_CONVERTIBLE_AMOUNT = Decimal(10) ** 15
+
+
+def to_cents(value) -> int:
+    """Monto (número o texto decimal) a centavos, redondeando al centavo"""
+    if isinstance(value, bool):
+        raise ValueError("Monto inválido")
+    try:
+        # str() da la representación decimal más corta de un float (0.1 -> '0.1')
+        amount = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError("Monto inválido")
+    if not amount.is_finite():
+        raise ValueError("Monto inválido")
+    if abs(amount) > MAX_CONVERTIBLE_AMOUNT:
+        raise ValueError("Monto fuera de rango")
+    return int((amount * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def from_cents(cents) -> float:
+    """Centavos a monto decimal para la API"""
+    return cents / 100
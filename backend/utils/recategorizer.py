@@ -0,0 +1,162 @@
+"""
+Recategorización de transacciones existentes
+
+Cuando cambian las reglas (globales o del usuario) las transacciones ya
+guardadas conservan su categoría. Un job vuelve a categorizarlas con
+categorize_for_user, igual que al crearlas:
+
+- recorre las transacciones por id en bloques de RECATEGORIZE_CHUNK_SIZE;
+  cada bloque es una lectura y una transacción de escritura corta, así el
+  tráfico normal no espera;
+- escribe solo las filas cuyo resultado cambió (los triggers mueven los
+  totales, presupuestos y ETags como en cualquier edición);
+- confirma el punto de control (último id) junto con cada bloque: si el
+  proceso muere, `resume` sigue desde ahí;
+- no toca las transacciones que el usuario corrigió a mano y en las
+  importadas conserva el tipo (sale del signo del extracto);
+- con particiones (db/sharding.py) recorre un archivo tras otro.
+
+Uso (desde backend/):
+    python -m utils.recategorizer run [--user ID]
+    python -m utils.recategorizer resume [JOB_ID]
+    python -m utils.recategorizer status
+o POST /api/admin/recategorize (corre en un hilo del worker).
+"""
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from db.connection import use_pool
+from db.models import RecategorizeJob
+from utils.category_model import categorize_for_user
+
+logger = logging.getLogger(__name__)
+
+RECATEGORIZE_CHUNK_SIZE = int(os.environ.get('RECATEGORIZE_CHUNK_SIZE', '1000'))
+# Pausa entre bloques (segundos) para ceder aún más la base
+RECATEGORIZE_PAUSE = float(os.environ.get('RECATEGORIZE_PAUSE', '0'))
+# Un job "running" sin heartbeat por más de esto se considera abandonado
+RECATEGORIZE_STALE_SECONDS = 60
+
+
+def _stale_before() -> str:
+    return (datetime.now() - timedelta(seconds=RECATEGORIZE_STALE_SECONDS)).isoformat()
+
+
+def run_job(job_id: int, pause: float = RECATEGORIZE_PAUSE) -> Optional[Dict[str, Any]]:
+    """
+    Corre (o retoma) el job hasta el final. None si no se pudo tomar
+    (otro proceso lo está corriendo o ya terminó).
+    """
+    job = RecategorizeJob.claim(job_id, _stale_before())
+    if job is None:
+        return None
+    try:
+        for index, pool in enumerate(RecategorizeJob.pools(job['user_id'])):
+            if index < job['pool']:
+                continue
+            with use_pool(pool):
+                _run_pool(job, index, job['last_id'] if index == job['pool'] else 0, pause)
+        RecategorizeJob.finish(job_id, 'done')
+    except Exception as e:
+        logger.exception(f"Error en recategorización {job_id}")
+        RecategorizeJob.finish(job_id, 'failed', str(e)[:500])
+    return job_status(job_id)
+
+
+def _run_pool(job: Dict[str, Any], index: int, last_id: int, pause: float) -> None:
+    """Bloques del archivo activo a partir de last_id"""
+    while True:
+        start = time.perf_counter()
+        rows = RecategorizeJob.read_chunk(job, last_id)
+        if not rows:
+            return
+        changes = []
+        for trans_id, user_id, description, amount_cents, category, trans_type, imported in rows:
+            new_category, new_type = categorize_for_user(user_id, description, amount_cents)
+            if imported:
+                new_type = trans_type
+            if new_category != category or new_type != trans_type:
+                changes.append((new_category, new_type, trans_id, description, category, trans_type))
+        last_id = rows[-1][0]
+        RecategorizeJob.apply_chunk(job['id'], index, last_id, len(rows), changes, time.perf_counter() - start)
+        if pause:
+            time.sleep(pause)
+
+
+def _start_thread(job_id: int) -> None:
+    thread = threading.Thread(target=run_job, args=(job_id,), name=f'recategorize-{job_id}', daemon=True)
+    thread.start()
+
+
+def start_job(user_id: Optional[int] = None, chunk_size: int = RECATEGORIZE_CHUNK_SIZE) -> int:
+    """Registra un job (de un usuario o de todos) y lo corre en un hilo de fondo"""
+    job_id = RecategorizeJob.create(user_id, chunk_size)
+    _start_thread(job_id)
+    return job_id
+
+
+def resume_job(job_id: int) -> bool:
+    """Retoma en un hilo un job abandonado. False si no corresponde"""
+    if job_id not in RecategorizeJob.stale(_stale_before()):
+        return False
+    _start_thread(job_id)
+    return True
+
+
+def job_status(job_id: int) -> Optional[Dict[str, Any]]:
+    """Estado del job con porcentaje de avance y filas por segundo"""
+    job = RecategorizeJob.get(job_id)
+    return _with_progress(job) if job else None
+
+
+def recent_jobs(limit: int = 20) -> List[Dict[str, Any]]:
+    return [_with_progress(job) for job in RecategorizeJob.recent(limit)]
+
+
+def _with_progress(job: Dict[str, Any]) -> Dict[str, Any]:
+    total = job['rows_total']
+    job['progress'] = 100.0 if job['status'] == 'done' else (
+        round(min(100.0, 100.0 * job['rows_scanned'] / total), 1) if total else 0.0
+    )
+    # Solo el tiempo de trabajo (sin pausas ni el tiempo que estuvo caído)
+    job['rows_per_sec'] = round(job['rows_scanned'] / job['elapsed']) if job['elapsed'] else None
+    remaining = max(total - job['rows_scanned'], 0)
+    job['eta_seconds'] = round(remaining / job['rows_per_sec'], 1) \
+        if job['rows_per_sec'] and job['status'] == 'running' else None
+    return job
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog='python -m utils.recategorizer')
+    sub = parser.add_subparsers(dest='command', required=True)
+    cmd = sub.add_parser('run', help='recategoriza todas las transacciones (o las de un usuario)')
+    cmd.add_argument('--user', type=int, help='solo las de este usuario')
+    cmd.add_argument('--chunk-size', type=int, default=RECATEGORIZE_CHUNK_SIZE)
+    cmd = sub.add_parser('resume', help='retoma jobs interrumpidos')
+    cmd.add_argument('job_id', type=int, nargs='?', help='por defecto, todos los abandonados')
+    sub.add_parser('status', help='jobs recientes')
+    args = parser.parse_args(argv[1:])
+
+    if args.command == 'status':
+        jobs = recent_jobs()
+    elif args.command == 'run':
+        jobs = [run_job(RecategorizeJob.create(args.user, args.chunk_size))]
+    else:
+        ids = [args.job_id] if args.job_id else RecategorizeJob.stale(_stale_before())
+        jobs = [job for job in map(run_job, ids) if job is not None]
+
+    for job in jobs:
+        scope = f"usuario {job['user_id']}" if job['user_id'] is not None else 'todos'
+        print(f"{job['id']:>4}  {job['status']:<8} {scope:<14} {job['rows_scanned']}/{job['rows_total']} "
+              f"revisadas, {job['rows_changed']} cambiadas, {job['rows_per_sec'] or 0} filas/s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
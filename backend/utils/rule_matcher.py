@@ -0,0 +1,231 @@
+"""Reglas de un usuario compiladas en un único matcher
+
+Las reglas 'contains' comparten un autómata Aho-Corasick (una pasada
+sobre la descripción normalizada, sin importar cuántas haya). Las 'regex'
+se unen en una alternancia que sirve de filtro: si no encuentra nada no
+se prueba ninguna; si encuentra algo se prueban solo las de prioridad
+mejor que el candidato actual. Las 'amount' son comparaciones de rango.
+
+Todas comparan contra la descripción en minúsculas y sin acentos (los
+acentos de las regex también se quitan).
+
+Las regex de usuario se limitan a un subconjunto sin backtracking
+explosivo (ver check_safe_regex): los cuantificadores solo se aplican a
+un carácter, clase o escape, nunca a un grupo, y hay a lo sumo uno de
+largo variable por regex. Así cada búsqueda es a lo sumo cuadrática en el
+largo de la descripción, sin depender de un filtro sobre el texto del
+patrón.
+
+Gana la regla de menor posición (prioridad, id) que coincide con la
+descripción y cuyo rango, si tiene, incluye el monto en valor absoluto.
+"""
+import logging
+import re
+import unicodedata
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from utils.categorizer import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# Referencias a grupos y flags globales no sobreviven a la alternancia
+_UNSUPPORTED = re.compile(r'\\[1-9]|\(\?P=|\(\?[aiLmsux]+\)')
+MAX_REGEX_LENGTH = 200
+# Cuantificadores de largo variable (*, +, ?, {m,n}) permitidos por regex
+MAX_VARIABLE_QUANTIFIERS = 1
+_BRACES = re.compile(r'\{(\d*)(,(\d*))?\}')
+# Apertura de grupos con sintaxis (?...): no capturantes, lookarounds, con nombre
+_GROUP_OPEN = re.compile(r'\(\?(?::|=|!|<=|<!|P<\w+>)')
+# Escapes que son posiciones, no caracteres (no se cuantifican)
+_ANCHOR_ESCAPES = 'AbBZ'
+
+
+def check_safe_regex(pattern: str) -> None:
+    """
+    ValueError si la regex sale del subconjunto seguro: cuantificadores
+    sobre un grupo ('(a+)+', '(a|aa)+', '(?:x)*'...) o más de
+    MAX_VARIABLE_QUANTIFIERS de largo variable ('a*a*a*!').
+    """
+    variable = 0
+    quantifiable = False
+    i, n = 0, len(pattern)
+    while i < n:
+        ch = pattern[i]
+        if ch == '\\':
+            quantifiable = pattern[i + 1:i + 2] not in ('', *_ANCHOR_ESCAPES)
+            i += 2
+            continue
+        if ch == '[':
+            # Clase de caracteres: ']' al principio es literal
+            j = i + 1
+            if pattern[j:j + 1] == '^':
+                j += 1
+            if pattern[j:j + 1] == ']':
+                j += 1
+            while j < n and pattern[j] != ']':
+                j += 2 if pattern[j] == '\\' else 1
+            quantifiable = True
+            i = j + 1
+            continue
+        if ch == '(':
+            m = _GROUP_OPEN.match(pattern, i)
+            quantifiable = False
+            i = m.end() if m else i + 1
+            continue
+        if ch in '*+?' or (ch == '{' and _BRACES.match(pattern, i)):
+            if not quantifiable:
+                raise ValueError('La regex solo puede cuantificar un carácter o una clase (no grupos ni anclas)')
+            if ch == '{':
+                m = _BRACES.match(pattern, i)
+                low, comma, high = m.group(1), m.group(2), m.group(3)
+                if comma is not None and low != high:
+                    variable += 1
+                i = m.end()
+            else:
+                variable += 1
+                i += 1
+            # Modificador lazy/posesivo del mismo cuantificador
+            if pattern[i:i + 1] in ('?', '+'):
+                i += 1
+            quantifiable = False
+            continue
+        # Grupos, alternancias y anclas no se cuantifican; el resto es un carácter
+        quantifiable = ch not in ')|^$'
+        i += 1
+    if variable > MAX_VARIABLE_QUANTIFIERS:
+        raise ValueError(f'La regex puede tener a lo sumo {MAX_VARIABLE_QUANTIFIERS} '
+                         'cuantificador de largo variable (*, +, ?, {m,n})')
+
+
+def compile_user_regex(pattern: str) -> 're.Pattern':
+    """Compila la regex de una regla; ValueError si es inválida o riesgosa"""
+    if len(pattern) > MAX_REGEX_LENGTH:
+        raise ValueError(f'La regex no puede superar {MAX_REGEX_LENGTH} caracteres')
+    if _UNSUPPORTED.search(pattern):
+        raise ValueError('La regex no puede usar referencias a grupos ni flags (?i)')
+    check_safe_regex(pattern)
+    # Sin acentos, como la descripción (normalize_text también cambiaría '\D' por '\d')
+    pattern = ''.join(ch for ch in unicodedata.normalize('NFKD', pattern) if not unicodedata.combining(ch))
+    try:
+        return re.compile(pattern, re.IGNORECASE)
+    except re.error as e:
+        raise ValueError(f'Regex inválida: {e}')
+
+
+def _compile_stored(rule: Dict) -> Optional['re.Pattern']:
+    # Reglas guardadas antes de restringir las regex: se ignoran, no rompen el matcher
+    try:
+        return compile_user_regex(rule['pattern'])
+    except ValueError as e:
+        logger.warning("Regla %s ignorada: %s", rule.get('id'), e)
+        return None
+
+
+class UserRuleMatcher:
+    """Matcher compilado (inmutable) de las reglas de un usuario"""
+
+    __slots__ = ('version', 'results', 'ranges', '_goto', '_fail', '_out',
+                 '_amount_rules', '_regexes', '_regex_filter')
+
+    def __init__(self, version: int, rules: Sequence[Dict]):
+        # `rules` ya viene en orden de evaluación: el índice es la posición
+        self.version = version
+        self.results: List[Tuple[str, str]] = [(rule['category'], rule['type']) for rule in rules]
+        self.ranges: List[Optional[Tuple[int, int]]] = [
+            None if rule['min_amount_cents'] is None and rule['max_amount_cents'] is None
+            else (rule['min_amount_cents'] or 0,
+                  rule['max_amount_cents'] if rule['max_amount_cents'] is not None else 1 << 62)
+            for rule in rules
+        ]
+        self._amount_rules = [i for i, rule in enumerate(rules) if rule['match'] == 'amount']
+        self._regexes = [(i, regex) for i, rule in enumerate(rules)
+                         if rule['match'] == 'regex' and (regex := _compile_stored(rule)) is not None]
+        self._regex_filter = re.compile('|'.join(f'(?:{regex.pattern})' for _, regex in self._regexes),
+                                        re.IGNORECASE) if self._regexes else None
+
+        # Trie de los textos 'contains'; out[estado] = reglas que terminan ahí
+        goto: List[Dict[str, int]] = [{}]
+        out: List[Tuple[int, ...]] = [()]
+        for i, rule in enumerate(rules):
+            if rule['match'] != 'contains':
+                continue
+            state = 0
+            for ch in normalize_text(rule['pattern']):
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    out.append(())
+                state = nxt
+            out[state] += (i,)
+
+        # Enlaces de fallo (BFS); la salida de cada estado incluye la de su enlace
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for ch, nxt in goto[state].items():
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                target = goto[f].get(ch, 0)
+                fail[nxt] = target if target != nxt else 0
+                if out[fail[nxt]]:
+                    out[nxt] = tuple(sorted(set(out[nxt] + out[fail[nxt]])))
+                queue.append(nxt)
+
+        self._goto = goto
+        self._fail = fail
+        self._out = out
+
+    def __len__(self):
+        return len(self.results)
+
+    def _in_range(self, i: int, amount: Optional[int]) -> bool:
+        bounds = self.ranges[i]
+        if bounds is None:
+            return True
+        return amount is not None and bounds[0] <= amount <= bounds[1]
+
+    def match(self, description: str, amount_cents: Optional[int] = None) -> Optional[Tuple[str, str]]:
+        """(categoría, tipo) de la primera regla que coincide o None"""
+        if not self.results:
+            return None
+        amount = abs(amount_cents) if amount_cents is not None else None
+        text = normalize_text(description)
+        best = len(self.results)
+
+        if len(self._goto) > 1:
+            goto, fail, out = self._goto, self._fail, self._out
+            state = 0
+            for ch in text:
+                while state and ch not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(ch, 0)
+                for i in out[state]:
+                    if i >= best:
+                        break
+                    if self._in_range(i, amount):
+                        best = i
+                        break
+
+        for i in self._amount_rules:
+            if i >= best:
+                break
+            if self._in_range(i, amount):
+                best = i
+                break
+
+        if self._regex_filter is not None and self._regexes[0][0] < best \
+                and self._regex_filter.search(text):
+            for i, regex in self._regexes:
+                if i >= best:
+                    break
+                if self._in_range(i, amount) and regex.search(text):
+                    best = i
+                    break
+
+        return self.results[best] if best < len(self.results) else None
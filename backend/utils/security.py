@@ -1,26 +1,280 @@
-"""Seguridad - hashing y tokens"""
+"""Seguridad - hashing y tokens
+
+El hashing de contraseñas es deliberadamente lento, así que se ejecuta en
+un pool de procesos acotado: como mucho HASH_MAX_PENDING hashes en curso o
+en cola por worker; si se supera, se rechaza al instante con
+HashingBusyError (503) en lugar de bloquear el worker.
+
+El hash guardado incluye sus parámetros ('pbkdf2_sha256$600000$<hex>' o
+'scrypt$16384$8$1$<hex>'). Los hashes hex sin prefijo son de la versión
+original (PBKDF2-SHA256, 100000 iteraciones). Al hacer login con
+parámetros viejos se vuelve a hashear con los actuales.
+
+Calibración (elige parámetros para una latencia objetivo):
+
+    cd backend && python -m utils.security calibrate [--target-ms 250] [--algorithm scrypt]
+"""
+import argparse
+import concurrent.futures
 import hashlib
-import secrets
 import hmac
+import multiprocessing
+import os
+import secrets
+import sys
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+
+from utils import metrics
+
+HASH_ALGORITHM = os.environ.get('PASSWORD_HASH_ALGORITHM', 'pbkdf2_sha256')
+PBKDF2_ITERATIONS = int(os.environ.get('PASSWORD_PBKDF2_ITERATIONS', '100000'))
+SCRYPT_N = int(os.environ.get('PASSWORD_SCRYPT_N', '16384'))
+SCRYPT_R = int(os.environ.get('PASSWORD_SCRYPT_R', '8'))
+SCRYPT_P = int(os.environ.get('PASSWORD_SCRYPT_P', '1'))
+
+# Procesos de hashing por worker (0 = hashear en el hilo del request)
+HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', str(min(os.cpu_count() or 1, 4))))
+# Hashes en curso + en cola antes de rechazar
+HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', str(max(HASH_WORKERS, 1) * 4)))
+HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', '10'))
+
+# Parámetros de los hashes guardados sin prefijo
+LEGACY_PARAMS = ('pbkdf2_sha256', 100000)
+
+MIN_PBKDF2_ITERATIONS = 100000
+MIN_SCRYPT_N = 1 << 14
+
+
+class HashingBusyError(Exception):
+    """El pool de hashing está saturado; reintentar más tarde"""
+    pass
+
+
+# ==================== PARÁMETROS ====================
+
+def current_params() -> Tuple:
+    """Parámetros configurados para hashes nuevos"""
+    if HASH_ALGORITHM == 'scrypt':
+        return ('scrypt', SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return ('pbkdf2_sha256', PBKDF2_ITERATIONS)
+
+
+def encode_hash(params: Tuple, digest_hex: str) -> str:
+    return '$'.join([str(p) for p in params] + [digest_hex])
+
+
+def decode_hash(stored_hash: str) -> Tuple[Tuple, str]:
+    """(parámetros, digest hex) de un hash guardado"""
+    if '$' not in stored_hash:
+        return LEGACY_PARAMS, stored_hash
+    parts = stored_hash.split('$')
+    if parts[0] == 'scrypt' and len(parts) == 5:
+        return ('scrypt', int(parts[1]), int(parts[2]), int(parts[3])), parts[4]
+    if parts[0] == 'pbkdf2_sha256' and len(parts) == 3:
+        return ('pbkdf2_sha256', int(parts[1])), parts[2]
+    raise ValueError("Formato de hash desconocido")
+
+
+def _derive(password: str, salt: str, params: Tuple) -> str:
+    """Deriva la clave (se ejecuta en el pool de procesos)"""
+    if params[0] == 'scrypt':
+        _, n, r, p = params
+        digest = hashlib.scrypt(password.encode('utf-8'), salt=salt.encode('utf-8'),
+                                n=n, r=r, p=p, maxmem=256 * r * n + 1024 * 1024, dklen=32)
+    else:
+        digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt.encode('utf-8'), params[1])
+    return digest.hex()
+
+
+# ==================== POOL DE PROCESOS ====================
+
+_executor: Optional[concurrent.futures.ProcessPoolExecutor] = None
+_slots = threading.BoundedSemaphore(max(HASH_MAX_PENDING, 1))
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> concurrent.futures.ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # spawn: los hijos no heredan hilos ni conexiones del worker
+                _executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=HASH_WORKERS, mp_context=multiprocessing.get_context('spawn')
+                )
+    return _executor
+
+
+def _discard_executor(executor=None):
+    global _executor
+    with _executor_lock:
+        if executor is None or _executor is executor:
+            _executor = None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _after_fork():
+    # El pool del padre no sirve en el hijo (gunicorn hace fork de los workers)
+    global _executor, _slots, _executor_lock
+    _executor = None
+    _slots = threading.BoundedSemaphore(max(HASH_MAX_PENDING, 1))
+    _executor_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def _run(password: str, salt: str, params: Tuple) -> str:
+    start = time.perf_counter()
+    digest = _run_pooled(password, salt, params)
+    metrics.observe('ahorrapp_password_hash_seconds', time.perf_counter() - start,
+                    metrics.labels(algorithm=params[0]))
+    return digest
+
+
+def _run_pooled(password: str, salt: str, params: Tuple) -> str:
+    if HASH_WORKERS <= 0:
+        return _derive(password, salt, params)
+
+    slots = _slots
+    if not slots.acquire(blocking=False):
+        raise HashingBusyError("Demasiadas solicitudes de autenticación en curso")
+    try:
+        executor = _get_executor()
+        future = executor.submit(_derive, password, salt, params)
+    except BaseException:
+        slots.release()
+        raise
+    # El lugar se libera cuando el hash termina o se cancela, no cuando el
+    # request deja de esperarlo: así la cola del pool nunca pasa de HASH_MAX_PENDING
+    future.add_done_callback(lambda _: slots.release())
+    try:
+        return future.result(timeout=HASH_TIMEOUT)
+    except concurrent.futures.TimeoutError:
+        # Si todavía está en cola no llega a correr; si ya corre, ocupa su lugar hasta terminar
+        future.cancel()
+        raise HashingBusyError("Tiempo de espera de hashing agotado")
+    except BrokenProcessPool:
+        # Un proceso murió (p. ej. OOM): se recrea en la próxima llamada
+        _discard_executor(executor)
+        raise
+
+
+def hasher_stats():
+    """Estado del pool de hashing del worker actual"""
+    return {
+        'workers': HASH_WORKERS,
+        'max_pending': HASH_MAX_PENDING,
+        'pending': HASH_MAX_PENDING - _slots._value,
+        'started': _executor is not None,
+    }
+
+
+# ==================== API ====================
 
 def hash_password(password, salt=None):
-    """Hash seguro con salt usando PBKDF2"""
+    """Hash seguro con salt (parámetros actuales). Retorna (hash, salt)"""
     if salt is None:
         salt = secrets.token_hex(16)
-    
-    password_hash = hashlib.pbkdf2_hmac(
-        'sha256',
-        password.encode('utf-8'),
-        salt.encode('utf-8'),
-        100000
-    )
-    return password_hash.hex(), salt
+    params = current_params()
+    return encode_hash(params, _run(password, salt, params)), salt
+
 
 def verify_password(password, stored_hash, salt):
     """Verifica contraseña (constant-time comparison)"""
-    password_hash, _ = hash_password(password, salt)
-    return hmac.compare_digest(password_hash, stored_hash)
+    try:
+        params, expected = decode_hash(stored_hash)
+    except ValueError:
+        return False
+    return hmac.compare_digest(_run(password, salt, params), expected)
+
+
+def needs_rehash(stored_hash):
+    """True si el hash fue generado con parámetros distintos a los actuales"""
+    try:
+        params, _ = decode_hash(stored_hash)
+    except ValueError:
+        return True
+    return params != current_params()
+
+
+def verify_and_update(password, stored_hash, salt):
+    """
+    Verifica y, si el hash está desactualizado, calcula uno nuevo.
+    Retorna (válida, (hash, salt) nuevo o None). Si el pool está saturado
+    al rehashear se posterga para el próximo login.
+    """
+    if not verify_password(password, stored_hash, salt):
+        return False, None
+    if needs_rehash(stored_hash):
+        try:
+            return True, hash_password(password)
+        except HashingBusyError:
+            pass
+    return True, None
+
 
 def generate_token():
     """Token seguro aleatorio"""
     return secrets.token_hex(32)
+
+
+# ==================== CALIBRACIÓN ====================
+
+def _time_params(params: Tuple, rounds: int = 3) -> float:
+    """Mejor tiempo (segundos) de `rounds` derivaciones en este proceso"""
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        _derive('calibracion', 'salt-de-calibracion', params)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def calibrate(target_ms: float = 250, algorithm: str = 'pbkdf2_sha256') -> Tuple[Tuple, float]:
+    """Parámetros más costosos cuya latencia no supera target_ms (con mínimo seguro)"""
+    target = target_ms / 1000.0
+    if algorithm == 'scrypt':
+        n = MIN_SCRYPT_N
+        elapsed = _time_params(('scrypt', n, 8, 1))
+        while elapsed * 2 <= target:
+            n *= 2
+            elapsed = _time_params(('scrypt', n, 8, 1))
+        return ('scrypt', n, 8, 1), elapsed
+
+    # PBKDF2 escala linealmente con las iteraciones
+    probe = 50000
+    per_iteration = _time_params(('pbkdf2_sha256', probe)) / probe
+    iterations = max(MIN_PBKDF2_ITERATIONS, int(target / per_iteration) // 10000 * 10000)
+    return ('pbkdf2_sha256', iterations), _time_params(('pbkdf2_sha256', iterations))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='python -m utils.security')
+    sub = parser.add_subparsers(dest='command', required=True)
+    cal = sub.add_parser('calibrate', help='elige parámetros de hashing para una latencia objetivo')
+    cal.add_argument('--target-ms', type=float, default=250)
+    cal.add_argument('--algorithm', choices=['pbkdf2_sha256', 'scrypt'], default='pbkdf2_sha256')
+    args = parser.parse_args(argv[1:])
+
+    params, elapsed = calibrate(args.target_ms, args.algorithm)
+    print(f'{encode_hash(params, "")[:-1]}: {elapsed * 1000:.0f} ms por hash')
+    if params[0] == 'scrypt':
+        print('PASSWORD_HASH_ALGORITHM=scrypt')
+        print(f'PASSWORD_SCRYPT_N={params[1]}')
+        print(f'PASSWORD_SCRYPT_R={params[2]}')
+        print(f'PASSWORD_SCRYPT_P={params[3]}')
+    else:
+        print('PASSWORD_HASH_ALGORITHM=pbkdf2_sha256')
+        print(f'PASSWORD_PBKDF2_ITERATIONS={params[1]}')
+    print(f'Con {HASH_WORKERS} proceso(s) por worker: ~{HASH_WORKERS / max(elapsed, 1e-6):.0f} logins/s por worker')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,266 @@
+"""Sesiones de usuario
+
+El login emite un token aleatorio; se guarda su SHA-256 con la fecha de
+vencimiento (en SQLite o, con STORAGE_BACKEND=memory, en el proceso; ver
+db/storage.py). Cada worker mantiene una caché LRU con TTL delante
+de la tabla, así que validar una sesión conocida no toca la base: solo
+se calcula el hash y se busca en un diccionario. last_seen se acumula en
+memoria y se escribe en lote cada SESSION_TOUCH_INTERVAL segundos.
+
+Una sesión revocada en otro worker deja de aceptarse aquí, como mucho,
+SESSION_CACHE_TTL segundos después.
+
+Las rutas protegidas usan @require_session y leen el usuario de g.user_id;
+con particiones (db/sharding.py) la vista corre sobre el archivo del usuario.
+El token viaja en el header 'Authorization: Bearer <token>'.
+
+Las rutas de administración (/api/admin/*) usan @require_admin: piden el
+header 'X-Admin-Token' igual a ADMIN_TOKEN. Sin ADMIN_TOKEN configurado
+responden 404, como si no existieran.
+"""
+import atexit
+import functools
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from flask import g, jsonify, request
+
+from db.storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+SESSION_TTL_HOURS = float(os.environ.get('SESSION_TTL_HOURS', '168'))
+SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', '10000'))
+SESSION_CACHE_TTL = float(os.environ.get('SESSION_CACHE_TTL', '60'))
+SESSION_TOUCH_INTERVAL = float(os.environ.get('SESSION_TOUCH_INTERVAL', '30'))
+# Token de las rutas de administración (vacío = deshabilitadas)
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+
+# Cada cuántos ciclos de escritura se borran las sesiones vencidas
+PURGE_EVERY = 120
+
+
+def token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+class SessionCache:
+    """LRU acotada; cada entrada vence a los `ttl` segundos o al vencer la sesión"""
+
+    def __init__(self, max_size: int = SESSION_CACHE_SIZE, ttl: float = SESSION_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, now: float) -> Optional[int]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, user_id: int, valid_until: float, now: float) -> None:
+        with self._lock:
+            self._data[key] = (user_id, min(valid_until, now + self.ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SessionManager:
+    """Creación, validación y revocación de sesiones del worker actual"""
+
+    def __init__(self, ttl_hours: float = SESSION_TTL_HOURS,
+                 touch_interval: float = SESSION_TOUCH_INTERVAL):
+        self.ttl = timedelta(hours=ttl_hours)
+        self.touch_interval = touch_interval
+        self.cache = SessionCache()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._flusher = None
+        self._stop = threading.Event()
+
+    def create(self, user_id: int) -> Tuple[str, str]:
+        """Nueva sesión; retorna (token, expires_at)"""
+        token = secrets.token_urlsafe(32)
+        expires = datetime.now() + self.ttl
+        key = token_hash(token)
+        get_storage().create_session(key, user_id, expires.isoformat())
+        self.cache.put(key, user_id, expires.timestamp(), time.time())
+        return token, expires.isoformat()
+
+    def validate(self, token: str) -> Optional[int]:
+        """user_id de la sesión, o None si no existe o venció"""
+        key = token_hash(token)
+        now = time.time()
+        user_id = self.cache.get(key, now)
+        if user_id is None:
+            session = get_storage().get_session(key)
+            if session is None:
+                return None
+            expires = datetime.fromisoformat(session['expires_at']).timestamp()
+            if expires <= now:
+                return None
+            user_id = session['user_id']
+            self.cache.put(key, user_id, expires, now)
+        self._touch(key)
+        return user_id
+
+    def revoke(self, token: str) -> bool:
+        key = token_hash(token)
+        self.cache.invalidate(key)
+        with self._pending_lock:
+            self._pending.pop(key, None)
+        return get_storage().delete_session(key)
+
+    # ---------- last_seen diferido ----------
+
+    def _touch(self, key: str) -> None:
+        with self._pending_lock:
+            self._pending[key] = datetime.now().isoformat()
+        if self._flusher is None:
+            self._start_flusher()
+
+    def _start_flusher(self) -> None:
+        with self._pending_lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_loop, name='session-touch', daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        cycles = 0
+        while not self._stop.wait(self.touch_interval):
+            cycles += 1
+            try:
+                self.flush()
+                if cycles % PURGE_EVERY == 0:
+                    get_storage().purge_sessions()
+            except Exception:
+                logger.exception("Error escribiendo last_seen de sesiones")
+
+    def flush(self) -> int:
+        """Escribe los last_seen acumulados; retorna cuántas sesiones"""
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        if pending:
+            get_storage().touch_sessions([(seen, key) for key, seen in pending.items()])
+        return len(pending)
+
+    def stats(self):
+        return {
+            'cached': len(self.cache),
+            'hits': self.cache.hits,
+            'misses': self.cache.misses,
+            'pending_touches': len(self._pending),
+        }
+
+
+_manager: Optional[SessionManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_sessions() -> SessionManager:
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = SessionManager()
+    return _manager
+
+
+def _after_fork():
+    # El hilo de escritura no sobrevive al fork: el hijo arranca de cero
+    global _manager, _manager_lock
+    _manager = None
+    _manager_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+@atexit.register
+def _flush_at_exit():
+    if _manager is not None:
+        try:
+            _manager.flush()
+        except Exception:
+            pass
+
+
+def request_token() -> Optional[str]:
+    header = request.headers.get('Authorization', '')
+    if header[:7].lower() == 'bearer ':
+        token = header[7:].strip()
+        if 0 < len(token) <= 128:
+            return token
+    return None
+
+
+def _claimed_user_id():
+    """user_id enviado por el cliente (compatibilidad); la sesión manda"""
+    claimed = request.args.get('user_id') or request.form.get('user_id')
+    if claimed is None and request.is_json:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            claimed = data.get('user_id')
+    return claimed
+
+
+def require_session(view):
+    """Exige una sesión válida y deja el usuario en g.user_id"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method == 'OPTIONS':
+            return view(*args, **kwargs)
+
+        token = request_token()
+        user_id = get_sessions().validate(token) if token else None
+        if user_id is None:
+            return jsonify({'error': 'Sesión inválida o expirada'}), 401
+
+        claimed = _claimed_user_id()
+        if claimed is not None and str(claimed) != str(user_id):
+            return jsonify({'error': 'user_id no coincide con la sesión'}), 403
+
+        g.user_id = user_id
+        with get_storage().user_scope(user_id):
+            return view(*args, **kwargs)
+    return wrapper
+
+
+def require_admin(view):
+    """Exige el header X-Admin-Token (ver ADMIN_TOKEN); 404 si no hay token configurado"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({'error': 'No encontrado'}), 404
+        token = request.headers.get('X-Admin-Token', '')
+        if not hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8')):
+            return jsonify({'error': 'Token de administración inválido'}), 403
+        return view(*args, **kwargs)
+    return wrapper
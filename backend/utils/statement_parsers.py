@@ -0,0 +1,333 @@
+"""Parsers de extractos bancarios (CSV / OFX / QIF)
+
+Cada parser es un generador que lee el archivo de a poco y produce
+diccionarios {date, description, amount, ref, error}. Nunca se carga el
+archivo completo en memoria.
+
+- date: 'YYYY-MM-DD'
+- amount: float con signo (negativo = gasto, positivo = ingreso)
+- ref: identificador único del banco si existe (FITID en OFX), si no None
+- error: motivo si la fila no se pudo normalizar, si no None
+"""
+import codecs
+import csv
+import io
+import itertools
+import re
+from datetime import datetime
+from typing import BinaryIO, Dict, Iterator, Optional
+
+SNIFF_BYTES = 64 * 1024
+READ_CHUNK = 64 * 1024
+# Texto máximo sin un tag completo en un OFX (más que esto no es OFX)
+MAX_OFX_PENDING = 1024 * 1024
+
+
+class StatementParseError(Exception):
+    """El archivo no tiene un formato reconocible"""
+    pass
+
+
+# ==================== NORMALIZACIÓN ====================
+
+_DATE_FORMATS_DAY_FIRST = ['%Y-%m-%d', '%Y%m%d', '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y',
+                           '%d/%m/%y', '%d-%m-%y', '%Y/%m/%d']
+_DATE_FORMATS_MONTH_FIRST = ['%Y-%m-%d', '%Y%m%d', '%m/%d/%Y', '%m-%d-%Y',
+                             '%m/%d/%y', '%m-%d-%y', '%Y/%m/%d']
+
+
+def parse_date(value: str, date_format: Optional[str] = None, day_first: bool = True) -> str:
+    """Normaliza una fecha a 'YYYY-MM-DD'"""
+    return DateParser(date_format, day_first)(value)
+
+
+class DateParser:
+    """
+    Normaliza fechas a 'YYYY-MM-DD'. Recuerda el último formato que
+    funcionó, ya que todas las filas de un extracto suelen compartirlo.
+    """
+
+    def __init__(self, date_format: Optional[str] = None, day_first: bool = True):
+        if date_format:
+            self.formats = [date_format]
+        else:
+            self.formats = list(_DATE_FORMATS_DAY_FIRST if day_first else _DATE_FORMATS_MONTH_FIRST)
+        self.strict = bool(date_format)
+
+    def __call__(self, value: str) -> str:
+        value = value.strip()
+        if not self.strict:
+            # OFX: 20240131 o 20240131120000[-3:ART]
+            if len(value) >= 8 and value[:8].isdigit():
+                return datetime.strptime(value[:8], '%Y%m%d').date().isoformat()
+            # QIF usa 1/31'24 para años 2000+
+            value = value.replace("'", '/').replace(' ', '')
+
+        for i, fmt in enumerate(self.formats):
+            try:
+                date = datetime.strptime(value, fmt).date().isoformat()
+            except ValueError:
+                continue
+            if i:
+                self.formats.insert(0, self.formats.pop(i))
+            return date
+        raise ValueError(f"Fecha no reconocida: {value!r}")
+
+
+def parse_amount(value: str) -> float:
+    """
+    Normaliza montos: '1.234,56', '1,234.56', '-12', '(12.00)', '$ 45,10'
+    """
+    value = value.strip()
+    negative = False
+    if value.startswith('(') and value.endswith(')'):
+        negative = True
+        value = value[1:-1]
+    value = re.sub(r'[^\d,.\-+]', '', value)
+    if value.endswith('-'):
+        negative = not negative
+        value = value[:-1]
+    if value.startswith('-'):
+        negative = not negative
+        value = value[1:]
+    value = value.lstrip('+')
+    if not value:
+        raise ValueError("Monto vacío")
+
+    # Con ambos separadores, el último es el decimal. Con uno solo, se toma
+    # como miles si se repite o si lo siguen exactamente 3 dígitos
+    last_comma, last_dot = value.rfind(','), value.rfind('.')
+    if last_comma != -1 and last_dot != -1:
+        if last_comma > last_dot:
+            value = value.replace('.', '').replace(',', '.')
+        else:
+            value = value.replace(',', '')
+    elif last_comma != -1 or last_dot != -1:
+        sep = ',' if last_comma != -1 else '.'
+        integer, _, decimals = value.rpartition(sep)
+        if value.count(sep) > 1 or (len(decimals) == 3 and integer.strip('0')):
+            value = value.replace(sep, '')
+        else:
+            value = value.replace(sep, '.')
+
+    amount = float(value)
+    return -amount if negative else amount
+
+
+# ==================== LECTURA DE TEXTO ====================
+
+def open_text(raw: BinaryIO) -> io.TextIOWrapper:
+    """
+    Envuelve el archivo binario en un lector de texto detectando la
+    codificación con los primeros bytes (UTF-8 o, si falla, Windows-1252).
+    """
+    buffered = raw if isinstance(raw, io.BufferedReader) else io.BufferedReader(raw)
+    sample = buffered.peek(SNIFF_BYTES)[:SNIFF_BYTES]
+    encoding = 'utf-8-sig'
+    try:
+        codecs.getincrementaldecoder('utf-8-sig')().decode(sample, final=False)
+    except UnicodeDecodeError:
+        encoding = 'cp1252'
+    return io.TextIOWrapper(buffered, encoding=encoding, errors='replace', newline='')
+
+
+def detect_format(filename: str, raw: BinaryIO) -> str:
+    """Formato por extensión o, si no, por contenido"""
+    name = (filename or '').lower()
+    for ext in ('csv', 'ofx', 'qfx', 'qif'):
+        if name.endswith('.' + ext):
+            return 'ofx' if ext == 'qfx' else ext
+
+    head = raw.peek(2048)[:2048].lstrip().upper() if hasattr(raw, 'peek') else b''
+    if head.startswith(b'OFXHEADER') or b'<OFX>' in head:
+        return 'ofx'
+    if head.startswith(b'!TYPE'):
+        return 'qif'
+    return 'csv'
+
+
+# ==================== CSV ====================
+
+_CSV_COLUMNS = {
+    'date': ['fecha', 'date', 'fecha operacion', 'fecha valor', 'posted date', 'transaction date'],
+    'description': ['descripcion', 'descripción', 'concepto', 'detalle', 'description',
+                    'memo', 'payee', 'referencia'],
+    'amount': ['monto', 'importe', 'amount', 'valor'],
+    'debit': ['debito', 'débito', 'debe', 'cargo', 'debit', 'withdrawal'],
+    'credit': ['credito', 'crédito', 'haber', 'abono', 'credit', 'deposit'],
+}
+
+
+def _map_header(header):
+    columns = {}
+    normalized = [h.strip().lower() for h in header]
+    for field, names in _CSV_COLUMNS.items():
+        for i, h in enumerate(normalized):
+            if h in names and field not in columns:
+                columns[field] = i
+    if 'date' not in columns or 'description' not in columns:
+        raise StatementParseError("CSV sin columnas de fecha y descripción")
+    if 'amount' not in columns and 'debit' not in columns and 'credit' not in columns:
+        raise StatementParseError("CSV sin columna de monto")
+    return columns
+
+
+def parse_csv(text: io.TextIOBase, date_format: Optional[str] = None,
+              day_first: bool = True) -> Iterator[Dict]:
+    """Filas de un CSV con encabezado (delimitador detectado automáticamente)"""
+    sample = text.read(SNIFF_BYTES)
+    if not sample.endswith('\n'):
+        sample += text.readline()
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t|')
+    except csv.Error:
+        dialect = csv.excel
+
+    # La muestra ya leída se encadena con el resto del stream
+    lines = itertools.chain(io.StringIO(sample, newline=''), text)
+    reader = csv.reader(lines, dialect)
+    header = next(reader, None)
+    if header is None:
+        return
+    columns = _map_header(header)
+    dates = DateParser(date_format, day_first)
+
+    for row in reader:
+        if not row or not any(cell.strip() for cell in row):
+            continue
+        yield _csv_record(row, columns, dates)
+
+
+def _csv_record(row, columns, dates):
+    def cell(field):
+        i = columns.get(field)
+        return row[i].strip() if i is not None and i < len(row) else ''
+
+    record = {'date': cell('date'), 'description': cell('description'), 'ref': None,
+              'amount': None, 'error': None}
+    try:
+        record['date'] = dates(record['date'])
+        if cell('amount'):
+            record['amount'] = parse_amount(cell('amount'))
+        else:
+            debit, credit = cell('debit'), cell('credit')
+            if debit:
+                record['amount'] = -abs(parse_amount(debit))
+            elif credit:
+                record['amount'] = abs(parse_amount(credit))
+            else:
+                raise ValueError("Fila sin monto")
+    except ValueError as e:
+        record['error'] = str(e)
+    return record
+
+
+# ==================== OFX ====================
+
+_OFX_TAG = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<]*)')
+
+
+def _ofx_tokens(text: io.TextIOBase) -> Iterator:
+    """Tokens (cierre, tag, valor) leyendo el archivo en bloques"""
+    tail = ''
+    while True:
+        chunk = text.read(READ_CHUNK)
+        if not chunk:
+            break
+        data = tail + chunk
+        cut = data.rfind('<')
+        if cut <= 0:
+            tail = data
+        else:
+            for m in _OFX_TAG.finditer(data, 0, cut):
+                yield m.group(1) == '/', m.group(2).upper(), m.group(3).strip()
+            tail = data[cut:]
+        if len(tail) > MAX_OFX_PENDING:
+            raise StatementParseError("El archivo no parece OFX (texto sin tags)")
+    for m in _OFX_TAG.finditer(tail):
+        yield m.group(1) == '/', m.group(2).upper(), m.group(3).strip()
+
+
+def parse_ofx(text: io.TextIOBase, date_format: Optional[str] = None,
+              day_first: bool = True) -> Iterator[Dict]:
+    """Movimientos <STMTTRN> de un OFX/QFX (SGML v1 o XML v2)"""
+    current = None
+    dates = DateParser(date_format, day_first)
+    for closing, tag, value in _ofx_tokens(text):
+        if tag == 'STMTTRN':
+            if current is not None:
+                yield _ofx_record(current, dates)
+            current = None if closing else {}
+        elif current is not None and not closing:
+            current[tag] = value
+    if current is not None:
+        yield _ofx_record(current, dates)
+
+
+def _ofx_record(fields, dates):
+    description = fields.get('NAME') or fields.get('MEMO') or fields.get('PAYEE') or ''
+    memo = fields.get('MEMO')
+    if memo and fields.get('NAME') and memo != fields['NAME']:
+        description = f"{fields['NAME']} {memo}"
+    record = {'date': fields.get('DTPOSTED', ''), 'description': description,
+              'amount': None, 'ref': fields.get('FITID') or None, 'error': None}
+    try:
+        record['date'] = dates(record['date'])
+        record['amount'] = parse_amount(fields.get('TRNAMT', ''))
+    except ValueError as e:
+        record['error'] = str(e)
+    return record
+
+
+# ==================== QIF ====================
+
+def parse_qif(text: io.TextIOBase, date_format: Optional[str] = None,
+              day_first: bool = False) -> Iterator[Dict]:
+    """Registros de un QIF (terminados en '^'); fechas mes/día por defecto"""
+    fields = {}
+    dates = DateParser(date_format, day_first)
+    for line in text:
+        line = line.rstrip('\r\n')
+        if not line or line.startswith('!'):
+            continue
+        code, value = line[0], line[1:].strip()
+        if code == '^':
+            if fields:
+                yield _qif_record(fields, dates)
+            fields = {}
+        elif code in 'DTUPM' and code not in fields:
+            fields[code] = value
+    if fields:
+        yield _qif_record(fields, dates)
+
+
+def _qif_record(fields, dates):
+    description = fields.get('P') or fields.get('M') or ''
+    # N es el número de cheque o referencia: se repite entre movimientos y
+    # algunos bancos ponen un valor fijo, así que no sirve como id (ref)
+    record = {'date': fields.get('D', ''), 'description': description,
+              'amount': None, 'ref': None, 'error': None}
+    try:
+        record['date'] = dates(record['date'])
+        record['amount'] = parse_amount(fields.get('T') or fields.get('U') or '')
+    except ValueError as e:
+        record['error'] = str(e)
+    return record
+
+
+PARSERS = {
+    'csv': parse_csv,
+    'ofx': parse_ofx,
+    'qif': parse_qif,
+}
+
+
+def parse_statement(raw: BinaryIO, fmt: str, date_format: Optional[str] = None,
+                    day_first: Optional[bool] = None) -> Iterator[Dict]:
+    """Generador de movimientos para el formato indicado"""
+    if fmt not in PARSERS:
+        raise StatementParseError(f"Formato no soportado: {fmt}")
+    kwargs = {'date_format': date_format}
+    if day_first is not None:
+        kwargs['day_first'] = day_first
+    return PARSERS[fmt](open_text(raw), **kwargs)
@@ -0,0 +1,71 @@
+"""Serialización incremental de listados grandes
+
+Convierte lotes de filas (ver Storage.iter_batches en db/storage.py) en bloques de bytes
+para una respuesta en streaming: un array JSON escrito por partes o NDJSON
+(un objeto por línea). La memoria por request queda acotada por el tamaño
+del lote, no por el historial del usuario.
+"""
+import json
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from flask import Response
+
+from db.models import LIST_COLUMNS, Transaction
+from db.storage import get_storage
+from utils.http_cache import versioned_stream
+from utils.validators import ValidationError
+
+STREAM_FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+_encode = json.JSONEncoder(separators=(',', ':')).encode
+
+
+def _rows_json(rows: List[Tuple], columns: Sequence[str]) -> str:
+    """Objetos del lote separados por coma (sin los corchetes)"""
+    return _encode([dict(zip(columns, row)) for row in rows])[1:-1]
+
+
+def json_array_chunks(batches: Iterable[List[Tuple]],
+                      columns: Sequence[str] = LIST_COLUMNS) -> Iterator[bytes]:
+    """'[' + objetos separados por coma + ']', un bloque por lote"""
+    yield b'['
+    separator = ''
+    for rows in batches:
+        yield (separator + _rows_json(rows, columns)).encode('utf-8')
+        separator = ','
+    yield b']'
+
+
+def ndjson_chunks(batches: Iterable[List[Tuple]],
+                  columns: Sequence[str] = LIST_COLUMNS) -> Iterator[bytes]:
+    """Un objeto JSON por línea, un bloque por lote"""
+    for rows in batches:
+        lines = [_encode(dict(zip(columns, row))) for row in rows]
+        lines.append('')
+        yield '\n'.join(lines).encode('utf-8')
+
+
+def stream_chunks(fmt: str, batches: Iterable[List[Tuple]]) -> Iterator[bytes]:
+    if fmt == 'ndjson':
+        return ndjson_chunks(batches)
+    return json_array_chunks(batches)
+
+
+def stream_transactions(user_id: int, fmt: str, cursor: Optional[str],
+                        filters: Dict[str, Any]) -> Response:
+    """Listado completo (desde `cursor`, con filtros) en streaming"""
+    if cursor is not None:
+        try:
+            Transaction.decode_cursor(cursor)
+        except ValueError as e:
+            # Validar antes de empezar: después del primer byte ya no hay 400
+            raise ValidationError(str(e))
+
+    def generate():
+        return stream_chunks(fmt, get_storage().iter_batches(user_id, cursor, filters))
+
+    params = (fmt, cursor, tuple(sorted(filters.items())))
+    return versioned_stream(user_id, 'transactions-stream', params, generate, STREAM_FORMATS[fmt])
@@ -1,5 +1,11 @@
 """Validaciones y sanitización de entradas"""
 import re
+from datetime import date, datetime, timedelta
+from utils.money import to_cents
+from utils.rule_matcher import compile_user_regex
+
+# Monto máximo por transacción (1.000.000,00)
+MAX_AMOUNT_CENTS = 100_000_000
 
 class ValidationError(Exception):
     pass
@@ -36,17 +42,266 @@ def validate_password(password):
     return password
 
 def validate_amount(amount):
-    """Valida monto: número, no cero"""
-    try:
-        amount = float(amount)
-        if amount == 0:
-            raise ValidationError("Monto no puede ser cero")
-        if abs(amount) > 1000000:
-            raise ValidationError("Monto muy grande")
-        return round(amount, 2)
+    """Valida monto: número, no cero. Retorna centavos (int)"""
+    try:
+        cents = to_cents(amount)
     except (ValueError, TypeError):
         raise ValidationError("Monto debe ser número")
+    if cents == 0:
+        raise ValidationError("Monto no puede ser cero")
+    if abs(cents) > MAX_AMOUNT_CENTS:
+        raise ValidationError("Monto muy grande")
+    return cents
 
 def validate_description(description):
     """Valida descripción"""
     return sanitize_string(description, 500)
+
+def validate_user_id(user_id):
+    """Valida user_id: entero positivo"""
+    try:
+        user_id = int(user_id)
+    except (ValueError, TypeError):
+        raise ValidationError("user_id debe ser número entero")
+    if user_id <= 0:
+        raise ValidationError("user_id inválido")
+    return user_id
+
+def validate_transaction_id(trans_id):
+    """Valida id de transacción: entero positivo"""
+    try:
+        trans_id = int(trans_id)
+    except (ValueError, TypeError):
+        raise ValidationError("id de transacción debe ser número entero")
+    if trans_id <= 0:
+        raise ValidationError("id de transacción inválido")
+    return trans_id
+
+def validate_created_at(value):
+    """Valida fecha ISO 8601; retorna formato de created_at (hora local, sin zona)"""
+    if not isinstance(value, str):
+        raise ValidationError("Fecha debe ser texto ISO 8601")
+    try:
+        date = datetime.fromisoformat(value.strip())
+    except ValueError:
+        raise ValidationError("Fecha inválida (formato ISO 8601)")
+    if date.tzinfo is not None:
+        date = date.astimezone().replace(tzinfo=None)
+    return date.isoformat()
+
+def _parse_filter_date(value, field_name, end=False):
+    """Fecha de filtro: YYYY-MM-DD o ISO 8601. Con end=True, una fecha sin hora
+    incluye el día completo (límite exclusivo al día siguiente)"""
+    value = value.strip()
+    try:
+        date = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValidationError(f"{field_name} inválido (formato YYYY-MM-DD)")
+    if date.tzinfo is not None:
+        date = date.astimezone().replace(tzinfo=None)
+    if end and len(value) == 10:
+        date += timedelta(days=1)
+    return date.isoformat()
+
+def _parse_filter_amount(value, field_name):
+    try:
+        # Se convierte a centavos al consultar: validarlo ya, no a mitad de un streaming
+        to_cents(value)
+        return float(value)
+    except (ValueError, TypeError):
+        raise ValidationError(f"{field_name} debe ser número")
+
+def _parse_page_params(args, default_limit, max_limit):
+    try:
+        limit = int(args.get('limit', default_limit))
+    except (ValueError, TypeError):
+        raise ValidationError("limit debe ser número entero")
+    if limit < 1 or limit > max_limit:
+        raise ValidationError(f"limit debe estar entre 1 y {max_limit}")
+    
+    cursor = args.get('cursor') or None
+    if cursor is not None and (len(cursor) > 200 or not re.match(r'^[A-Za-z0-9_-]+$', cursor)):
+        raise ValidationError("Cursor inválido")
+    return limit, cursor
+
+def validate_list_params(args, default_limit=50, max_limit=500):
+    """
+    Valida parámetros del listado: limit, cursor, from, to, category, type,
+    min_amount, max_amount. Retorna (limit, cursor, filters).
+    """
+    limit, cursor = _parse_page_params(args, default_limit, max_limit)
+    
+    filters = {}
+    if args.get('from'):
+        filters['date_from'] = _parse_filter_date(args['from'], 'from')
+    if args.get('to'):
+        filters['date_to'] = _parse_filter_date(args['to'], 'to', end=True)
+    if args.get('category'):
+        filters['category'] = sanitize_string(args['category'], 50)
+    if args.get('type'):
+        if args['type'] not in ('income', 'expense'):
+            raise ValidationError("type debe ser income o expense")
+        filters['type'] = args['type']
+    if args.get('min_amount'):
+        filters['min_amount'] = _parse_filter_amount(args['min_amount'], 'min_amount')
+    if args.get('max_amount'):
+        filters['max_amount'] = _parse_filter_amount(args['max_amount'], 'max_amount')
+    
+    return limit, cursor, filters
+
+def validate_search_params(args, default_limit=50, max_limit=500):
+    """Valida q, limit y cursor de la búsqueda. Retorna (q, limit, cursor)"""
+    q = (args.get('q') or '').strip()
+    if not q:
+        raise ValidationError("q es requerido")
+    if len(q) > 100:
+        raise ValidationError("q muy largo (máximo 100 caracteres)")
+    limit, cursor = _parse_page_params(args, default_limit, max_limit)
+    return q, limit, cursor
+
+def validate_stream_format(args):
+    """Formato de streaming pedido en ?stream= (json|ndjson) o None"""
+    fmt = args.get('stream') or None
+    if fmt is not None and fmt not in ('json', 'ndjson'):
+        raise ValidationError("stream debe ser json o ndjson")
+    return fmt
+
+def validate_export_params(args):
+    """
+    Valida parámetros de la exportación: format (csv|ndjson) y los mismos
+    filtros del listado (from, to, category, ...). Retorna (format, filters).
+    """
+    fmt = args.get('format', 'csv')
+    if fmt not in ('csv', 'ndjson'):
+        raise ValidationError("format debe ser csv o ndjson")
+    _, _, filters = validate_list_params(args)
+    return fmt, filters
+
+TIMESERIES_GRANULARITIES = ('day', 'week', 'month')
+
+def validate_timeseries_params(args, max_buckets=1000):
+    """
+    Valida parámetros de la serie temporal: granularity (day|week|month),
+    from, to (YYYY-MM-DD) y compare. Retorna (granularity, from, to, compare).
+    """
+    granularity = args.get('granularity', 'month')
+    if granularity not in TIMESERIES_GRANULARITIES:
+        raise ValidationError("granularity debe ser day, week o month")
+    
+    def parse_day(value, field_name):
+        try:
+            return date.fromisoformat(value.strip()[:10])
+        except ValueError:
+            raise ValidationError(f"{field_name} inválido (formato YYYY-MM-DD)")
+    
+    date_to = parse_day(args['to'], 'to') if args.get('to') else date.today()
+    if args.get('from'):
+        date_from = parse_day(args['from'], 'from')
+    elif granularity == 'day':
+        date_from = date_to - timedelta(days=29)
+    elif granularity == 'week':
+        date_from = date_to - timedelta(weeks=11)
+    else:
+        months = date_to.year * 12 + date_to.month - 1 - 11
+        date_from = date(months // 12, months % 12 + 1, 1)
+    
+    if date_from > date_to:
+        raise ValidationError("from debe ser anterior a to")
+    
+    span_days = (date_to - date_from).days
+    if granularity == 'day':
+        buckets = span_days + 1
+    elif granularity == 'week':
+        buckets = span_days // 7 + 2
+    else:
+        buckets = (date_to.year - date_from.year) * 12 + date_to.month - date_from.month + 1
+    if buckets > max_buckets:
+        raise ValidationError(f"Rango demasiado amplio (máx {max_buckets} períodos)")
+    
+    compare = str(args.get('compare', '')).lower() in ('1', 'true', 'yes')
+    return granularity, date_from, date_to, compare
+
+def validate_month(value, field_name='month'):
+    """Valida mes YYYY-MM"""
+    if not isinstance(value, str) or not re.match(r'^\d{4}-(0[1-9]|1[0-2])$', value.strip()):
+        raise ValidationError(f"{field_name} inválido (formato YYYY-MM)")
+    return value.strip()
+
+def validate_budget(data, categories):
+    """
+    Valida un presupuesto: category (una de `categories`), month (YYYY-MM,
+    por defecto el actual) y limit (> 0). Retorna (category, month, limit_cents).
+    """
+    category = sanitize_string(data.get('category', ''), 50)
+    if category not in categories:
+        raise ValidationError(f"category debe ser una de: {', '.join(categories)}")
+    month = validate_month(data['month']) if data.get('month') else date.today().strftime('%Y-%m')
+    limit_cents = validate_amount(data.get('limit'))
+    if limit_cents < 0:
+        raise ValidationError("limit debe ser positivo")
+    return category, month, limit_cents
+
+def validate_category(data, categories):
+    """Valida la categoría de una corrección (una de `categories`)"""
+    category = sanitize_string(data.get('category', ''), 50)
+    if category not in categories:
+        raise ValidationError(f"category debe ser una de: {', '.join(categories)}")
+    return category
+
+def validate_user_rule(data, categories, income_categories=()):
+    """
+    Valida una regla de categorización: match (contains|regex|amount),
+    pattern (salvo amount), min_amount/max_amount opcionales (en valor
+    absoluto), category (una de `categories`), type (income|expense; por
+    defecto el de la categoría) y priority (menor se evalúa primero).
+    Retorna el dict para UserRule.
+    """
+    match = data.get('match')
+    if match not in ('contains', 'regex', 'amount'):
+        raise ValidationError("match debe ser contains, regex o amount")
+    pattern = None
+    if match != 'amount':
+        pattern = sanitize_string(data.get('pattern', ''), 200)
+        if match == 'regex':
+            try:
+                compile_user_regex(pattern)
+            except ValueError as e:
+                raise ValidationError(str(e))
+
+    bounds = []
+    for field in ('min_amount', 'max_amount'):
+        if data.get(field) is None:
+            bounds.append(None)
+            continue
+        bounds.append(abs(validate_amount(data[field])))
+    if bounds[0] is not None and bounds[1] is not None and bounds[0] > bounds[1]:
+        raise ValidationError("min_amount no puede ser mayor que max_amount")
+    if match == 'amount' and bounds == [None, None]:
+        raise ValidationError("Una regla amount necesita min_amount o max_amount")
+
+    category = sanitize_string(data.get('category', ''), 50)
+    if category not in categories:
+        raise ValidationError(f"category debe ser una de: {', '.join(categories)}")
+    trans_type = data.get('type') or ('income' if category in income_categories else 'expense')
+    if trans_type not in ('income', 'expense'):
+        raise ValidationError("type debe ser income o expense")
+    priority = data.get('priority', 100)
+    if not isinstance(priority, int) or isinstance(priority, bool) or not 0 <= priority <= 10_000:
+        raise ValidationError("priority debe ser un entero entre 0 y 10000")
+
+    return {'match': match, 'pattern': pattern, 'min_amount_cents': bounds[0],
+            'max_amount_cents': bounds[1], 'category': category, 'type': trans_type,
+            'priority': priority}
+
+def validate_alert_params(args, default_limit=50, max_limit=500):
+    """Valida after (último id visto) y limit del sondeo de alertas. Retorna (after, limit)"""
+    try:
+        after = int(args.get('after', 0))
+        limit = int(args.get('limit', default_limit))
+    except (ValueError, TypeError):
+        raise ValidationError("after y limit deben ser números enteros")
+    if after < 0:
+        raise ValidationError("after no puede ser negativo")
+    if limit < 1 or limit > max_limit:
+        raise ValidationError(f"limit debe estar entre 1 y {max_limit}")
+    return after, limit
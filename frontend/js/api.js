@@ -21,6 +21,12 @@ const API = {
             timeout: this.timeout
         };
         
+        // Token de sesión guardado al hacer login
+        const user = SecureStorage.get('user');
+        if (user && user.token) {
+            options.headers['Authorization'] = `Bearer ${user.token}`;
+        }
+        
         if (data) {
             options.body = JSON.stringify(data);
         }
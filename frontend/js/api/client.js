@@ -23,6 +23,12 @@ async function apiRequest(endpoint, method = 'GET', data = null) {
             credentials: 'include'
         };
         
+        // Token de sesión guardado al hacer login
+        const user = JSON.parse(sessionStorage.getItem('user') || 'null');
+        if (user && user.token) {
+            options.headers['Authorization'] = `Bearer ${user.token}`;
+        }
+        
         if (data) {
             options.body = JSON.stringify(data);
         }